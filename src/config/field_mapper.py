@@ -111,6 +111,33 @@ class FieldMapper:
         
         return member_data.get(api_field, "")
     
+    def member_select_fields(self) -> List[str]:
+        """Graph API fields to request for group members: the fields every recipient needs plus the mapped ones
+
+        Fields that are only listed as available are not requested, so $select (and the member
+        cache) stay as small as the current template mappings allow.
+        """
+        members = self.config["mappings"]["members"]
+        # jobTitle / department are always copied into member recipients (job_title / department)
+        fields = ["id", "displayName", "mail", "userPrincipalName", "jobTitle", "department"]
+        for field in members.get("field_mappings", {}).values():
+            if not field.startswith("_") and field not in fields:
+                fields.append(field)
+        return fields
+    
+    def member_field_values(self, member_data: Dict) -> Dict:
+        """Template variable values of a fetched member, for mapped fields that have a value"""
+        result = {}
+        for template_var, api_field in self.config["mappings"]["members"]["field_mappings"].items():
+            if api_field.startswith("_"):
+                continue
+            value = member_data.get(api_field)
+            if isinstance(value, list):
+                value = ", ".join(str(v) for v in value)
+            if value not in (None, ""):
+                result[template_var] = value
+        return result
+    
     def get_template_variables_for_source(self, source: str) -> List[str]:
         """Get template variables available for a specific data source"""
         if source == "excel":
@@ -0,0 +1,80 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Pragmatic RFC 5322 subset: dot-atom local part and a dotted domain with an alphabetic TLD
+EMAIL_PATTERN = (
+    r"^[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,}$"
+)
+# Several addresses in one cell may be separated by , ; (full or half width) or line breaks.
+# Spaces are not separators: they belong to display names such as "张三 <zs@example.com>".
+SEPARATOR_PATTERN = r"[,;，；\r\n]+"
+# The address inside a "Display Name <address>" entry
+ANGLE_ADDRESS_PATTERN = r"<\s*([^<>]*?)\s*>"
+
+REASON_EMPTY = "邮箱为空"
+REASON_INVALID = "格式无效"
+REASON_DUPLICATE = "重复地址"
+
+
+def prepare_recipients(df, email_col) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """发送前对邮箱列做整列规范化、校验和去重
+
+    一个单元格中的多个地址会拆分为多行 (其余列复制)；"姓名 <地址>" 形式只取尖括号内的地址，
+    地址去除空白、域名转为小写。
+    返回 (可发送的收件人, 被拒绝的记录)。可发送的收件人按原顺序排列、索引重置，
+    被拒绝的记录包含 行号 (源数据中的第几行)、原始值、地址 和 原因 四列。
+    """
+    text_dtype = "string[pyarrow]" if HAS_PYARROW else object
+    raw = pd.Series(df[email_col].to_numpy(), index=np.arange(len(df)), dtype=text_dtype)
+    raw = raw.fillna('').astype(str) if text_dtype is object else raw.fillna('')
+    stripped = raw.str.strip()
+
+    # Only cells that actually hold several addresses go through split/explode
+    multi = stripped.str.contains(SEPARATOR_PATTERN, regex=True).fillna(False).to_numpy(dtype=bool)
+    addresses = stripped
+    if multi.any():
+        exploded = stripped[multi].str.split(SEPARATOR_PATTERN, regex=True).explode().astype(text_dtype).str.strip()
+        addresses = pd.concat([stripped[~multi], exploded]).sort_index(kind="stable")
+    addresses = addresses[addresses.notna() & (addresses != '')]
+    named = addresses.str.contains('<', regex=False).fillna(False).to_numpy(dtype=bool)
+    if named.any():
+        angle = addresses[named].str.extract(ANGLE_ADDRESS_PATTERN, expand=False)
+        addresses = addresses.copy()
+        addresses[named] = angle.where(angle.notna(), addresses[named])
+
+    # Lower-case the domain part only; the local part is kept as entered
+    has_at = addresses.str.contains('@', regex=False).fillna(False).to_numpy(dtype=bool)
+    local = addresses.str.replace(r'@[^@]*$', '', regex=True)
+    domain = addresses.str.replace(r'^.*@', '', regex=True).str.lower()
+    normalized = addresses.where(~has_at, local + '@' + domain)
+    valid = normalized.str.match(EMAIL_PATTERN).fillna(False).to_numpy(dtype=bool)
+    duplicate = valid & normalized.str.lower().duplicated().to_numpy()
+    accepted = valid & ~duplicate
+
+    clean = df.iloc[normalized.index[accepted]].copy()
+    clean[email_col] = normalized[accepted].astype(str).to_numpy()
+    clean = clean.reset_index(drop=True)
+
+    present = np.zeros(len(df), dtype=bool)
+    present[addresses.index.to_numpy()] = True
+    empty_rows = np.flatnonzero(~present)
+    rejected = [
+        pd.DataFrame({"行号": empty_rows + 1, "原始值": raw.iloc[empty_rows].astype(str).to_numpy(), "地址": "", "原因": REASON_EMPTY}),
+        pd.DataFrame({
+            "行号": normalized.index[~accepted] + 1,
+            "原始值": raw.loc[normalized.index[~accepted]].astype(str).to_numpy(),
+            "地址": normalized[~accepted].astype(str).to_numpy(),
+            "原因": np.where(valid[~accepted], REASON_DUPLICATE, REASON_INVALID),
+        }),
+    ]
+    rejects = pd.concat(rejected, ignore_index=True).sort_values("行号", kind="stable").reset_index(drop=True)
+    return clean, rejects
@@ -0,0 +1,50 @@
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Columns whose distinct/total ratio is at or below this are stored as categoricals
+CATEGORY_RATIO = 0.5
+
+
+def frame_memory(df) -> int:
+    """返回 DataFrame 实际占用的内存字节数"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def compact_frame(df, category_ratio=CATEGORY_RATIO) -> pd.DataFrame:
+    """将字符串列转换为紧凑存储
+
+    低基数列 (如部门、分组、地区) 转为 category，其余列在 pyarrow 可用时
+    转为 Arrow 字符串，否则保持原样。单元格取值仍然是普通 str，
+    筛选 (.str 访问器)、预览和模板渲染无需修改。
+    """
+    rows = len(df)
+    if rows == 0:
+        return df
+    converted = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        if series.nunique(dropna=False) / rows <= category_ratio:
+            converted[col] = series.astype("category")
+        elif HAS_PYARROW:
+            converted[col] = series.astype("string[pyarrow]")
+    if not converted:
+        return df
+    result = df.copy(deep=False)
+    for col, series in converted.items():
+        result[col] = series
+    return result
+
+
+def format_bytes(size) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
@@ -0,0 +1,112 @@
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Number of recent filter strings remembered per column
+HIT_CACHE_SIZE = 32
+
+
+class ColumnIndex:
+    """单列的小写去重索引
+
+    codes 把每一行映射到去重后取值的位置，匹配只需在去重值上进行，
+    再通过 codes 展开为整列的布尔掩码。最近的匹配结果会被缓存，
+    当新的筛选字符串包含旧字符串时 (例如继续输入)，只在旧结果中继续缩小范围。
+    """
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series, sort=False)
+        self.codes = codes
+        self.uniques_lower = np.array([str(v).lower() for v in uniques], dtype=object)
+        self._hits = {}
+
+    def _candidates(self, needle):
+        best = None
+        for cached_needle, hits in self._hits.items():
+            if cached_needle in needle and (best is None or len(hits) < len(best)):
+                best = hits
+        if best is None:
+            return np.arange(len(self.uniques_lower))
+        return best
+
+    def unique_hits(self, needle) -> np.ndarray:
+        """返回包含 needle 的去重值下标"""
+        if needle in self._hits:
+            return self._hits[needle]
+        candidates = self._candidates(needle)
+        values = self.uniques_lower[candidates]
+        hits = candidates[np.fromiter((needle in v for v in values), dtype=bool, count=len(values))]
+        if len(self._hits) >= HIT_CACHE_SIZE:
+            self._hits.pop(next(iter(self._hits)))
+        self._hits[needle] = hits
+        return hits
+
+    def mask(self, needle) -> np.ndarray:
+        # One extra False slot so that missing values (code -1) never match
+        flags = np.zeros(len(self.uniques_lower) + 1, dtype=bool)
+        flags[self.unique_hits(needle)] = True
+        return flags[self.codes]
+
+
+class FilterEngine:
+    """基于列索引的“包含文本”筛选 (不区分大小写)
+
+    每个工作表创建一个实例，列索引在首次用到该列时建立并一直复用。
+    返回布尔掩码或行位置，只有在确实需要时才生成筛选后的 DataFrame。
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._indexes = {}
+        self._expression_masks = {}
+
+    def column_index(self, col) -> ColumnIndex:
+        if col not in self._indexes:
+            self._indexes[col] = ColumnIndex(self.df[col])
+        return self._indexes[col]
+
+    def expression_mask(self, expression) -> np.ndarray:
+        """计算已编译筛选表达式 (CompiledFilter) 的掩码，按表达式文本缓存"""
+        if expression.text not in self._expression_masks:
+            if len(self._expression_masks) >= HIT_CACHE_SIZE:
+                self._expression_masks.pop(next(iter(self._expression_masks)))
+            self._expression_masks[expression.text] = expression.mask(self.df)
+        return self._expression_masks[expression.text]
+
+    def mask(self, conditions: Iterable[Tuple[str, str]], expression=None) -> Optional[np.ndarray]:
+        """按 (列名, 文本) 条件和可选的筛选表达式计算布尔掩码，无有效条件时返回 None"""
+        result = None
+        for col, text in conditions:
+            if col not in self.df.columns or not text:
+                continue
+            col_mask = self.column_index(col).mask(text.lower())
+            result = col_mask if result is None else result & col_mask
+        if expression is not None:
+            expr_mask = self.expression_mask(expression)
+            result = expr_mask if result is None else result & expr_mask
+        return result
+
+    def count(self, conditions, expression=None) -> int:
+        mask = self.mask(conditions, expression)
+        return len(self.df) if mask is None else int(mask.sum())
+
+    def first_row(self, conditions, expression=None) -> Optional[pd.Series]:
+        """返回第一条满足条件的记录，没有时返回 None"""
+        mask = self.mask(conditions, expression)
+        if mask is None:
+            return self.df.iloc[0] if len(self.df) else None
+        positions = np.flatnonzero(mask)
+        return self.df.iloc[positions[0]] if len(positions) else None
+
+    def summary(self, conditions, expression=None) -> Tuple[int, Optional[pd.Series]]:
+        """一次计算掩码，同时返回匹配行数和第一条匹配记录 (用于计数标签和预览)"""
+        mask = self.mask(conditions, expression)
+        if mask is None:
+            return len(self.df), (self.df.iloc[0] if len(self.df) else None)
+        positions = np.flatnonzero(mask)
+        return len(positions), (self.df.iloc[positions[0]] if len(positions) else None)
+
+    def filter(self, conditions, expression=None) -> pd.DataFrame:
+        mask = self.mask(conditions, expression)
+        return self.df if mask is None else self.df[mask]
@@ -0,0 +1,407 @@
+"""
+收件人筛选表达式
+
+表达式只编译一次，求值时转换为对整列的向量化掩码运算，可在界面和无界面脚本中复用。
+
+语法示例::
+
+    部门 = 销售 and (年龄 >= 30 or 城市 in ("北京", "上海"))
+    not 邮箱 ~ "@test\\." and 入职日期 between 2023-01-01 and 2023-12-31
+    [所在 部门] contains 研发 or `备注` != ""
+
+支持的运算：
+    = / ==  !=      等于 / 不等于 (不区分大小写；数字按数值、日期按日历日比较)
+    ~  !~          正则匹配 / 不匹配 (不区分大小写)
+    contains       包含文本 (可写作 not contains)
+    > >= < <=      数值或日期 (YYYY-MM-DD) 比较，其他按文本比较
+    between A and B  闭区间范围
+    in (A, B, ...)   在列表中 (可写作 not in，数字和日期的比较方式同 =)
+    and / or / not   也可写作 && / || / !，或 且 / 或 / 非
+列名中含空格或运算符时用 [列名] 或 `列名` 括起来，含空格的值用引号括起来。
+"""
+
+import re
+import sys
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<lpar>\() | (?P<rpar>\)) | (?P<comma>,) |
+        (?P<op>==|!=|>=|<=|!~|&&|\|\||=|>|<|~|!) |
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*') |
+        (?P<quoted>`[^`]*`|\[[^\]]*\]) |
+        (?P<number>-?\d+(?:\.\d+)?(?![^\s(),=!<>~'"`&|\[\]])) |
+        (?P<word>[^\s(),=!<>~'"`&|\[\]]+)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {
+    "and": "and", "&&": "and", "且": "and",
+    "or": "or", "||": "or", "或": "or",
+    "not": "not", "!": "not", "非": "not",
+    "in": "in", "between": "between", "介于": "between",
+    "contains": "contains", "包含": "contains",
+}
+_COMPARISON_OPS = {"=", "==", "!=", "~", "!~", ">", ">=", "<", "<="}
+_DATE_RE = re.compile(r"^\d{4}[-/.]\d{1,2}[-/.]\d{1,2}")
+
+
+class FilterSyntaxError(ValueError):
+    """筛选表达式语法错误"""
+
+    def __init__(self, message, position=None):
+        if position is not None:
+            message = f"{message} (位置 {position + 1})"
+        super().__init__(message)
+        self.position = position
+
+
+class _Token:
+    __slots__ = ("kind", "value", "pos")
+
+    def __init__(self, kind, value, pos):
+        self.kind, self.value, self.pos = kind, value, pos
+
+
+def _tokenize(text) -> List[_Token]:
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise FilterSyntaxError(f"无法识别的字符 '{text[pos:].strip()[:1]}'", pos)
+        kind = match.lastgroup
+        raw = match.group(kind)
+        start = match.start(kind)
+        if kind == "string":
+            tokens.append(_Token("value", re.sub(r"\\(.)", r"\1", raw[1:-1]), start))
+        elif kind == "quoted":
+            tokens.append(_Token("name", raw[1:-1], start))
+        elif kind == "number":
+            tokens.append(_Token("number", raw, start))
+        elif kind in ("op", "word") and raw.lower() in _KEYWORDS:
+            tokens.append(_Token("keyword", _KEYWORDS[raw.lower()], start))
+        elif kind == "word":
+            tokens.append(_Token("name", raw, start))
+        else:
+            tokens.append(_Token(kind, raw, start))
+        pos = match.end()
+    return tokens
+
+
+class _Literal:
+    """比较值：同时保留文本、数值和日期形式"""
+
+    def __init__(self, token):
+        self.text = token.value
+        self.number = float(token.value) if token.kind == "number" else None
+        self.date = None
+        if self.number is None and _DATE_RE.match(self.text):
+            try:
+                self.date = pd.Timestamp(self.text)
+            except ValueError:
+                pass
+
+    @property
+    def key(self):
+        # Text used for equality / membership; "30.0" and "30" compare equal
+        if self.number is not None and self.number.is_integer():
+            return str(int(self.number))
+        return self.text.strip().lower()
+
+
+class _Context:
+    """一次求值过程中缓存的列转换结果"""
+
+    def __init__(self, df):
+        self.df = df
+        self._cache = {}
+
+    def _column(self, name):
+        if name not in self.df.columns:
+            raise KeyError(f"列不存在: {name}")
+        return self.df[name]
+
+    def text(self, name):
+        key = ("text", name)
+        if key not in self._cache:
+            self._cache[key] = self._column(name).astype(str).str.strip().str.lower()
+        return self._cache[key]
+
+    def number(self, name):
+        key = ("number", name)
+        if key not in self._cache:
+            self._cache[key] = pd.to_numeric(self._column(name).astype(str).str.strip(), errors="coerce")
+        return self._cache[key]
+
+    def date(self, name):
+        key = ("date", name)
+        if key not in self._cache:
+            # Cells of one column often mix formats (2023-01-05, 2023/1/5, 2023-01-05 09:30)
+            self._cache[key] = pd.to_datetime(self._column(name).astype(str).str.strip(), errors="coerce", format="mixed")
+        return self._cache[key]
+
+    def day(self, name):
+        key = ("day", name)
+        if key not in self._cache:
+            self._cache[key] = self.date(name).dt.normalize()
+        return self._cache[key]
+
+
+def _as_mask(series) -> np.ndarray:
+    return series.fillna(False).to_numpy(dtype=bool)
+
+
+def _ordered_values(ctx, column, literals):
+    """选择数值、日期或文本比较，返回 (列, 比较值列表)"""
+    if all(lit.number is not None for lit in literals):
+        return ctx.number(column), [lit.number for lit in literals]
+    if all(lit.date is not None for lit in literals):
+        dates = [lit.date for lit in literals]
+        # Plain dates compare by calendar day, so "between A and B" includes all of day B
+        if all(date == date.normalize() for date in dates):
+            return ctx.day(column), dates
+        return ctx.date(column), dates
+    return ctx.text(column), [lit.text.strip().lower() for lit in literals]
+
+
+def _date_matches(ctx, column, dates) -> np.ndarray:
+    """日期相等：不带时间的字面量匹配当天任意时刻，带时间的须完全一致"""
+    days = {date for date in dates if date == date.normalize()}
+    moments = set(dates) - days
+    mask = np.zeros(len(ctx.df), dtype=bool)
+    if days:
+        mask |= _as_mask(ctx.day(column).isin(days))
+    if moments:
+        mask |= _as_mask(ctx.date(column).isin(moments))
+    return mask
+
+
+def _compile_comparison(column, op, literals, negate=False) -> Callable:
+    if op in ("=", "=="):
+        lit = literals[0]
+        if lit.number is not None:
+            evaluate = lambda ctx: _as_mask(ctx.number(column) == lit.number)
+        elif lit.date is not None:
+            evaluate = lambda ctx: (ctx.text(column).to_numpy() == lit.key) | _date_matches(ctx, column, [lit.date])
+        else:
+            evaluate = lambda ctx: ctx.text(column).to_numpy() == lit.key
+    elif op == "!=":
+        return _compile_comparison(column, "=", literals, not negate)
+    elif op in ("~", "!~"):
+        try:
+            pattern = re.compile(literals[0].text, re.IGNORECASE)
+        except re.error as e:
+            raise FilterSyntaxError(f"正则表达式无效: {e}")
+        evaluate = lambda ctx: _as_mask(ctx.text(column).str.contains(pattern, regex=True, na=False))
+        negate = negate != (op == "!~")
+    elif op == "contains":
+        needle = literals[0].text.strip().lower()
+        evaluate = lambda ctx: _as_mask(ctx.text(column).str.contains(needle, regex=False, na=False))
+    elif op == "in":
+        keys = {lit.key for lit in literals}
+        numbers = {lit.number for lit in literals if lit.number is not None}
+        dates = [lit.date for lit in literals if lit.date is not None]
+
+        def evaluate(ctx):
+            mask = ctx.text(column).isin(keys).to_numpy()
+            if numbers:
+                mask = mask | _as_mask(ctx.number(column).isin(numbers))
+            if dates:
+                mask = mask | _date_matches(ctx, column, dates)
+            return mask
+    elif op == "between":
+        def evaluate(ctx):
+            values, (low, high) = _ordered_values(ctx, column, literals)
+            return _as_mask((values >= low) & (values <= high))
+    else:
+        compare = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}[op]
+
+        def evaluate(ctx):
+            values, (bound,) = _ordered_values(ctx, column, literals)
+            return _as_mask(compare(values, bound))
+    if negate:
+        return lambda ctx: ~evaluate(ctx)
+    return evaluate
+
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.index = 0
+        self.columns = set()
+
+    def _peek(self, offset=0) -> Optional[_Token]:
+        index = self.index + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def _next(self, expected=None) -> _Token:
+        token = self._peek()
+        if token is None:
+            raise FilterSyntaxError(f"表达式不完整，缺少 {expected or '内容'}")
+        self.index += 1
+        return token
+
+    def _is_keyword(self, token, value):
+        return token is not None and token.kind == "keyword" and token.value == value
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterSyntaxError("表达式为空")
+        node = self._or()
+        if self._peek() is not None:
+            token = self._peek()
+            raise FilterSyntaxError(f"多余的内容 '{token.value}'", token.pos)
+        return node
+
+    def _or(self):
+        parts = [self._and()]
+        while self._is_keyword(self._peek(), "or"):
+            self._next()
+            parts.append(self._and())
+        if len(parts) == 1:
+            return parts[0]
+        return lambda ctx: np.logical_or.reduce([part(ctx) for part in parts])
+
+    def _and(self):
+        parts = [self._not()]
+        while self._is_keyword(self._peek(), "and"):
+            self._next()
+            parts.append(self._not())
+        if len(parts) == 1:
+            return parts[0]
+        return lambda ctx: np.logical_and.reduce([part(ctx) for part in parts])
+
+    def _not(self):
+        if self._is_keyword(self._peek(), "not"):
+            self._next()
+            inner = self._not()
+            return lambda ctx: ~inner(ctx)
+        return self._primary()
+
+    def _primary(self):
+        token = self._peek()
+        if token is not None and token.kind == "lpar":
+            self._next()
+            node = self._or()
+            closing = self._next("')'")
+            if closing.kind != "rpar":
+                raise FilterSyntaxError("缺少 ')'", closing.pos)
+            return node
+        return self._comparison()
+
+    def _value(self) -> _Literal:
+        token = self._next("比较值")
+        if token.kind not in ("value", "number", "name"):
+            raise FilterSyntaxError(f"需要比较值，遇到 '{token.value}'", token.pos)
+        return _Literal(token)
+
+    def _comparison(self):
+        token = self._next("列名")
+        if token.kind != "name":
+            raise FilterSyntaxError(f"需要列名，遇到 '{token.value}'", token.pos)
+        column = token.value
+        self.columns.add(column)
+
+        negate = False
+        if self._is_keyword(self._peek(), "not"):
+            self._next()
+            negate = True
+        op_token = self._next("运算符")
+        if op_token.kind == "op" and op_token.value in _COMPARISON_OPS and not negate:
+            return _compile_comparison(column, op_token.value, [self._value()])
+        if op_token.kind == "keyword" and op_token.value == "contains":
+            return _compile_comparison(column, "contains", [self._value()], negate)
+        if op_token.kind == "keyword" and op_token.value == "in":
+            opening = self._next("'('")
+            if opening.kind != "lpar":
+                raise FilterSyntaxError("in 之后需要 '('", opening.pos)
+            literals = [self._value()]
+            while self._peek() is not None and self._peek().kind == "comma":
+                self._next()
+                literals.append(self._value())
+            closing = self._next("')'")
+            if closing.kind != "rpar":
+                raise FilterSyntaxError("缺少 ')'", closing.pos)
+            return _compile_comparison(column, "in", literals, negate)
+        if op_token.kind == "keyword" and op_token.value == "between" and not negate:
+            low = self._value()
+            separator = self._next("and")
+            if not self._is_keyword(separator, "and"):
+                raise FilterSyntaxError("between 需要写成 between A and B", separator.pos)
+            return _compile_comparison(column, "between", [low, self._value()])
+        raise FilterSyntaxError(f"无效的运算符 '{op_token.value}'", op_token.pos)
+
+
+class CompiledFilter:
+    """编译后的筛选表达式，可对任意 DataFrame 反复求值"""
+
+    def __init__(self, text):
+        self.text = text
+        parser = _Parser(text)
+        self._evaluate = parser.parse()
+        self.columns: Set[str] = parser.columns
+
+    def missing_columns(self, df) -> List[str]:
+        return sorted(col for col in self.columns if col not in df.columns)
+
+    def mask(self, df) -> np.ndarray:
+        """返回与 df 行数一致的布尔掩码；引用的列不存在时抛出 KeyError"""
+        missing = self.missing_columns(df)
+        if missing:
+            raise KeyError(f"列不存在: {', '.join(missing)}")
+        return np.asarray(self._evaluate(_Context(df)), dtype=bool)
+
+    def apply(self, df) -> pd.DataFrame:
+        return df[self.mask(df)]
+
+
+_compiled_cache: Dict[str, CompiledFilter] = {}
+
+
+def compile_filter(text) -> CompiledFilter:
+    """编译筛选表达式 (结果按文本缓存)；语法错误时抛出 FilterSyntaxError"""
+    text = text.strip()
+    if text not in _compiled_cache:
+        if len(_compiled_cache) >= 64:
+            _compiled_cache.pop(next(iter(_compiled_cache)))
+        _compiled_cache[text] = CompiledFilter(text)
+    return _compiled_cache[text]
+
+
+def apply_filter(df, text) -> pd.DataFrame:
+    """对 DataFrame 应用筛选表达式，供无界面脚本使用"""
+    return compile_filter(text).apply(df)
+
+
+def main(argv=None):
+    """命令行: python -m src.data.filter_expr 文件 "表达式" [--sheet 名称] [--output 输出.csv]"""
+    import argparse
+    from src.data.sources import open_source
+
+    parser = argparse.ArgumentParser(description="按筛选表达式过滤收件人数据")
+    parser.add_argument("path", help="Excel/CSV/Parquet 文件")
+    parser.add_argument("expression", help="筛选表达式")
+    parser.add_argument("--sheet", help="工作表名称，默认第一个")
+    parser.add_argument("--output", help="将筛选结果写入 CSV 文件")
+    args = parser.parse_args(argv)
+
+    source = open_source(args.path)
+    sheet_name = args.sheet or source.sheet_names()[0]
+    df = source.read_sheet(sheet_name)
+    try:
+        result = apply_filter(df, args.expression)
+    except (FilterSyntaxError, KeyError) as e:
+        print(f"❌ 筛选表达式错误: {e}")
+        return 1
+    print(f"✅ {sheet_name}: {len(result)}/{len(df)} 行满足条件")
+    if args.output:
+        result.to_csv(args.output, index=False, encoding="utf-8-sig")
+        print(f"  已写入: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
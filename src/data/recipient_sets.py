@@ -0,0 +1,114 @@
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+OP_UNION = "并入"
+OP_INTERSECT = "仅保留交集"
+OP_EXCLUDE = "排除"
+OPERATIONS = (OP_UNION, OP_INTERSECT, OP_EXCLUDE)
+
+
+def address_key(email) -> str:
+    """集合运算使用的地址键：去除空白并转为小写"""
+    return str(email).strip().lower()
+
+
+class RecipientSet:
+    """以邮箱地址为键的有序收件人集合
+
+    内部是 {地址键: 收件人记录} 字典，并、交、差都是线性时间的哈希查找；
+    运算结果保持左侧的顺序，地址相同时保留先出现的记录。
+    """
+
+    def __init__(self, records: Optional[Dict[str, dict]] = None):
+        self._records = records if records is not None else {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], email_key="email") -> "RecipientSet":
+        result = {}
+        for record in records:
+            email = record.get(email_key)
+            if email:
+                result.setdefault(address_key(email), record)
+        return cls(result)
+
+    @classmethod
+    def from_frame(cls, df, email_col, name_col=None, source="") -> "RecipientSet":
+        """由工作表创建集合，整行保存在记录的 fields 中供模板变量使用"""
+        emails = df[email_col].astype("string").str.strip()
+        keys = emails.str.lower()
+        keep = (keys.notna() & (keys != "") & ~keys.duplicated()).to_numpy(dtype=bool)
+        rows = df[keep].rename(columns=str).to_dict("records")
+        names = df[name_col][keep].astype(str).tolist() if name_col in df.columns else [""] * len(rows)
+        records = {}
+        for key, email, name, row in zip(keys[keep].tolist(), emails[keep].tolist(), names, rows):
+            records[key] = {"name": name, "email": email, "type": "excel", "group_name": source, "fields": row}
+        return cls(records)
+
+    @classmethod
+    def from_addresses(cls, addresses: Iterable[str], source="") -> "RecipientSet":
+        return cls.from_records(({"name": "", "email": a.strip(), "type": "list", "group_name": source} for a in addresses))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, email):
+        return address_key(email) in self._records
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def keys(self):
+        return self._records.keys()
+
+    def records(self) -> List[dict]:
+        return list(self._records.values())
+
+    def union(self, other: "RecipientSet") -> "RecipientSet":
+        result = dict(self._records)
+        for key, record in other._records.items():
+            result.setdefault(key, record)
+        return RecipientSet(result)
+
+    def intersection(self, other: "RecipientSet") -> "RecipientSet":
+        return RecipientSet({key: record for key, record in self._records.items() if key in other._records})
+
+    def difference(self, other: "RecipientSet") -> "RecipientSet":
+        return RecipientSet({key: record for key, record in self._records.items() if key not in other._records})
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+
+def combine(steps: Sequence[Tuple[str, RecipientSet]]) -> RecipientSet:
+    """按顺序合并各步骤，例如 [(并入, 群组A), (并入, 工作表X), (排除, 群组B)]
+
+    第一步的运算符被忽略 (作为初始集合)，之后每一步把运算应用到当前结果上。
+    """
+    result = RecipientSet()
+    for i, (op, recipient_set) in enumerate(steps):
+        if i == 0 or op == OP_UNION:
+            result = result | recipient_set
+        elif op == OP_INTERSECT:
+            result = result & recipient_set
+        elif op == OP_EXCLUDE:
+            result = result - recipient_set
+        else:
+            raise ValueError(f"未知的集合运算: {op}")
+    return result
+
+
+def load_address_list(path) -> RecipientSet:
+    """读取屏蔽/名单文件：纯文本每行一个地址，表格文件取所有包含 @ 的单元格"""
+    source = os.path.basename(path)
+    if os.path.splitext(path)[1].lower() in (".txt", ".lst"):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            return RecipientSet.from_addresses((line for line in f if "@" in line), source)
+    # Imported lazily to keep this module free of the reader dependencies
+    from src.data.sources import open_source
+    data_source = open_source(path)
+    df = data_source.read_sheet(data_source.sheet_names()[0])
+    values = pd.Series(df.to_numpy().ravel()).dropna().astype(str)
+    return RecipientSet.from_addresses(values[values.str.contains("@", regex=False)], source)
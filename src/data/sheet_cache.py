@@ -0,0 +1,141 @@
+import os
+import json
+import shutil
+import hashlib
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+CACHE_DIR = "sheet_cache"
+MANIFEST_FILE = "manifest.json"
+CACHE_VERSION = 1
+
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SheetCache:
+    """已解析工作表的列式旁路缓存 (Parquet)
+
+    每个源文件对应缓存目录下的一个子目录，其中 manifest.json 记录源文件指纹
+    (大小 + 修改时间，或内容哈希) 和工作表列表，每个工作表保存为一个 Parquet 文件。
+    源文件指纹变化时整个条目自动失效。
+
+    调用方应在读取源文件之前用 fingerprint() 取得指纹，并在同一次加载中传给
+    sheet_names / load_sheet / store_sheet：内容哈希只计算一次，读取期间源文件
+    被修改时写入的缓存也会带着旧指纹，下次加载即失效。
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, use_content_hash=False):
+        self.cache_dir = cache_dir
+        self.use_content_hash = use_content_hash
+
+    @property
+    def enabled(self) -> bool:
+        return HAS_PYARROW
+
+    def _entry_dir(self, path) -> str:
+        key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def _sheet_file(self, path, sheet_name) -> str:
+        name_key = hashlib.md5(str(sheet_name).encode("utf-8")).hexdigest()
+        return os.path.join(self._entry_dir(path), f"{name_key}.parquet")
+
+    def fingerprint(self, path) -> Optional[Dict]:
+        """源文件的当前指纹，文件无法读取时返回 None"""
+        try:
+            st = os.stat(path)
+            if self.use_content_hash:
+                return {"size": st.st_size, "sha256": _file_sha256(path)}
+            return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        except OSError as e:
+            print(f"[DEBUG] Cannot fingerprint {path}: {e}")
+            return None
+
+    def _read_manifest(self, path, fingerprint) -> Optional[Dict]:
+        """读取并校验缓存清单，源文件已变化时删除旧缓存并返回 None"""
+        manifest_path = os.path.join(self._entry_dir(path), MANIFEST_FILE)
+        if fingerprint is None or not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == CACHE_VERSION and manifest.get("fingerprint") == fingerprint:
+                return manifest
+        except (OSError, ValueError) as e:
+            print(f"[DEBUG] Sheet cache manifest unreadable: {e}")
+        self.invalidate(path)
+        return None
+
+    def _write_manifest(self, path, manifest):
+        entry_dir = self._entry_dir(path)
+        os.makedirs(entry_dir, exist_ok=True)
+        tmp_path = os.path.join(entry_dir, MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(entry_dir, MANIFEST_FILE))
+
+    def sheet_names(self, path, fingerprint) -> Optional[List[str]]:
+        """返回缓存中记录的工作表名称，缓存无效时返回 None"""
+        if not self.enabled:
+            return None
+        manifest = self._read_manifest(path, fingerprint)
+        return manifest.get("sheet_names") if manifest else None
+
+    def load_sheet(self, path, sheet_name, fingerprint) -> Optional[pd.DataFrame]:
+        """从缓存读取单个工作表，未命中时返回 None"""
+        if not self.enabled:
+            return None
+        manifest = self._read_manifest(path, fingerprint)
+        if not manifest or sheet_name not in manifest.get("sheets", []):
+            return None
+        try:
+            return pd.read_parquet(self._sheet_file(path, sheet_name))
+        except Exception as e:
+            print(f"[DEBUG] Sheet cache read failed for {sheet_name}: {e}")
+            return None
+
+    def store_sheet(self, path, sheet_name, df, sheet_names, fingerprint):
+        """写入单个工作表，并更新该源文件的缓存清单
+
+        fingerprint 须是读取该工作表之前取得的源文件指纹。
+        """
+        if not self.enabled or fingerprint is None:
+            return
+        # Parquet requires string column labels; leave such sheets uncached
+        if not all(isinstance(col, str) for col in df.columns):
+            return
+        try:
+            manifest = self._read_manifest(path, fingerprint) or {
+                "version": CACHE_VERSION,
+                "source": os.path.abspath(path),
+                "fingerprint": fingerprint,
+                "sheet_names": list(sheet_names),
+                "sheets": [],
+            }
+            os.makedirs(self._entry_dir(path), exist_ok=True)
+            sheet_file = self._sheet_file(path, sheet_name)
+            tmp_file = sheet_file + ".tmp"
+            df.to_parquet(tmp_file, index=False)
+            os.replace(tmp_file, sheet_file)
+            if sheet_name not in manifest["sheets"]:
+                manifest["sheets"].append(sheet_name)
+            self._write_manifest(path, manifest)
+        except Exception as e:
+            print(f"[DEBUG] Sheet cache write failed for {sheet_name}: {e}")
+
+    def invalidate(self, path):
+        """删除指定源文件的全部缓存"""
+        shutil.rmtree(self._entry_dir(path), ignore_errors=True)
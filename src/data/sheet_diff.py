@@ -0,0 +1,64 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+class SheetDiff:
+    """两个版本工作表之间的行级差异，用于重新加载后报告变化的行数"""
+
+    def __init__(self, added, removed, modified, columns_changed=False, identical=False):
+        self.added: List[int] = added        # row positions in the new frame
+        self.removed: List[int] = removed    # row positions in the old frame
+        self.modified: List[int] = modified  # positions changed in place (same row number)
+        self.columns_changed = columns_changed
+        # Same rows in the same order, so anything computed from the old frame still applies
+        self.identical = identical
+
+    @property
+    def unchanged(self) -> bool:
+        return not (self.added or self.removed or self.modified or self.columns_changed)
+
+    def summary(self) -> str:
+        if self.columns_changed:
+            return "列结构已变化"
+        if self.unchanged:
+            return "无变化"
+        parts = []
+        if self.added:
+            parts.append(f"新增 {len(self.added)} 行")
+        if self.modified:
+            parts.append(f"修改 {len(self.modified)} 行")
+        if self.removed:
+            parts.append(f"删除 {len(self.removed)} 行")
+        return "，".join(parts)
+
+
+def _row_hashes(df) -> np.ndarray:
+    return pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+
+
+def _row_keys(hashes) -> pd.MultiIndex:
+    # Pair each hash with its occurrence number so that duplicated rows are counted one by one
+    series = pd.Series(hashes)
+    return pd.MultiIndex.from_arrays([hashes, series.groupby(series).cumcount().to_numpy()])
+
+
+def diff_frames(old, new) -> SheetDiff:
+    """按行内容哈希比较新旧工作表
+
+    只出现在一侧的行视为新增或删除；同一行号上两侧都发生变化的行视为修改。
+    内容相同的重复行逐行计数；只调整了行顺序时不计为变化，但 identical 为 False。
+    """
+    if list(old.columns) != list(new.columns):
+        return SheetDiff([], [], [], columns_changed=True)
+    old_hashes, new_hashes = _row_hashes(old), _row_hashes(new)
+    if np.array_equal(old_hashes, new_hashes):
+        return SheetDiff([], [], [], identical=True)
+    old_keys, new_keys = _row_keys(old_hashes), _row_keys(new_hashes)
+    new_only = np.flatnonzero(~new_keys.isin(old_keys))
+    old_only = np.flatnonzero(~old_keys.isin(new_keys))
+    modified = np.intersect1d(new_only, old_only)
+    added = np.setdiff1d(new_only, modified)
+    removed = np.setdiff1d(old_only, modified)
+    return SheetDiff(added.tolist(), removed.tolist(), modified.tolist())
@@ -0,0 +1,280 @@
+import os
+import csv
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+# Rows read between two progress/cancellation checks
+ROW_CHUNK = 2000
+# Bytes of a .txt file inspected to detect its delimiter
+SNIFF_BYTES = 64 * 1024
+# Bytes parsed per pyarrow CSV record batch (one progress/cancellation check per batch)
+ARROW_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class LoadCancelled(Exception):
+    """读取过程被用户取消"""
+
+
+def _cell_text(value) -> str:
+    """按 pd.read_excel(dtype=str) 的规则把单元格值转为字符串"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _header_labels(row) -> List:
+    labels, seen = [], {}
+    for i, value in enumerate(row):
+        label = f"Unnamed: {i}" if value is None else value
+        if label in seen:
+            seen[label] += 1
+            label = f"{label}.{seen[label]}"
+        else:
+            seen[label] = 0
+        labels.append(label)
+    return labels
+
+
+def as_text_frame(df) -> pd.DataFrame:
+    """统一为与 Excel 加载一致的格式：所有单元格为 str，空值为 ''"""
+    return df.astype(object).where(df.notna(), '').astype(str)
+
+
+class DataSource:
+    """收件人数据源基类
+
+    一个数据源由若干个具名工作表组成，每个工作表读取为全部为字符串的 DataFrame，
+    供工作表/列选择、筛选和 MailWorker 使用。
+    """
+
+    extensions = ()
+    description = ""
+    # Whether parsed sheets are worth storing in the sidecar cache
+    cacheable = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def sheet_names(self) -> List[str]:
+        raise NotImplementedError
+
+    def read_sheet(self, sheet_name, progress: Optional[Callable[[int, int], None]] = None,
+                   is_cancelled: Optional[Callable[[], bool]] = None) -> pd.DataFrame:
+        """读取单个工作表
+
+        progress(已读行数, 总行数) 在支持分块读取的数据源中按块回调，总行数未知时为 0；
+        is_cancelled() 返回 True 时抛出 LoadCancelled。
+        """
+        raise NotImplementedError
+
+
+class ExcelSource(DataSource):
+    extensions = (".xlsx", ".xls")
+    description = "Excel Files"
+    cacheable = True
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._excel_file = None
+
+    def _file(self):
+        if self._excel_file is None:
+            self._excel_file = pd.ExcelFile(self.path)
+        return self._excel_file
+
+    def sheet_names(self):
+        return self._file().sheet_names
+
+    def read_sheet(self, sheet_name, progress=None, is_cancelled=None):
+        if self.path.lower().endswith(".xlsx") and (progress or is_cancelled):
+            return self._stream_xlsx(sheet_name, progress, is_cancelled)
+        # .xls cannot be streamed; the cancel flag is only honoured once parsing returns
+        df = self._file().parse(sheet_name, dtype=str).fillna('')
+        if is_cancelled and is_cancelled():
+            raise LoadCancelled()
+        return df
+
+    def _stream_xlsx(self, sheet_name, progress, is_cancelled):
+        """逐行流式读取 .xlsx，每 ROW_CHUNK 行回报进度并检查是否取消"""
+        import openpyxl
+        workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            sheet = workbook[sheet_name]
+            total = max((sheet.max_row or 1) - 1, 0)
+            header, rows = None, []
+            for row in sheet.iter_rows(values_only=True):
+                if header is None:
+                    header = _header_labels(row)
+                    continue
+                # Blank rows are skipped, as pd.read_excel does
+                if all(value is None for value in row):
+                    continue
+                rows.append([_cell_text(value) for value in row])
+                if len(rows) % ROW_CHUNK == 0:
+                    if is_cancelled and is_cancelled():
+                        raise LoadCancelled()
+                    if progress:
+                        progress(len(rows), total)
+        finally:
+            workbook.close()
+        if progress:
+            progress(len(rows), len(rows))
+        if header is None:
+            return pd.DataFrame()
+        width = len(header)
+        rows = [row[:width] + [''] * (width - len(row)) for row in rows]
+        return pd.DataFrame(rows, columns=header)
+
+
+class CsvSource(DataSource):
+    """CSV/TSV 文件 (.txt 自动检测分隔符)，作为单个工作表；pyarrow 可用时使用其多线程解析器"""
+
+    extensions = (".csv", ".tsv", ".txt")
+    description = "CSV/TSV Files"
+
+    def _separator(self):
+        ext = os.path.splitext(self.path)[1].lower()
+        if ext == ".csv":
+            return ","
+        if ext == ".tsv":
+            return "\t"
+        return self._sniff_separator()
+
+    def _sniff_separator(self):
+        """.txt 没有固定的分隔符，按文件开头的内容判断，无法判断时按制表符处理"""
+        try:
+            with open(self.path, "rb") as f:
+                # Delimiters are ASCII, so a lossy decode is enough for GBK files too
+                sample = f.read(SNIFF_BYTES).decode("utf-8", errors="replace")
+            # Drop a possibly truncated last line
+            sample = sample.rsplit("\n", 1)[0] if "\n" in sample else sample
+            return csv.Sniffer().sniff(sample, delimiters=",\t;|").delimiter
+        except (OSError, csv.Error):
+            return "\t"
+
+    def sheet_names(self):
+        return [os.path.splitext(os.path.basename(self.path))[0]]
+
+    def read_sheet(self, sheet_name, progress=None, is_cancelled=None):
+        separator = self._separator()
+        if HAS_PYARROW:
+            # Exports from Chinese-locale Excel are usually GBK encoded
+            for encoding in ("utf-8-sig", "gb18030"):
+                try:
+                    return self._read_arrow(separator, encoding, progress, is_cancelled)
+                except LoadCancelled:
+                    raise
+                except Exception as e:
+                    print(f"[DEBUG] pyarrow CSV reader failed ({encoding}): {e}")
+        # pandas' C parser is more lenient with malformed files than pyarrow
+        options = {"sep": separator, "dtype": str, "keep_default_na": False}
+        try:
+            df = self._read_chunked(options, "utf-8-sig", progress, is_cancelled)
+        except UnicodeDecodeError:
+            # Exports from Chinese-locale Excel are usually GBK encoded
+            df = self._read_chunked(options, "gb18030", progress, is_cancelled)
+        return df.fillna('')
+
+    def _read_arrow(self, separator, encoding, progress, is_cancelled):
+        """用 pyarrow 的多线程流式读取器按批读取，每批回报进度并检查是否取消"""
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+        # pyarrow skips a UTF-8 BOM itself and only accepts the plain codec name
+        read_options = pa_csv.ReadOptions(encoding="utf8" if encoding == "utf-8-sig" else encoding,
+                                          block_size=ARROW_BLOCK_SIZE, use_threads=True)
+        parse_options = pa_csv.ParseOptions(delimiter=separator)
+        # Column types are inferred from the first block unless given; every column must stay text
+        with pa_csv.open_csv(self.path, read_options=read_options, parse_options=parse_options) as probe:
+            names = probe.schema.names
+        convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                                strings_can_be_null=False, quoted_strings_can_be_null=False)
+        batches, rows = [], 0
+        with pa_csv.open_csv(self.path, read_options=read_options, parse_options=parse_options,
+                             convert_options=convert_options) as reader:
+            schema = reader.schema
+            for batch in reader:
+                if is_cancelled and is_cancelled():
+                    raise LoadCancelled()
+                batches.append(batch)
+                rows += batch.num_rows
+                if progress:
+                    progress(rows, 0)
+        if progress:
+            progress(rows, rows)
+        df = pa.Table.from_batches(batches, schema=schema).to_pandas()
+        # Same labels as pd.read_csv: blank headers become "Unnamed: n", duplicates get ".1"
+        df.columns = _header_labels([name or None for name in names])
+        return df.fillna('')
+
+    def _read_chunked(self, options, encoding, progress, is_cancelled):
+        """分块读取，每块回报进度并检查是否取消"""
+        chunks, rows = [], 0
+        with pd.read_csv(self.path, encoding=encoding, chunksize=ROW_CHUNK * 10, **options) as reader:
+            for chunk in reader:
+                if is_cancelled and is_cancelled():
+                    raise LoadCancelled()
+                chunks.append(chunk)
+                rows += len(chunk)
+                if progress:
+                    progress(rows, 0)
+        if progress:
+            progress(rows, rows)
+        if not chunks:
+            return pd.read_csv(self.path, encoding=encoding, **options)
+        return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+class ParquetSource(DataSource):
+    extensions = (".parquet", ".pq")
+    description = "Parquet Files"
+
+    def sheet_names(self):
+        return [os.path.splitext(os.path.basename(self.path))[0]]
+
+    def read_sheet(self, sheet_name, progress=None, is_cancelled=None):
+        if not HAS_PYARROW or not (progress or is_cancelled):
+            return as_text_frame(pd.read_parquet(self.path))
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(self.path)
+        total = parquet_file.metadata.num_rows
+        batches, rows = [], 0
+        for batch in parquet_file.iter_batches(batch_size=ROW_CHUNK * 10):
+            if is_cancelled and is_cancelled():
+                raise LoadCancelled()
+            batches.append(batch)
+            rows += batch.num_rows
+            if progress:
+                progress(rows, total)
+        table = pa.Table.from_batches(batches, schema=parquet_file.schema_arrow)
+        return as_text_frame(table.to_pandas())
+
+
+_SOURCE_TYPES = [ExcelSource, CsvSource, ParquetSource]
+
+
+def open_source(path) -> DataSource:
+    """按文件扩展名创建对应的数据源"""
+    ext = os.path.splitext(path)[1].lower()
+    for source_cls in _SOURCE_TYPES:
+        if ext in source_cls.extensions:
+            return source_cls(path)
+    raise ValueError(f"不支持的文件类型: {ext or path}")
+
+
+def file_dialog_filter() -> str:
+    """生成 QFileDialog 使用的文件类型过滤字符串"""
+    patterns = [" ".join(f"*{ext}" for ext in cls.extensions) for cls in _SOURCE_TYPES]
+    filters = [f"数据文件 ({' '.join(patterns)})"]
+    filters += [f"{cls.description} ({pattern})" for cls, pattern in zip(_SOURCE_TYPES, patterns)]
+    return ";;".join(filters)
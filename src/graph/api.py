@@ -1,89 +1,175 @@
 import requests
-from PySide6.QtWidgets import QMessageBox
+
+from src.graph import http_cache
+from src.graph.metrics import timed_request
 
 GRAPH_ROOT = "https://graph.microsoft.com/v1.0"
+# Largest page size accepted by the memberOf/members endpoints
+PAGE_SIZE = 999
+MEMBER_SELECT = "id,displayName,mail,userPrincipalName"
+# Directory object types that can receive mail as group members
+MEMBER_TYPES = ("user", "orgContact")
+
+
+class GraphAPIError(Exception):
+    """Graph 请求返回非 200 状态"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code}\n{text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def graph_get(http, url, headers, params=None):
+    """GET 请求，已配置响应缓存 (http_cache.configure) 时经由缓存"""
+    cache = http_cache.get_cache()
+    if cache is None:
+        return timed_request(http, "get", url, headers=headers, params=params)
+    return cache.get(http, url, headers, params)
+
+
+def iter_graph_pages(access_token, endpoint, params=None, session=None, cache=True):
+    """逐页请求 Graph 集合，沿 @odata.nextLink 翻页，每页产出一次 value 列表
+
+    已配置响应缓存时，集合只在全部页面读完后整体缓存，之后在 TTL 内整体返回；
+    cache=False 用于已由其他缓存 (如 DirectoryCache 的成员列表) 保存结果的集合。
+    """
+    http = session or requests
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response_cache = http_cache.get_cache() if cache else None
+    if response_cache is not None:
+        pages = response_cache.load_collection(endpoint, headers, params)
+        if pages is not None:
+            yield from pages
+            return
+    pages = []
+    url, query = endpoint, params
+    while url:
+        response = timed_request(http, "get", url, headers=headers, params=query)
+        if response.status_code != 200:
+            raise GraphAPIError(response.status_code, response.text)
+        data = response.json()
+        pages.append(data.get('value', []))
+        yield pages[-1]
+        # nextLink already carries every query option, including $skiptoken
+        url, query = data.get('@odata.nextLink'), None
+    if response_cache is not None:
+        response_cache.store_collection(endpoint, headers, params, pages)
 
-def fetch_user_groups(app_instance):
-    """获取用户所属的Microsoft 365群组"""
-    if not app_instance.access_token:
-        return False
-    
-    try:
-        headers = {"Authorization": f"Bearer {app_instance.access_token}"}
-        endpoint = f"{GRAPH_ROOT}/me/memberOf/microsoft.graph.group?$select=id,displayName,mail,mailNickname"
-        response = requests.get(endpoint, headers=headers)
-        
-        if response.status_code == 200:
-            groups_data = response.json()
-            app_instance.user_groups = []
-            for group in groups_data.get('value', []):
-                if group.get('mail'):
-                    app_instance.user_groups.append({
-                        'id': group['id'],
-                        'displayName': group['displayName'],
-                        'mail': group['mail'],
-                        'mailNickname': group.get('mailNickname', '')
-                    })
-            return True
-        else:
-            QMessageBox.critical(app_instance, "获取群组失败", f"无法获取群组信息: {response.status_code}\n{response.text}")
-            return False
-    except Exception as e:
-        QMessageBox.critical(app_instance, "错误", f"获取群组时发生错误:\n{e}")
-        return False
-
-def fetch_group_members(app_instance, group_id):
-    """获取指定群组的成员列表"""
-    if not app_instance.access_token:
-        return []
-    
-    try:
-        headers = {"Authorization": f"Bearer {app_instance.access_token}"}
-        endpoint = f"{GRAPH_ROOT}/groups/{group_id}/members"
-        response = requests.get(endpoint, headers=headers)
-        
-        if response.status_code == 200:
-            members_data = response.json()
-            members = []
-            
-            for member in members_data.get('value', []):
-                member_id = member['id']
-                display_name = member.get('displayName')
-                email = member.get('mail') or member.get('userPrincipalName')
 
-                if not display_name or not email:
-                    user_details = fetch_user_details(app_instance, member_id)
-                    if user_details:
-                        display_name = user_details.get('displayName') or f"User-{member_id[:8]}"
-                        email = user_details.get('mail') or user_details.get('userPrincipalName')
+def iter_user_groups(access_token, session=None):
+    """逐个产出当前用户所属且带邮箱的 Microsoft 365 群组"""
+    endpoint = f"{GRAPH_ROOT}/me/memberOf/microsoft.graph.group"
+    params = {"$select": "id,displayName,mail,mailNickname", "$top": PAGE_SIZE}
+    for page in iter_graph_pages(access_token, endpoint, params, session):
+        for group in page:
+            if group.get('mail'):
+                yield {
+                    'id': group['id'],
+                    'displayName': group['displayName'],
+                    'mail': group['mail'],
+                    'mailNickname': group.get('mailNickname', '')
+                }
 
+
+def fetch_group_owner_ids(access_token, group_id, session=None, cache=True):
+    """返回群组所有者的 id 集合 (每个群组一次分页请求)"""
+    endpoint = f"{GRAPH_ROOT}/groups/{group_id}/owners"
+    params = {"$select": "id", "$top": PAGE_SIZE}
+    return {owner['id'] for page in iter_graph_pages(access_token, endpoint, params, session, cache) for owner in page}
+
+
+def member_types(transitive=False):
+    """群组成员中会作为收件人产出的目录对象类型
+
+    transitive=True 时嵌套群组由服务端展开，群组对象本身不算成员；
+    否则嵌套群组按其群组邮箱作为一位收件人。
+    """
+    return MEMBER_TYPES if transitive else MEMBER_TYPES + ("group",)
+
+
+def fetch_member_count(access_token, group_id, transitive=False, session=None) -> int:
+    """用 $count 统计群组中的收件人数，无需读取成员列表 ($count 需要 ConsistencyLevel: eventual)
+
+    按 member_types 逐类统计后相加，与 iter_group_members 产出的成员类型一致。
+    """
+    relation = "transitiveMembers" if transitive else "members"
+    headers = {"Authorization": f"Bearer {access_token}", "ConsistencyLevel": "eventual"}
+    total = 0
+    for member_type in member_types(transitive):
+        url = f"{GRAPH_ROOT}/groups/{group_id}/{relation}/microsoft.graph.{member_type}/$count"
+        response = graph_get(session or requests, url, headers)
+        if response.status_code != 200:
+            raise GraphAPIError(response.status_code, response.text)
+        total += int(response.text.strip().lstrip("\ufeff"))
+    return total
+
+
+def iter_group_members(access_token, group_id, transitive=False, select=None):
+    """逐个产出群组成员，成员随每一页到达即可处理，无需等待全部页面
+
+    所需字段 (select，默认只取姓名和邮箱相关字段) 通过 $select 随成员列表一起返回，
+    所有者身份由一次 /owners 请求得到并写入 isOwner；个别缺少姓名或邮箱的成员
+    (例如联系人、来宾) 每页只用一次 getByIds 请求批量补全。
+    transitive=True 时读取 /transitiveMembers，嵌套群组 (包括循环嵌套) 由服务端展开，
+    群组对象本身不再作为成员产出；只产出 member_types 中的类型 (与 fetch_member_count 一致)。
+    成员列表由 DirectoryCache 缓存，这里的请求不经过响应缓存。
+    """
+    fields = list(dict.fromkeys(MEMBER_SELECT.split(",") + list(select or [])))
+    relation = "transitiveMembers" if transitive else "members"
+    types = member_types(transitive)
+    endpoint = f"{GRAPH_ROOT}/groups/{group_id}/{relation}"
+    params = {"$select": ",".join(fields), "$top": PAGE_SIZE}
+    with requests.Session() as session:
+        owner_ids = fetch_group_owner_ids(access_token, group_id, session, cache=False)
+        for page in iter_graph_pages(access_token, endpoint, params, session, cache=False):
+            page = [m for m in page if m.get('@odata.type', '').rsplit('.', 1)[-1] in types]
+            incomplete = [m['id'] for m in page if not m.get('displayName') or not (m.get('mail') or m.get('userPrincipalName'))]
+            details = _get_objects_by_ids(session, access_token, incomplete)
+            for member in page:
+                member_id = member['id']
+                member = {**details.get(member_id, {}), **{k: v for k, v in member.items() if v not in (None, '', [])}}
+                email = member.get('mail') or member.get('userPrincipalName')
                 if email:
-                    members.append({
+                    result = {field: member.get(field) for field in fields}
+                    result.update({
                         'id': member_id,
-                        'displayName': display_name,
-                        'email': email
+                        'displayName': member.get('displayName') or f"User-{member_id[:8]}",
+                        'email': email,
+                        'isOwner': member_id in owner_ids
                     })
-            
-            return members
-        else:
-            error_text = response.text
-            QMessageBox.warning(app_instance, "获取成员失败", f"无法获取群组成员: {response.status_code}\n{error_text}")
-            return []
-    except Exception as e:
-        QMessageBox.critical(app_instance, "错误", f"获取群组成员时发生错误:\n{e}")
-        return []
+                    yield result
+
 
-def fetch_user_details(app_instance, user_id):
-    """获取单个用户的详细信息"""
+def _get_objects_by_ids(http, access_token, ids):
+    """批量获取目录对象，返回 {id: 对象}；一页成员 (最多 999 个) 只需一次请求"""
+    if not ids:
+        return {}
     try:
-        headers = {"Authorization": f"Bearer {app_instance.access_token}"}
-        endpoint = f"{GRAPH_ROOT}/users/{user_id}?$select=id,displayName,mail,userPrincipalName"
-        response = requests.get(endpoint, headers=headers)
-        
+        headers = {"Authorization": f"Bearer {access_token}"}
+        payload = {"ids": ids, "types": list(MEMBER_TYPES)}
+        response = timed_request(http, "post", f"{GRAPH_ROOT}/directoryObjects/getByIds", headers=headers, json=payload)
         if response.status_code == 200:
-            return response.json()
-        else:
-            return None
+            return {obj['id']: obj for obj in response.json().get('value', [])}
+        print(f"Debug: getByIds failed for {len(ids)} objects: {response.status_code}")
+        return {}
     except Exception as e:
-        print(f"Debug: Error getting user details for {user_id}: {e}")
-        return None
+        print(f"Debug: Error resolving {len(ids)} directory objects: {e}")
+        return {}
+
+def merge_members(group_members):
+    """合并多个群组的成员，按 id 和邮箱 (不区分大小写) 去重
+
+    group_members 为 (群组, 成员列表) 序列；返回 (群组, 成员) 列表，
+    每位成员只保留首次出现时所在的群组。
+    """
+    seen_ids, seen_emails, merged = set(), set(), []
+    for group, members in group_members:
+        for member in members:
+            email = member['email'].lower()
+            if member['id'] in seen_ids or email in seen_emails:
+                continue
+            seen_ids.add(member['id'])
+            seen_emails.add(email)
+            merged.append((group, member))
+    return merged
@@ -1,38 +1,92 @@
 import os
 import json
-import time
 import msal
 from PySide6.QtWidgets import QMessageBox
 from src.ui.dialogs import AuthDialog
 
-TOKEN_CACHE_FILE = "token_cache.json"
 SCOPES = ["Mail.Send", "Mail.ReadWrite", "User.Read", "User.Read.All", "GroupMember.Read.All", "Group.Read.All"]
+# Application permissions granted to the app registration (Mail.Send etc.)
+APP_SCOPES = ["https://graph.microsoft.com/.default"]
 
-def _save_token_cache(cache):
-    if cache.has_state_changed:
-        with open(TOKEN_CACHE_FILE, "w", encoding="utf-8") as f:
-            f.write(cache.serialize())
+def silent_acquirer(msal_app):
+    """Silent MSAL acquisition for TokenProvider; never shows UI"""
+    def acquire(force_refresh):
+        accounts = msal_app.get_accounts()
+        if not accounts:
+            return None
+        return msal_app.acquire_token_silent(SCOPES, account=accounts[0], force_refresh=force_refresh)
+    return acquire
+
+def app_credential_from_env():
+    """读取应用认证凭据：AZURE_CLIENT_SECRET，或证书 AZURE_CLIENT_CERT_PATH + AZURE_CLIENT_CERT_THUMBPRINT
+
+    均未配置时返回 None。证书文件为包含私钥的 PEM，可选 AZURE_CLIENT_CERT_PASSPHRASE。
+    """
+    cert_path = os.getenv("AZURE_CLIENT_CERT_PATH")
+    thumbprint = os.getenv("AZURE_CLIENT_CERT_THUMBPRINT")
+    if cert_path and thumbprint:
+        with open(cert_path, "r", encoding="utf-8") as f:
+            credential = {"private_key": f.read(), "thumbprint": thumbprint}
+        if os.getenv("AZURE_CLIENT_CERT_PASSPHRASE"):
+            credential["passphrase"] = os.getenv("AZURE_CLIENT_CERT_PASSPHRASE")
+        return credential
+    return os.getenv("AZURE_CLIENT_SECRET") or None
+
+def sender_mailboxes_from_env():
+    """AZURE_SENDER_MAILBOXES：以逗号或分号分隔的发件邮箱 (用户 id 或 UPN)"""
+    raw = os.getenv("AZURE_SENDER_MAILBOXES", "")
+    return [m.strip() for m in raw.replace(";", ",").split(",") if m.strip()]
+
+def sender_rotation_from_env():
+    """AZURE_SENDER_ROTATE=true 时轮流使用所有发件邮箱，默认只用第一个"""
+    return os.getenv("AZURE_SENDER_ROTATE", "").strip().lower() in ("1", "true", "yes", "on")
+
+def create_confidential_app(client_id, tenant_id, credential):
+    # The default in-memory token cache is shared by every worker using this app
+    return msal.ConfidentialClientApplication(
+        client_id, authority=f"https://login.microsoftonline.com/{tenant_id}",
+        client_credential=credential
+    )
+
+def client_acquirer(confidential_app):
+    """Client-credentials acquisition for TokenProvider; MSAL serves cached app tokens until they expire"""
+    def acquire(force_refresh):
+        if force_refresh and hasattr(confidential_app, "remove_tokens_for_client"):
+            confidential_app.remove_tokens_for_client()
+        return confidential_app.acquire_token_for_client(scopes=APP_SCOPES)
+    return acquire
+
+def ensure_send_token(app_instance):
+    """发送前获取令牌：配置了应用认证时直接使用应用令牌，无需交互登录"""
+    provider = app_instance.app_token_provider
+    if provider is None:
+        return ensure_token(app_instance)
+    if provider.token():
+        provider.start()
+        return True
+    QMessageBox.critical(app_instance, "应用认证失败", provider.last_error or "无法以客户端凭据获取访问令牌")
+    return False
 
 def ensure_token(app_instance):
-    if app_instance.access_token:
+    provider = app_instance.token_provider
+    # A valid token, or one refreshed silently from the cache
+    if provider.token():
+        provider.start()
         return True
     
-    accounts = app_instance.msal_app.get_accounts()
-    result = app_instance.msal_app.acquire_token_silent(SCOPES, account=accounts[0]) if accounts else None
+    flow = app_instance.msal_app.initiate_device_flow(scopes=SCOPES)
+    if "user_code" not in flow:
+        QMessageBox.critical(app_instance, "认证错误", flow.get('error_description', '未知错误'))
+        return False
     
-    if not result:
-        flow = app_instance.msal_app.initiate_device_flow(scopes=SCOPES)
-        if "user_code" not in flow:
-            QMessageBox.critical(app_instance, "认证错误", flow.get('error_description', '未知错误'))
-            return False
-        
-        dialog = AuthDialog(flow["user_code"], flow["verification_uri"], app_instance)
-        dialog.exec()
-        
-        result = app_instance.msal_app.acquire_token_by_device_flow(flow)
+    dialog = AuthDialog(flow["user_code"], flow["verification_uri"], app_instance)
+    dialog.exec()
+    
+    result = app_instance.msal_app.acquire_token_by_device_flow(flow)
         
     if "access_token" in result:
-        app_instance.access_token = result["access_token"]
+        provider.set_result(result)
+        provider.start()
         return True
         
     QMessageBox.critical(app_instance, "认证失败", json.dumps(result, ensure_ascii=False, indent=2))
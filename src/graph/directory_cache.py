@@ -0,0 +1,248 @@
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import requests
+
+from src.graph.api import GRAPH_ROOT, GraphAPIError, iter_user_groups
+from src.graph.http_cache import token_object_id
+from src.graph.metrics import timed_request
+
+CACHE_FILE = "directory_cache.db"
+DEFAULT_TTL = 3600  # seconds
+GROUP_FIELDS = ("displayName", "mail", "mailNickname")
+DELTA_SELECT = "displayName,mail,mailNickname,members"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS groups (id TEXT PRIMARY KEY, position INTEGER, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS member_lists (
+    group_id TEXT NOT NULL,
+    transitive INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    members TEXT NOT NULL,
+    PRIMARY KEY (group_id, transitive)
+);
+"""
+
+
+class DeltaExpired(Exception):
+    """deltaLink 已失效，需要重新全量同步"""
+
+
+class DirectoryCache:
+    """群组和成员关系的本地 SQLite 缓存
+
+    保存当前用户所属的群组和各群组的成员列表，在 TTL 内直接从本地读取。
+    群组列表过期后通过 /groups/delta 增量同步：首次全量读取后只记录 deltaLink，
+    之后每次同步只传输发生变化的群组；已缓存群组的成员发生变化时对应的成员缓存随之失效。
+    缓存与登录用户绑定：读取前比对访问令牌中的用户 oid，换用其他账号登录时重新同步并清空。
+    数据库文件未加密，可用 clear() 清空。
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        # Member lists are written from the member fetch thread pool
+        self._lock = threading.Lock()
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        with self._lock:
+            db = sqlite3.connect(self.path, timeout=30)
+            try:
+                with db:
+                    yield db
+            finally:
+                db.close()
+
+    def _get_meta(self, db, key) -> Optional[str]:
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, db, key, value):
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, None if value is None else str(value)))
+
+    def _is_fresh(self, synced_at) -> bool:
+        return synced_at is not None and time.time() - float(synced_at) < self.ttl
+
+    # ---- groups ----
+
+    def cached_groups(self) -> List[Dict]:
+        with self._db() as db:
+            rows = db.execute("SELECT data FROM groups ORDER BY position").fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def user_groups(self, access_token, force=False) -> List[Dict]:
+        """返回当前用户所属的群组，缓存属于该用户且未过期时不访问网络"""
+        with self._db() as db:
+            synced_at = self._get_meta(db, "groups_synced_at")
+            cached_user = self._get_meta(db, "user_id")
+        # Tokens that cannot be decoded always go through sync_groups, which checks /me
+        user_id = token_object_id(access_token)
+        if not force and user_id is not None and cached_user == user_id and self._is_fresh(synced_at):
+            return self.cached_groups()
+        self.sync_groups(access_token)
+        return self.cached_groups()
+
+    def sync_groups(self, access_token):
+        """与 Graph 同步群组列表：可用时使用 deltaLink 增量同步，否则全量读取"""
+        with requests.Session() as session:
+            headers = {"Authorization": f"Bearer {access_token}"}
+            response = timed_request(session, "get", f"{GRAPH_ROOT}/me", headers=headers, params={"$select": "id"})
+            if response.status_code != 200:
+                raise GraphAPIError(response.status_code, response.text)
+            user_id = response.json()["id"]
+
+            with self._db() as db:
+                cached_user = self._get_meta(db, "user_id")
+                delta_link = self._get_meta(db, "delta_link")
+                if cached_user != user_id:
+                    # Signed in as a different account: nothing cached applies any more
+                    db.execute("DELETE FROM groups")
+                    db.execute("DELETE FROM member_lists")
+                    db.execute("DELETE FROM meta")
+                    self._set_meta(db, "user_id", user_id)
+                    delta_link = None
+
+            if delta_link:
+                try:
+                    self._apply_delta(session, headers, user_id, delta_link)
+                    return
+                except DeltaExpired:
+                    pass
+            self._full_sync(session, headers, access_token)
+
+    def _full_sync(self, session, headers, access_token):
+        # $deltatoken=latest returns a deltaLink for the current state without enumerating every group.
+        # It is taken before listing memberOf so that changes made during the listing are replayed
+        # by the next delta sync instead of being lost.
+        response = timed_request(session, "get", f"{GRAPH_ROOT}/groups/delta", headers=headers,
+                                 params={"$select": DELTA_SELECT, "$deltatoken": "latest"})
+        if response.status_code != 200:
+            raise GraphAPIError(response.status_code, response.text)
+        delta_link = response.json().get("@odata.deltaLink")
+        groups = list(iter_user_groups(access_token, session))
+        with self._db() as db:
+            db.execute("DELETE FROM groups")
+            # Membership changes were not tracked before this point
+            db.execute("DELETE FROM member_lists")
+            db.executemany("INSERT INTO groups (id, position, data) VALUES (?, ?, ?)",
+                           [(group["id"], i, json.dumps(group, ensure_ascii=False)) for i, group in enumerate(groups)])
+            self._set_meta(db, "delta_link", delta_link)
+            self._set_meta(db, "groups_synced_at", time.time())
+
+    def _apply_delta(self, session, headers, user_id, delta_link):
+        url, changes = delta_link, []
+        while url:
+            response = timed_request(session, "get", url, headers=headers)
+            if response.status_code == 410 or (response.status_code == 400 and "syncStateNotFound" in response.text):
+                raise DeltaExpired()
+            if response.status_code != 200:
+                raise GraphAPIError(response.status_code, response.text)
+            data = response.json()
+            changes.extend(data.get("value", []))
+            url = data.get("@odata.nextLink")
+            delta_link = data.get("@odata.deltaLink", delta_link)
+
+        joined = []
+        with self._db() as db:
+            groups = {gid: json.loads(data) for gid, data in db.execute("SELECT id, data FROM groups")}
+            listed = {gid for gid, in db.execute("SELECT DISTINCT group_id FROM member_lists")}
+            for item in changes:
+                gid = item["id"]
+                if "@removed" in item:
+                    self._drop_group(db, gid)
+                    continue
+                if gid in groups:
+                    group = groups[gid]
+                    group.update({field: item[field] for field in GROUP_FIELDS if field in item})
+                    if group.get("mail"):
+                        db.execute("UPDATE groups SET data = ? WHERE id = ?", (json.dumps(group, ensure_ascii=False), gid))
+                    else:
+                        self._drop_group(db, gid)
+                member_changes = item.get("members@delta", [])
+                if not member_changes:
+                    continue
+                # The delta covers every group in the tenant; only lists cached for this group are stale.
+                # Adding or removing a nested group changes the transitive lists of the groups above it,
+                # which are not known here, so those are dropped too. Membership changes inside nested
+                # groups that are not cached themselves are picked up when the lists reach their TTL.
+                if gid in listed:
+                    db.execute("DELETE FROM member_lists WHERE group_id = ?", (gid,))
+                if any(member.get("@odata.type") == "#microsoft.graph.group" for member in member_changes):
+                    db.execute("DELETE FROM member_lists WHERE transitive = 1")
+                for member in member_changes:
+                    if member.get("id") != user_id:
+                        continue
+                    if "@removed" in member:
+                        self._drop_group(db, gid)
+                    elif gid not in groups:
+                        joined.append(gid)
+            self._set_meta(db, "delta_link", delta_link)
+            self._set_meta(db, "groups_synced_at", time.time())
+
+        for gid in joined:
+            response = timed_request(session, "get", f"{GRAPH_ROOT}/groups/{gid}", headers=headers,
+                                     params={"$select": "id,displayName,mail,mailNickname"})
+            if response.status_code != 200:
+                continue
+            group = response.json()
+            if group.get("mail"):
+                self._add_group({"id": group["id"], "displayName": group["displayName"],
+                                 "mail": group["mail"], "mailNickname": group.get("mailNickname", "")})
+
+    def _drop_group(self, db, group_id):
+        db.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+        db.execute("DELETE FROM member_lists WHERE group_id = ?", (group_id,))
+
+    def _add_group(self, group):
+        with self._db() as db:
+            position = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM groups").fetchone()[0]
+            db.execute("INSERT OR REPLACE INTO groups (id, position, data) VALUES (?, ?, ?)",
+                       (group["id"], position, json.dumps(group, ensure_ascii=False)))
+
+    # ---- members ----
+
+    def members(self, group_id, transitive=False) -> Optional[List[Dict]]:
+        """返回缓存的成员列表，没有缓存或已过期时返回 None"""
+        with self._db() as db:
+            row = db.execute("SELECT synced_at, members FROM member_lists WHERE group_id = ? AND transitive = ?",
+                             (group_id, int(transitive))).fetchone()
+        if row is None or not self._is_fresh(row[0]):
+            return None
+        return json.loads(row[1])
+
+    def store_members(self, group_id, transitive, members):
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO member_lists (group_id, transitive, synced_at, members) VALUES (?, ?, ?, ?)",
+                       (group_id, int(transitive), time.time(), json.dumps(members, ensure_ascii=False)))
+
+    def ensure_member_fields(self, fields):
+        """成员字段配置变化时清空成员缓存，避免返回缺少新字段的旧列表"""
+        signature = ",".join(fields)
+        with self._db() as db:
+            if self._get_meta(db, "member_fields") != signature:
+                db.execute("DELETE FROM member_lists")
+                self._set_meta(db, "member_fields", signature)
+
+    def clear(self):
+        """删除全部缓存的群组和成员，并压缩数据库文件"""
+        with self._db() as db:
+            db.execute("DELETE FROM groups")
+            db.execute("DELETE FROM member_lists")
+            db.execute("DELETE FROM meta")
+            db.commit()
+            db.execute("VACUUM")
+
+    def invalidate_members(self, group_id=None):
+        with self._db() as db:
+            if group_id is None:
+                db.execute("DELETE FROM member_lists")
+            else:
+                db.execute("DELETE FROM member_lists WHERE group_id = ?", (group_id,))
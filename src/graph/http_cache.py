@@ -0,0 +1,177 @@
+import json
+import time
+import base64
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlencode
+
+from src.graph.metrics import metrics, timed_request
+
+CACHE_FILE = "graph_http_cache.db"
+DEFAULT_TTL = 600  # seconds a response is served without revalidation
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+
+class CachedResponse:
+    """从缓存返回的响应，提供与 requests.Response 相同的 status_code / text / json()"""
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.text = body
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def token_object_id(access_token) -> Optional[str]:
+    """访问令牌中的 oid (缺少时取 sub)，令牌不是可解析的 JWT 时返回 None"""
+    try:
+        payload = access_token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return claims.get("oid") or claims["sub"]
+    except Exception:
+        return None
+
+
+def _token_subject(authorization) -> str:
+    """缓存按用户隔离：取访问令牌中的 oid，无法解析时使用令牌哈希"""
+    token = (authorization or "").split()[-1] if authorization else ""
+    return token_object_id(token) or hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class HttpCache:
+    """Graph GET 响应的持久化缓存 (SQLite)
+
+    TTL 内的响应直接返回；过期后如有 ETag / Last-Modified，则以 If-None-Match /
+    If-Modified-Since 发送条件请求，304 时继续使用缓存内容。分页集合整体作为一个条目
+    缓存 (load_collection / store_collection)：各页的 nextLink 中的 $skiptoken 会过期，
+    不能单独缓存第一页再沿用其中的链接。所有响应体总大小超过上限时，按最近访问时间
+    淘汰最久未用的条目。
+
+    缓存文件 (graph_http_cache.db) 未加密，其中有群组名称和邮箱等目录信息；
+    可用 clear() (界面上的“清除目录缓存”) 清空。
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Member pages are requested from the member fetch thread pool
+        self._lock = threading.Lock()
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        with self._lock:
+            db = sqlite3.connect(self.path, timeout=30)
+            try:
+                with db:
+                    yield db
+            finally:
+                db.close()
+
+    def _key(self, url, params, headers) -> str:
+        query = urlencode(sorted((params or {}).items()))
+        raw = f"{_token_subject(headers.get('Authorization'))}|{url}?{query}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def load_collection(self, url, headers, params=None):
+        """返回 TTL 内缓存的完整集合 (每页一个列表)，没有时返回 None"""
+        key = self._key(url, params, headers)
+        now = time.time()
+        with self._db() as db:
+            entry = db.execute("SELECT body, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if not entry or now - entry[1] >= self.ttl:
+                return None
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        metrics.record_cache_hit()
+        return json.loads(entry[0])
+
+    def store_collection(self, url, headers, params, pages):
+        """保存已完整读取的集合，调用方只在读到最后一页后调用"""
+        self._store(self._key(url, params, headers), json.dumps(pages, ensure_ascii=False), None, None, time.time())
+
+    def get(self, http, url, headers, params=None):
+        """以缓存方式执行 GET，http 为 requests 模块或 Session"""
+        key = self._key(url, params, headers)
+        now = time.time()
+        with self._db() as db:
+            entry = db.execute("SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if entry and now - entry[3] < self.ttl:
+                db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                metrics.record_cache_hit()
+                return CachedResponse(entry[0])
+
+        request_headers = dict(headers)
+        if entry and entry[1]:
+            request_headers["If-None-Match"] = entry[1]
+        if entry and entry[2]:
+            request_headers["If-Modified-Since"] = entry[2]
+        response = timed_request(http, "get", url, headers=request_headers, params=params)
+
+        if response.status_code == 304 and entry:
+            with self._db() as db:
+                db.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            return CachedResponse(entry[0])
+        if response.status_code == 200:
+            self._store(key, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"), now)
+        return response
+
+    def _store(self, key, body, etag, last_modified, now):
+        size = len(body.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, last_modified, stored_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, now, now, size)
+            )
+            excess = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0] - self.max_bytes
+            if excess <= 0:
+                return
+            evict = []
+            for old_key, old_size in db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                if excess <= 0:
+                    break
+                evict.append((old_key,))
+                excess -= old_size
+            db.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def clear(self):
+        """删除全部缓存内容，并压缩数据库文件使已删除的数据不再留在磁盘上"""
+        with self._db() as db:
+            db.execute("DELETE FROM responses")
+            db.commit()
+            db.execute("VACUUM")
+
+
+_cache: Optional[HttpCache] = None
+
+
+def configure(path=CACHE_FILE, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES) -> HttpCache:
+    """创建全局缓存实例，之后 src.graph.api 的 GET 请求都会经过它"""
+    global _cache
+    _cache = HttpCache(path, ttl, max_bytes)
+    return _cache
+
+
+def get_cache() -> Optional[HttpCache]:
+    return _cache
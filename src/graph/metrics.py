@@ -0,0 +1,185 @@
+import re
+import time
+import bisect
+import threading
+from collections import Counter
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# Local stages (template rendering, attachment encoding) are much faster than network calls
+STAGE_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+THROTTLE_STATUSES = (429, 503)
+
+_ID_SEGMENT = re.compile(r"^(?:[0-9a-fA-F-]{32,36}|[^/@]+@[^/]+|\d+)$")
+
+
+def endpoint_name(url) -> str:
+    """把请求 URL 归一化为端点名称，例如 /groups/{id}/members"""
+    path = urlparse(url).path
+    if path.startswith("/v1.0") or path.startswith("/beta"):
+        path = path.split("/", 2)[2] if path.count("/") > 1 else ""
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.strip("/").split("/")]
+    return "/" + "/".join(segments)
+
+
+class Histogram:
+    """固定分桶的延迟直方图，可估算分位数"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, p) -> float:
+        """返回第 p 百分位所在分桶的上界 (最后一个分桶返回观测到的最大值)"""
+        target = p / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return 0.0
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = Counter()
+        self.request_bytes = 0
+        self.throttled = 0
+        self.retry_after_total = 0.0
+
+    def snapshot(self) -> Dict:
+        count = self.latency.count
+        return {
+            "count": count,
+            "errors": sum(n for status, n in self.statuses.items() if not 200 <= status < 400),
+            "throttled": self.throttled,
+            "statuses": dict(self.statuses),
+            "request_bytes": self.request_bytes,
+            "avg_ms": self.latency.total / count if count else 0.0,
+            "p50_ms": self.latency.percentile(50),
+            "p95_ms": self.latency.percentile(95),
+            "max_ms": self.latency.max,
+            "retry_after_s": self.retry_after_total,
+        }
+
+
+class GraphMetrics:
+    """Graph 请求与发送流程各阶段的计数器和延迟直方图 (线程安全)
+
+    每个 Graph 请求按端点记录状态码、请求字节数、延迟和 Retry-After；
+    渲染模板、编码附件等本地阶段用 record_stage 记录，便于区分慢在哪里。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.endpoints: Dict[str, EndpointStats] = {}
+            self.stages: Dict[str, Histogram] = {}
+            self.cache_hits = 0
+            self.started_at = time.time()
+
+    def record(self, method, url, status, request_bytes, latency, retry_after=None):
+        name = f"{method.upper()} {endpoint_name(url)}"
+        with self._lock:
+            stats = self.endpoints.setdefault(name, EndpointStats())
+            stats.latency.add(latency * 1000)
+            stats.statuses[status] += 1
+            stats.request_bytes += request_bytes
+            if status in THROTTLE_STATUSES:
+                stats.throttled += 1
+            if retry_after:
+                stats.retry_after_total += retry_after
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def record_stage(self, stage, seconds):
+        with self._lock:
+            self.stages.setdefault(stage, Histogram(STAGE_BUCKETS_MS)).add(seconds * 1000)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "elapsed_s": time.time() - self.started_at,
+                "cache_hits": self.cache_hits,
+                "endpoints": {name: stats.snapshot() for name, stats in self.endpoints.items()},
+                "stages": {
+                    stage: {"count": h.count, "avg_ms": h.total / h.count if h.count else 0.0, "p95_ms": h.percentile(95)}
+                    for stage, h in self.stages.items()
+                },
+            }
+
+    def status_line(self) -> str:
+        """进度显示用的一行摘要"""
+        snap = self.snapshot()
+        count = sum(e["count"] for e in snap["endpoints"].values())
+        if not count:
+            return ""
+        avg = sum(e["avg_ms"] * e["count"] for e in snap["endpoints"].values()) / count
+        throttled = sum(e["throttled"] for e in snap["endpoints"].values())
+        return f"Graph 平均 {avg:.0f} ms · 限流 {throttled} 次"
+
+    def report(self) -> str:
+        """活动结束时的文字报告"""
+        snap = self.snapshot()
+        lines = [f"耗时 {snap['elapsed_s']:.1f} 秒，缓存命中 {snap['cache_hits']} 次"]
+        for name, e in sorted(snap["endpoints"].items(), key=lambda item: -item[1]["count"]):
+            lines.append(
+                f"{name}: {e['count']} 次, 失败 {e['errors']}, 限流 {e['throttled']}, "
+                f"平均 {e['avg_ms']:.0f} ms, P95 ≤ {e['p95_ms']:.0f} ms, 最大 {e['max_ms']:.0f} ms, "
+                f"上传 {e['request_bytes'] / 1024:.0f} KB"
+                + (f", Retry-After 共 {e['retry_after_s']:.0f} 秒" if e["retry_after_s"] else "")
+            )
+        for stage, s in snap["stages"].items():
+            lines.append(f"{stage}: {s['count']} 次, 平均 {s['avg_ms']:.1f} ms, P95 ≤ {s['p95_ms']:.0f} ms")
+        return "\n".join(lines)
+
+    def log_performance(self, operation="Graph 活动"):
+        """把当前统计写入性能日志 (logs/performance.log)"""
+        from src.log_collector import log_performance
+        snap = self.snapshot()
+        log_performance(operation, snap["elapsed_s"], snap)
+
+
+# Process-wide collector shared by the API helpers and the mail worker
+metrics = GraphMetrics()
+
+
+def _retry_after(response) -> Optional[float]:
+    value = getattr(response, "headers", {}).get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def timed_request(http, method, url, **kwargs):
+    """执行 requests 请求并记录到 metrics，http 为 requests 模块或 Session"""
+    start = time.perf_counter()
+    try:
+        response = getattr(http, method)(url, **kwargs)
+    except Exception:
+        metrics.record(method, url, 0, 0, time.perf_counter() - start)
+        raise
+    prepared = getattr(response, "request", None)
+    body = getattr(prepared, "body", None) or b""
+    metrics.record(method, url, response.status_code, len(body), time.perf_counter() - start, _retry_after(response))
+    return response
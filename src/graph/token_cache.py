@@ -0,0 +1,147 @@
+import os
+import time
+
+import msal
+
+TOKEN_CACHE_FILE = "token_cache.json"
+LOCK_TIMEOUT = 10  # seconds to wait for another process to release the cache
+STALE_LOCK_AGE = 60  # a lock file older than this was left behind by a crashed process
+REPLACE_RETRIES = 10  # Windows refuses to replace a file another process has open
+REPLACE_RETRY_DELAY = 0.05
+
+
+class FileLock:
+    """跨进程互斥锁：以独占方式创建锁文件，释放时删除"""
+
+    def __init__(self, lock_path, timeout=LOCK_TIMEOUT):
+        self.lock_path = lock_path
+        self.timeout = timeout
+
+    def acquire(self) -> bool:
+        """获取锁，超时返回 False"""
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > STALE_LOCK_AGE:
+                        os.remove(self.lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    pass
+                if time.time() > deadline:
+                    return False
+                time.sleep(0.05)
+                continue
+            except OSError as e:
+                print(f"[DEBUG] Cannot create token cache lock {self.lock_path}: {e}")
+                return False
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+
+    def release(self):
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+
+class SharedTokenCache(msal.SerializableTokenCache):
+    """多个进程共享的持久化 MSAL 令牌缓存
+
+    读写缓存文件都在文件锁内进行，重新读取和修改都在 MSAL 自身的锁 (self._lock) 内完成，
+    因此同一进程的多个线程和并行运行的多个进程都能复用彼此刷新过的令牌进行静默登录。
+    文件暂时无法读写 (锁超时、Windows 上文件被占用) 时只记录日志并继续使用内存中的缓存，
+    不会让 MSAL 的 acquire_token_* 调用因此失败。
+    """
+
+    def __init__(self, path=TOKEN_CACHE_FILE):
+        super().__init__()
+        self.path = path
+        self._file_lock = FileLock(path + ".lock")
+        self._synced_mtime = None
+        self._sync_from_disk()
+
+    def _disk_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_if_changed(self):
+        """文件被其他进程更新过时重新读取；调用方须持有文件锁"""
+        mtime = self._disk_mtime()
+        if mtime is None or mtime == self._synced_mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.deserialize(f.read())
+            self._synced_mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"[DEBUG] Token cache reload failed, using the in-memory cache: {e}")
+
+    def _sync_from_disk(self):
+        with self._lock:
+            # Cheap check first: only take the file lock when the file actually changed
+            mtime = self._disk_mtime()
+            if mtime is None or mtime == self._synced_mtime:
+                return
+            if not self._file_lock.acquire():
+                print("[DEBUG] Token cache is locked by another process, using the in-memory cache")
+                return
+            try:
+                self._load_if_changed()
+            finally:
+                self._file_lock.release()
+
+    def _persist(self):
+        """原子写入缓存文件；失败时记录日志并保留 has_state_changed 以便下次再写"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.serialize())
+            for attempt in range(REPLACE_RETRIES):
+                try:
+                    os.replace(tmp_path, self.path)
+                    break
+                except PermissionError:
+                    if attempt == REPLACE_RETRIES - 1:
+                        raise
+                    time.sleep(REPLACE_RETRY_DELAY)
+            self._synced_mtime = self._disk_mtime()
+            self.has_state_changed = False
+        except OSError as e:
+            print(f"[DEBUG] Token cache not persisted: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def modify(self, credential_type, old_entry, new_key_value_pairs=None):
+        with self._lock:
+            locked = self._file_lock.acquire()
+            if not locked:
+                print("[DEBUG] Token cache lock unavailable; change kept in memory only")
+            try:
+                if locked:
+                    self._load_if_changed()
+                super().modify(credential_type, old_entry, new_key_value_pairs)
+                if locked:
+                    self._persist()
+            finally:
+                if locked:
+                    self._file_lock.release()
+
+    def find(self, credential_type, **kwargs):
+        self._sync_from_disk()
+        return super().find(credential_type, **kwargs)
+
+    if hasattr(msal.SerializableTokenCache, "search"):
+        # Newer MSAL looks tokens up through search() instead of find()
+        def search(self, credential_type, **kwargs):
+            self._sync_from_disk()
+            yield from super().search(credential_type, **kwargs)
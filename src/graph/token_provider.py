@@ -0,0 +1,93 @@
+import time
+import threading
+from typing import Callable, Optional
+
+# Refresh this many seconds before the token expires
+REFRESH_MARGIN = 300
+# Retry delay after a failed background refresh
+RETRY_DELAY = 30
+
+
+class TokenProvider:
+    """访问令牌及其过期时间的持有者
+
+    token() 总是返回当前有效的令牌，快过期时先静默刷新；start() 启动的后台线程
+    会在过期前 REFRESH_MARGIN 秒通过 MSAL 静默刷新，长时间运行的发送任务因此
+    不会因为令牌过期而中途失败。刷新只使用缓存中的刷新令牌 (应用认证模式下使用
+    客户端凭据)，不会弹出任何界面。
+    """
+
+    def __init__(self, acquire_silent: Callable[[bool], Optional[dict]]):
+        # acquire_silent(force_refresh) returns an MSAL result dict or None
+        self._acquire_silent = acquire_silent
+        self._lock = threading.Lock()
+        self._token = None
+        self.last_error = None
+        self._expires_at = 0.0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def set_result(self, result):
+        """保存 MSAL 返回的结果 (access_token + expires_in)"""
+        with self._lock:
+            self._token = result["access_token"]
+            self._expires_at = time.time() + int(result.get("expires_in", 3600))
+        self._wake.set()
+
+    def expires_in(self) -> float:
+        return self._expires_at - time.time()
+
+    def token(self) -> Optional[str]:
+        """返回有效令牌；即将过期时当场静默刷新，无法获取时返回 None"""
+        if self._token and self.expires_in() > REFRESH_MARGIN:
+            return self._token
+        self.refresh()
+        return self._token if self._token and self.expires_in() > 0 else None
+
+    def refresh(self, force=False) -> bool:
+        """静默刷新令牌；force=True 时即使未过期也向服务器重新申请 (例如收到 401 后)"""
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not force and self._token and self.expires_in() > REFRESH_MARGIN:
+                return True
+            try:
+                result = self._acquire_silent(force)
+                if not force and result and int(result.get("expires_in", 0)) <= REFRESH_MARGIN:
+                    # The cached token is about to expire; ask for a new one right away
+                    result = self._acquire_silent(True)
+            except Exception as e:
+                print(f"[DEBUG] Silent token refresh failed: {e}")
+                self.last_error = str(e)
+                return False
+            if not result or "access_token" not in result:
+                self.last_error = (result or {}).get("error_description")
+                return False
+            self.last_error = None
+            self._token = result["access_token"]
+            self._expires_at = time.time() + int(result.get("expires_in", 3600))
+        print(f"[DEBUG] Access token refreshed, valid for {int(self.expires_in())} s")
+        return True
+
+    def start(self):
+        """启动后台刷新线程 (重复调用无副作用)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            delay = max(self.expires_in() - REFRESH_MARGIN, 0)
+            # Woken early when a new token is set or the provider is stopped
+            if self._wake.wait(delay):
+                self._wake.clear()
+                continue
+            if not self.refresh():
+                self._wake.wait(RETRY_DELAY)
+                self._wake.clear()
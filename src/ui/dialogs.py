@@ -1,13 +1,18 @@
 import os
+import queue
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox,
     QTextEdit, QTableWidget, QTableWidgetItem, QHeaderView, QRadioButton,
-    QButtonGroup, QCheckBox, QWidget, QHBoxLayout, QAbstractItemView
+    QButtonGroup, QCheckBox, QHBoxLayout, QAbstractItemView, QComboBox, QFileDialog, QTableView
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QObject, Signal, QThread, QTimer
 from PySide6.QtGui import QFont, QGuiApplication
-from src.graph.api import fetch_group_members
+from src.graph.api import iter_group_members, merge_members, fetch_member_count
+from src.ui.models import GroupTableModel, GroupFilterProxyModel
+from src.ui.threads import detach_thread
+from src.data.recipient_sets import RecipientSet, OPERATIONS, OP_EXCLUDE, combine, load_address_list
 
 class AuthDialog(QDialog):
     def __init__(self, user_code, verify_uri, parent=None):
@@ -49,8 +54,198 @@ class VerificationDialog(QDialog):
         layout.addWidget(text_area)
         layout.addWidget(ok_button)
 
+class RecipientReportDialog(QDialog):
+    """发送前的收件人校验报告，列出被拒绝的地址并确认是否继续"""
+    MAX_ROWS = 1000
+
+    def __init__(self, rejects, accepted_count, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("收件人地址校验")
+        self.setMinimumSize(600, 400)
+        layout = QVBoxLayout(self)
+        summary = QLabel(
+            f"有效且不重复的收件人: <b>{accepted_count}</b> 位<br>"
+            f"已排除: <b>{len(rejects)}</b> 条 (格式无效、为空或重复)"
+        )
+        layout.addWidget(summary)
+        
+        table = QTableWidget(min(len(rejects), self.MAX_ROWS), len(rejects.columns))
+        table.setHorizontalHeaderLabels(list(rejects.columns))
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        for i, row in enumerate(rejects.head(self.MAX_ROWS).itertuples(index=False)):
+            for j, value in enumerate(row):
+                table.setItem(i, j, QTableWidgetItem(str(value)))
+        layout.addWidget(table)
+        if len(rejects) > self.MAX_ROWS:
+            layout.addWidget(QLabel(f"... 仅显示前 {self.MAX_ROWS} 条"))
+        
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        continue_btn = QPushButton("排除以上地址并继续")
+        continue_btn.setEnabled(accepted_count > 0)
+        continue_btn.clicked.connect(self.accept)
+        cancel_btn = QPushButton("取消")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(continue_btn)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+
+def member_recipient(group, member, field_mapper=None):
+    """群组成员转换为收件人记录，字段映射中配置的成员属性放入 fields 作为模板变量"""
+    return {
+        'fields': field_mapper.member_field_values(member) if field_mapper else {},
+        'name': member['displayName'],
+        'email': member['email'],
+        'type': 'member',
+        'group_name': group['displayName'],
+        'group_description': group.get('description', ''),
+        'group_email': group['mail'] or '',
+        'group_id': group['id'],  # Add group_id for members too
+        'job_title': member.get('jobTitle') or '',
+        'department': member.get('department') or '',
+        'member_type': '成员' if not member.get('isOwner') else '所有者'
+    }
+
+class MemberFetchWorker(QObject):
+    """在后台并发获取多个群组的成员
+
+    每个群组由线程池中的一个线程逐页读取，已读取人数和完成的群组通过信号逐步通知界面。
+    """
+    group_progress = Signal(str, int)  # group id, members read so far
+    group_done = Signal(str, list)     # group id, members
+    finished = Signal()
+    cancelled = Signal()
+    error = Signal(str)
+
+    MAX_WORKERS = 8
+    PROGRESS_EVERY = 200
+
+    def __init__(self, token_provider, groups, transitive=False, directory_cache=None, select=None):
+        super().__init__()
+        # A fetch can outlive one access token; each group asks the provider for a current one
+        self.token_provider, self.groups, self.transitive = token_provider, groups, transitive
+        self.directory_cache = directory_cache
+        self.select = select
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _fetch_group(self, group):
+        # Queued groups still run after a cancel or an error; they must not start any request
+        if self._cancelled:
+            return None
+        if self.directory_cache is not None:
+            members = self.directory_cache.members(group['id'], self.transitive)
+            if members is not None:
+                return members
+        members = []
+        for member in iter_group_members(self.token_provider.token(), group['id'], self.transitive, self.select):
+            if self._cancelled:
+                return None
+            members.append(member)
+            if len(members) % self.PROGRESS_EVERY == 0:
+                self.group_progress.emit(group['id'], len(members))
+        if self.directory_cache is not None:
+            self.directory_cache.store_members(group['id'], self.transitive, members)
+        return members
+
+    def run(self):
+        failure = None
+        pool = ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(self.groups)) or 1)
+        try:
+            futures = {pool.submit(self._fetch_group, group): group for group in self.groups}
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    members = future.result()
+                except Exception as e:
+                    # Stop the running groups at their next member
+                    self._cancelled = True
+                    failure = (group, e)
+                    break
+                if members is not None:
+                    self.group_done.emit(group['id'], members)
+        finally:
+            # Groups that have not started yet are dropped instead of being fetched on shutdown
+            pool.shutdown(wait=True, cancel_futures=True)
+        if failure:
+            group, e = failure
+            self.error.emit(f"获取群组 {group['displayName']} 的成员失败:\n{e}")
+        elif self._cancelled:
+            self.cancelled.emit()
+        else:
+            self.finished.emit()
+
+class MemberCountWorker(QObject):
+    """在后台用 $count 获取群组人数
+
+    界面线程可随时通过 request() 追加群组 (例如滚动到新的可见行)，
+    请求由小线程池并发执行，结果逐个通过 count_ready 通知界面。
+    """
+    count_ready = Signal(str, bool, int)  # group id, transitive, user count
+    count_failed = Signal(str, bool)
+    finished = Signal()
+
+    MAX_WORKERS = 4
+
+    def __init__(self, token_provider):
+        super().__init__()
+        # The dialog may stay open past the token lifetime; every request asks for a current token
+        self.token_provider = token_provider
+        self._queue = queue.Queue()
+        self._cancelled = False
+
+    def request(self, group_ids, transitive):
+        for group_id in group_ids:
+            self._queue.put((group_id, transitive))
+
+    def cancel(self):
+        self._cancelled = True
+        self._queue.put(None)
+
+    def _count(self, group_id, transitive):
+        if self._cancelled:
+            return
+        try:
+            count = fetch_member_count(self.token_provider.token(), group_id, transitive)
+        except Exception as e:
+            print(f"[DEBUG] Member count failed for group {group_id}: {e}")
+            if not self._cancelled:
+                self.count_failed.emit(group_id, transitive)
+            return
+        if not self._cancelled:
+            self.count_ready.emit(group_id, transitive, count)
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+            while True:
+                item = self._queue.get()
+                if item is None or self._cancelled:
+                    break
+                pool.submit(self._count, *item)
+        self.finished.emit()
+
+class AddressListLoadWorker(QObject):
+    """在后台读取名单文件，大文件不会阻塞界面"""
+    loaded = Signal(str, object)  # path, RecipientSet
+    error = Signal(str, str)      # path, message
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def run(self):
+        try:
+            addresses = load_address_list(self.path)
+        except Exception as e:
+            self.error.emit(self.path, str(e))
+            return
+        self.loaded.emit(self.path, addresses)
+
 class GroupSelectionDialog(QDialog):
-    def __init__(self, groups, parent=None, previous_selections=None, previous_sending_mode="group"):
+    def __init__(self, groups, parent=None, previous_selections=None, previous_sending_mode="group", include_nested=False):
         super().__init__(parent)
         self.setWindowTitle("选择Microsoft 365群组")
         self.setMinimumSize(700, 500)
@@ -58,6 +253,16 @@ class GroupSelectionDialog(QDialog):
         self.selected_recipients = []
         self.sending_mode = previous_sending_mode  # Restore previous sending mode
         self.previous_selections = previous_selections or []  # Store previous selections
+        self.include_nested = include_nested
+        self.field_mapper = getattr(parent, 'field_mapper', None)
+        # Members fetched during preview are reused by accept; keyed by (group id, transitive)
+        self.member_cache = {}
+        # User counts from $count, keyed like member_cache; requested only for rows on screen
+        self.member_counts = {}
+        self._count_requested = set()
+        self.fetch_thread, self.fetch_worker = None, None
+        self.count_thread, self.count_worker = None, None
+        self._accept_groups = None
         
         layout = QVBoxLayout(self)
         
@@ -67,48 +272,34 @@ class GroupSelectionDialog(QDialog):
         )
         layout.addWidget(info_label)
         
+        # 搜索框
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("搜索群组名称或邮箱 (多个关键词用空格分隔)")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self._on_search_changed)
+        layout.addWidget(self.search_input)
+        
         # 群组列表
-        self.group_table = QTableWidget()
-        self.group_table.setColumnCount(4)
-        self.group_table.setHorizontalHeaderLabels(["选择", "群组名称", "群组邮箱", "成员数"])
+        self.group_model = GroupTableModel(groups, self)
+        self.group_proxy = GroupFilterProxyModel(self)
+        self.group_proxy.setSourceModel(self.group_model)
+        self.group_table = QTableView()
+        self.group_table.setModel(self.group_proxy)
         self.group_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.group_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
         self.group_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
         self.group_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        self.group_table.verticalHeader().setVisible(False)
+        self.group_table.verticalHeader().setDefaultSectionSize(24)
+        self.group_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.group_table.setShowGrid(False)
         
-        # 填充群组数据
-        self.group_table.setRowCount(len(groups))
-        self.group_checkboxes = []
-        
-        for i, group in enumerate(groups):
-            # 选择框
-            checkbox = QCheckBox()
-            self.group_checkboxes.append(checkbox)
-            
-            # Center the checkbox in the cell
-            cell_widget = QWidget()
-            cell_layout = QHBoxLayout(cell_widget)
-            cell_layout.addWidget(checkbox)
-            cell_layout.setAlignment(Qt.AlignCenter)
-            cell_layout.setContentsMargins(0,0,0,0)
-            cell_widget.setLayout(cell_layout)
-            self.group_table.setCellWidget(i, 0, cell_widget)
-            
-            # 群组名称
-            name_item = QTableWidgetItem(group['displayName'])
-            name_item.setFlags(name_item.flags() & ~Qt.ItemIsEditable)
-            self.group_table.setItem(i, 1, name_item)
-            
-            # 群组邮箱
-            email_item = QTableWidgetItem(group['mail'])
-            email_item.setFlags(email_item.flags() & ~Qt.ItemIsEditable)
-            self.group_table.setItem(i, 2, email_item)
-            
-            # 成员数量（暂不获取，等用户选择时再获取）
-            member_count_item = QTableWidgetItem("点击预览查看")
-            member_count_item.setFlags(member_count_item.flags() & ~Qt.ItemIsEditable)
-            self.group_table.setItem(i, 3, member_count_item)
+        # 成员数在群组滚动到可见区域时才请求，滚动停下后再统一发出
+        self._count_timer = QTimer(self)
+        self._count_timer.setSingleShot(True)
+        self._count_timer.setInterval(150)
+        self._count_timer.timeout.connect(self._request_visible_counts)
+        self.group_table.verticalScrollBar().valueChanged.connect(lambda _: self._count_timer.start())
         
         layout.addWidget(self.group_table)
         
@@ -127,6 +318,12 @@ class GroupSelectionDialog(QDialog):
         
         mode_group.addWidget(self.group_radio)
         mode_group.addWidget(self.members_radio)
+        
+        self.nested_checkbox = QCheckBox("包含嵌套群组中的成员")
+        self.nested_checkbox.setToolTip("展开所选群组中嵌套的子群组，多个群组中重复的成员只保留一次")
+        self.nested_checkbox.setChecked(include_nested)
+        self.nested_checkbox.toggled.connect(self._on_nested_toggled)
+        mode_group.addWidget(self.nested_checkbox)
         layout.addLayout(mode_group)
         
         # 预览区域
@@ -144,6 +341,10 @@ class GroupSelectionDialog(QDialog):
         preview_btn = QPushButton("预览收件人")
         preview_btn.clicked.connect(self.preview_recipients)
         
+        self.stop_fetch_btn = QPushButton("停止获取")
+        self.stop_fetch_btn.setVisible(False)
+        self.stop_fetch_btn.clicked.connect(lambda: self._cancel_member_fetch())
+        
         ok_btn = QPushButton("确认选择")
         ok_btn.clicked.connect(self.accept_selection)
         
@@ -151,6 +352,7 @@ class GroupSelectionDialog(QDialog):
         cancel_btn.clicked.connect(self.reject)
         
         button_layout.addWidget(preview_btn)
+        button_layout.addWidget(self.stop_fetch_btn)
         button_layout.addStretch()
         button_layout.addWidget(ok_btn)
         button_layout.addWidget(cancel_btn)
@@ -173,77 +375,103 @@ class GroupSelectionDialog(QDialog):
             self.group_radio.setChecked(True)
             print("[DEBUG] Set to group mode")
         
-        # Restore group selections
-        first_selected_row = -1
-        if self.previous_selections:
-            print(f"[DEBUG] Processing {len(self.previous_selections)} previous selections")
-            
-            # Debug: Print structure of first selection and first group
-            if self.previous_selections:
-                print(f"[DEBUG] First selection structure: {self.previous_selections[0]}")
-            if self.groups:
-                print(f"[DEBUG] First group structure: {self.groups[0]}")
-            
-            # Create multiple ways to match groups
-            for i, group in enumerate(self.groups):
-                group_id = group.get('id')
-                group_name = group.get('displayName')
-                group_email = group.get('mail')
-                
-                # Check if this group matches any previous selection
-                is_selected = False
-                for selection in self.previous_selections:
-                    # Try matching by group_id first
-                    if selection.get('group_id') == group_id:
-                        is_selected = True
-                        break
-                    # Try matching by id 
-                    elif selection.get('id') == group_id:
-                        is_selected = True
-                        break
-                    # Try matching by name
-                    elif selection.get('group_name') == group_name:
-                        is_selected = True
-                        break
-                    # Try matching by email
-                    elif selection.get('group_email') == group_email or selection.get('email') == group_email:
-                        is_selected = True
-                        break
-                
-                if is_selected:
-                    # Check this group
-                    self.group_checkboxes[i].setChecked(True)
-                    if first_selected_row == -1:
-                        first_selected_row = i
-                    print(f"[DEBUG] Restored selection for group: {group_name} (row {i})")
+        # Restore group selections: one pass over the groups with set lookups
+        ids, names, emails = set(), set(), set()
+        for selection in self.previous_selections:
+            ids.update((selection.get('group_id'), selection.get('id')))
+            names.add(selection.get('group_name'))
+            emails.update((selection.get('group_email'), selection.get('email')))
+        for values in (ids, names, emails):
+            values.difference_update((None, ''))
+        restored = [
+            group['id'] for group in self.groups
+            if group.get('id') in ids or group.get('displayName') in names or group.get('mail') in emails
+        ]
+        self.group_model.set_checked_ids(restored)
+        print(f"[DEBUG] Restored {len(restored)} of {len(self.previous_selections)} previous selections")
         
         # Scroll to first selected group
-        if first_selected_row >= 0:
+        if restored:
+            first_selected_row = self.group_model.row_of(restored[0])
             # Use QTimer to delay the scroll to ensure the UI is fully rendered
-            from PySide6.QtCore import QTimer
             QTimer.singleShot(100, lambda: self._scroll_to_row(first_selected_row))
         else:
             print("[DEBUG] No groups to scroll to")
+        QTimer.singleShot(0, self._request_visible_counts)
     
     def _scroll_to_row(self, row):
         """Scroll to the specified row"""
         try:
-            self.group_table.scrollToItem(
-                self.group_table.item(row, 1), 
-                QAbstractItemView.ScrollHint.PositionAtCenter
-            )
+            index = self.group_proxy.mapFromSource(self.group_model.index(row, 1))
+            if index.isValid():
+                self.group_table.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
             print(f"[DEBUG] Scrolled to row {row}")
         except Exception as e:
             print(f"[DEBUG] Failed to scroll: {e}")
     
+    def _selected_groups(self):
+        return self.group_model.checked_groups()
+    
+    def _on_search_changed(self, text):
+        self.group_proxy.set_query(text)
+        self._count_timer.start()
+    
+    def _visible_groups(self):
+        """当前筛选结果中显示在可视区域内的群组"""
+        rows = self.group_proxy.rowCount()
+        top = self.group_table.rowAt(0)
+        if not rows or top < 0:
+            return []
+        bottom = self.group_table.rowAt(self.group_table.viewport().height() - 1)
+        bottom = rows - 1 if bottom < 0 else bottom
+        return [self.group_model.group(self.group_proxy.mapToSource(self.group_proxy.index(row, 0)).row())
+                for row in range(top, bottom + 1)]
+    
+    def _request_visible_counts(self):
+        parent = self.parent()
+        if parent is None or not getattr(parent, 'access_token', None):
+            return
+        wanted = [group['id'] for group in self._visible_groups()
+                  if self._cache_key(group) not in self._count_requested and self._cache_key(group) not in self.member_cache]
+        if not wanted:
+            return
+        if self.count_worker is None:
+            self.count_thread = QThread()
+            self.count_worker = MemberCountWorker(parent.token_provider)
+            self.count_worker.moveToThread(self.count_thread)
+            self.count_thread.started.connect(self.count_worker.run)
+            self.count_worker.count_ready.connect(self._on_member_count)
+            self.count_worker.count_failed.connect(self._on_member_count_failed)
+            self.count_thread.start()
+        transitive = self.nested_checkbox.isChecked()
+        self._count_requested.update((group_id, transitive) for group_id in wanted)
+        for group_id in wanted:
+            self._set_member_count(group_id, "统计中...")
+        self.count_worker.request(wanted, transitive)
+    
+    def _on_member_count(self, group_id, transitive, count):
+        if self.sender() is not self.count_worker: return
+        self.member_counts[(group_id, transitive)] = count
+        # A full member fetch gives the exact recipient count; keep that one
+        if transitive == self.nested_checkbox.isChecked() and (group_id, transitive) not in self.member_cache:
+            self._set_member_count(group_id, f"{count} 人" if count else "无成员")
+    
+    def _on_member_count_failed(self, group_id, transitive):
+        if self.sender() is not self.count_worker: return
+        # Requested again the next time the row scrolls into view
+        self._count_requested.discard((group_id, transitive))
+        if (group_id, transitive) not in self.member_cache:
+            self._set_member_count(group_id, "")
+    
+    def _stop_count_worker(self):
+        if self.count_worker:
+            self.count_worker.cancel()
+        detach_thread(self.count_thread, self.count_worker)
+        self.count_thread = self.count_worker = None
+    
     def preview_recipients(self):
         """预览将要发送邮件的收件人"""
-        selected_groups = []
-        
-        for i, checkbox in enumerate(self.group_checkboxes):
-            if checkbox.isChecked():
-                if i < len(self.groups):
-                    selected_groups.append(self.groups[i])
+        selected_groups = self._selected_groups()
         
         if not selected_groups:
             self.preview_text.setPlainText("请先选择至少一个群组")
@@ -254,51 +482,145 @@ class GroupSelectionDialog(QDialog):
             preview_text = "发送方式: 群组邮箱地址\n\n收件人:\n"
             for group in selected_groups:
                 preview_text += f"• {group['displayName']} ({group['mail']})\n"
-        else:
-            # 发送到成员个人邮箱 - 现在才获取成员列表
-            preview_text = "发送方式: 群组成员个人邮箱\n\n正在获取成员列表..."
             self.preview_text.setPlainText(preview_text)
-            
-            all_members = []
-            parent_app = self.parent()
-            
-            for group in selected_groups:
-                print(f"Debug: Fetching members for group: {group['displayName']}")
-                members = fetch_group_members(parent_app, group['id'])
-                
-                # 更新表格中的成员数量显示
-                for i, table_group in enumerate(self.groups):
-                    if table_group['id'] == group['id']:
-                        count_text = f"{len(members)} 人" if members else "无成员"
-                        member_count_item = QTableWidgetItem(count_text)
-                        member_count_item.setFlags(member_count_item.flags() & ~Qt.ItemIsEditable)
-                        self.group_table.setItem(i, 3, member_count_item)
-                        break
-                
-                for member in members:
-                    member_copy = member.copy()
-                    member_copy['group_name'] = group['displayName']
-                    # 避免重复成员
-                    if not any(m['id'] == member_copy['id'] for m in all_members):
-                        all_members.append(member_copy)
-            
-            if all_members:
-                preview_text = f"发送方式: 群组成员个人邮箱\n\n总共 {len(all_members)} 位收件人:\n\n"
-                for member in all_members[:10]:  # 只显示前10个成员
-                    preview_text += f"• {member['displayName']} ({member['email']}) - 来自 {member['group_name']}\n"
-                if len(all_members) > 10:
-                    preview_text += f"... 还有 {len(all_members) - 10} 位成员\n"
-            else:
-                preview_text = "发送方式: 群组成员个人邮箱\n\n未找到群组成员，请检查权限设置。"
+        else:
+            # 发送到成员个人邮箱 - 现在才获取成员列表 (已获取的群组直接复用)
+            self._start_member_fetch(selected_groups)
+            self._render_member_preview()
+    
+    def _cache_key(self, group):
+        return (group['id'], self.nested_checkbox.isChecked())
+    
+    def _cached_members(self, groups):
+        """已获取群组的成员，跨群组按 id 和邮箱去重"""
+        return merge_members((group, self.member_cache[self._cache_key(group)])
+                             for group in groups if self._cache_key(group) in self.member_cache)
+    
+    def _render_member_preview(self):
+        selected_groups = self._selected_groups()
+        pending = [group for group in selected_groups if self._cache_key(group) not in self.member_cache]
+        # 避免重复成员
+        all_members = self._cached_members(selected_groups)
         
+        if all_members:
+            preview_text = f"发送方式: 群组成员个人邮箱\n\n总共 {len(all_members)} 位收件人:\n\n"
+            for group, member in all_members[:10]:  # 只显示前10个成员
+                preview_text += f"• {member['displayName']} ({member['email']}) - 来自 {group['displayName']}\n"
+            if len(all_members) > 10:
+                preview_text += f"... 还有 {len(all_members) - 10} 位成员\n"
+        elif not pending:
+            preview_text = "发送方式: 群组成员个人邮箱\n\n未找到群组成员，请检查权限设置。"
+        else:
+            preview_text = "发送方式: 群组成员个人邮箱\n\n"
+        if pending:
+            preview_text += f"\n正在获取成员列表... (剩余 {len(pending)} 个群组)"
         self.preview_text.setPlainText(preview_text)
     
+    def _set_member_count(self, group_id, text):
+        self.group_model.set_member_count(group_id, text)
+    
+    def _start_member_fetch(self, groups):
+        """在后台获取尚未缓存的群组成员，全部已缓存时返回 False"""
+        missing = [group for group in groups if self._cache_key(group) not in self.member_cache]
+        if not missing:
+            return False
+        # The previous fetch winds down on its own; groups it already finished are still kept
+        self._cancel_member_fetch(detach=True)
+        for group in missing:
+            self._set_member_count(group['id'], "获取中...")
+        self.fetch_thread = QThread()
+        self.fetch_worker = MemberFetchWorker(
+            self.parent().token_provider, missing, self.nested_checkbox.isChecked(),
+            getattr(self.parent(), 'directory_cache', None),
+            self.field_mapper.member_select_fields() if self.field_mapper else None
+        )
+        self.fetch_worker.moveToThread(self.fetch_thread)
+        self.fetch_thread.started.connect(self.fetch_worker.run)
+        self.fetch_worker.group_progress.connect(self._on_group_progress)
+        self.fetch_worker.group_done.connect(self._on_group_done)
+        self.fetch_worker.finished.connect(self._on_member_fetch_finished)
+        self.fetch_worker.cancelled.connect(self._on_member_fetch_cancelled)
+        self.fetch_worker.error.connect(self._on_member_fetch_error)
+        self.stop_fetch_btn.setVisible(True)
+        self.fetch_thread.start()
+        return True
+    
+    def _cancel_member_fetch(self, detach=False):
+        """停止当前的成员获取；detach 时不等取消完成，立即放开该线程"""
+        if self.fetch_worker:
+            self.fetch_worker.cancel()
+            if detach:
+                self._end_member_fetch()
+    
+    def _end_member_fetch(self):
+        detach_thread(self.fetch_thread, self.fetch_worker)
+        self.fetch_thread = self.fetch_worker = None
+        self.stop_fetch_btn.setVisible(False)
+    
+    def _is_current_fetch(self):
+        # Ignore queued signals from a worker that has since been replaced
+        return self.sender() is not None and self.sender() is self.fetch_worker
+    
+    def _on_group_progress(self, group_id, count):
+        if not self._is_current_fetch(): return
+        self._set_member_count(group_id, f"已读取 {count} 人...")
+    
+    def _on_group_done(self, group_id, members):
+        worker = self.sender()
+        if worker is None: return
+        # A group completed by a replaced or cancelled fetch is still a valid result; keep it
+        key = (group_id, worker.transitive)
+        self.member_cache[key] = members
+        if key != (group_id, self.nested_checkbox.isChecked()):
+            return
+        self._set_member_count(group_id, f"{len(members)} 人" if members else "无成员")
+        if self._accept_groups is None and self.members_radio.isChecked():
+            self._render_member_preview()
+    
+    def _on_member_fetch_finished(self):
+        if not self._is_current_fetch(): return
+        self._end_member_fetch()
+        if self._accept_groups is not None:
+            self._finish_accept()
+    
+    def _on_member_fetch_cancelled(self):
+        if not self._is_current_fetch(): return
+        self._end_member_fetch()
+        self._accept_groups = None
+        self._refresh_member_counts()
+        self.preview_text.append("\n已停止获取成员列表")
+    
+    def _on_member_fetch_error(self, message):
+        if not self._is_current_fetch(): return
+        self._end_member_fetch()
+        self._accept_groups = None
+        QMessageBox.warning(self, "获取成员失败", message)
+    
+    def _refresh_member_counts(self):
+        for group in self.groups:
+            key = self._cache_key(group)
+            members = self.member_cache.get(key)
+            if members is not None:
+                self._set_member_count(group['id'], f"{len(members)} 人" if members else "无成员")
+            elif key in self.member_counts:
+                count = self.member_counts[key]
+                self._set_member_count(group['id'], f"{count} 人" if count else "无成员")
+            else:
+                self._set_member_count(group['id'], "统计中..." if key in self._count_requested else "")
+        self._count_timer.start()
+    
+    def _on_nested_toggled(self, checked):
+        self.include_nested = checked
+        # A running fetch belongs to the other mode; stop it and drop any pending accept
+        self._cancel_member_fetch(detach=True)
+        self._accept_groups = None
+        self._refresh_member_counts()
+        if self.members_radio.isChecked():
+            self.preview_text.clear()
+    
     def accept_selection(self):
         """确认选择并准备收件人数据"""
-        selected_groups = []
-        for i, checkbox in enumerate(self.group_checkboxes):
-            if checkbox.isChecked():
-                selected_groups.append(self.groups[i])
+        selected_groups = self._selected_groups()
         
         if not selected_groups:
             QMessageBox.warning(self, "提示", "请至少选择一个群组")
@@ -319,23 +641,249 @@ class GroupSelectionDialog(QDialog):
                     'group_email': group['mail'] or '',
                     'group_id': group['id']
                 })
+            self.accept()
         else:
-            # 使用群组成员的个人邮箱
-            parent_app = self.parent()
-            for group in selected_groups:
-                members = fetch_group_members(parent_app, group['id'])
-                for member in members:
-                    self.selected_recipients.append({
-                        'name': member['displayName'],
-                        'email': member['email'],
-                        'type': 'member',
-                        'group_name': group['displayName'],
-                        'group_description': group.get('description', ''),
-                        'group_email': group['mail'] or '',
-                        'group_id': group['id'],  # Add group_id for members too
-                        'job_title': member.get('jobTitle', ''),
-                        'department': member.get('department', ''),
-                        'member_type': '成员' if not member.get('isOwner') else '所有者'
-                    })
-        
-        self.accept()
\ No newline at end of file
+            # 使用群组成员的个人邮箱，预览时已获取的群组不再重复请求
+            self._accept_groups = selected_groups
+            if self._start_member_fetch(selected_groups):
+                self.preview_text.setPlainText("正在获取成员列表，完成后将自动确认...")
+            else:
+                self._finish_accept()
+    
+    def _finish_accept(self):
+        groups, self._accept_groups = self._accept_groups, None
+        # Members of overlapping groups are listed once, under the first group they appear in
+        for group, member in self._cached_members(groups):
+            self.selected_recipients.append(member_recipient(group, member, self.field_mapper))
+        self.accept()
+    
+    def done(self, result):
+        self._cancel_member_fetch(detach=True)
+        self._stop_count_worker()
+        super().done(result)
+
+class RecipientSetDialog(QDialog):
+    """组合收件人：按步骤对群组成员、已加载的工作表和名单文件做并入、交集和排除"""
+
+    def __init__(self, groups, sheets, parent=None, include_nested=False):
+        # sheets: {显示名称: (DataFrame, 邮箱列, 姓名列)}
+        super().__init__(parent)
+        self.setWindowTitle("组合收件人")
+        self.setMinimumSize(650, 450)
+        self.groups = {group['id']: group for group in groups}
+        self.sheets = sheets
+        self.include_nested = include_nested
+        self.field_mapper = getattr(parent, 'field_mapper', None)
+        self.sources = [("group", group['id'], f"群组: {group['displayName']}") for group in groups]
+        self.sources += [("sheet", name, f"工作表: {name}") for name in sheets]
+        self.list_sets = {}
+        self.group_members = {}
+        self.fetch_thread, self.fetch_worker = None, None
+        self.list_thread, self.list_worker = None, None
+        self._accept_when_ready = False
+        self.selected_recipients = []
+        
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(
+            "按顺序组合收件人来源，例如: 群组 A，并入 工作表 X，再排除 群组 B。\n"
+            "第一步作为初始集合，邮箱地址不区分大小写去重。"
+        ))
+        
+        self.step_table = QTableWidget(0, 2)
+        self.step_table.setHorizontalHeaderLabels(["运算", "来源"])
+        self.step_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        self.step_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.step_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        layout.addWidget(self.step_table)
+        
+        step_buttons = QHBoxLayout()
+        add_btn = QPushButton("添加步骤")
+        add_btn.clicked.connect(lambda: self._add_step())
+        self.list_btn = list_btn = QPushButton("添加名单文件...")
+        list_btn.setToolTip("文本文件每行一个地址；表格文件取所有包含 @ 的单元格")
+        list_btn.clicked.connect(self._add_list_file)
+        remove_btn = QPushButton("删除所选步骤")
+        remove_btn.clicked.connect(self._remove_steps)
+        step_buttons.addWidget(add_btn)
+        step_buttons.addWidget(list_btn)
+        step_buttons.addWidget(remove_btn)
+        step_buttons.addStretch()
+        layout.addLayout(step_buttons)
+        
+        self.result_label = QLabel("")
+        layout.addWidget(self.result_label)
+        
+        button_layout = QHBoxLayout()
+        compute_btn = QPushButton("计算人数")
+        compute_btn.clicked.connect(lambda: self._compute())
+        ok_btn = QPushButton("确认")
+        ok_btn.clicked.connect(lambda: self._compute(accept=True))
+        cancel_btn = QPushButton("取消")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(compute_btn)
+        button_layout.addStretch()
+        button_layout.addWidget(ok_btn)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+        
+        if self.sources:
+            self._add_step()
+    
+    def _add_step(self, source_index=0, op=None):
+        row = self.step_table.rowCount()
+        self.step_table.insertRow(row)
+        op_combo = QComboBox()
+        op_combo.addItems(OPERATIONS)
+        if op:
+            op_combo.setCurrentText(op)
+        source_combo = QComboBox()
+        source_combo.addItems([label for _, _, label in self.sources])
+        source_combo.setCurrentIndex(source_index)
+        self.step_table.setCellWidget(row, 0, op_combo)
+        self.step_table.setCellWidget(row, 1, source_combo)
+    
+    def _remove_steps(self):
+        for row in sorted({index.row() for index in self.step_table.selectedIndexes()}, reverse=True):
+            self.step_table.removeRow(row)
+    
+    def _add_list_file(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "选择名单文件", "", "名单文件 (*.txt *.lst *.csv *.tsv *.xlsx *.xls *.parquet);;所有文件 (*)"
+        )
+        if not path or self.list_worker:
+            return
+        self.list_btn.setEnabled(False)
+        self.result_label.setText(f"正在读取名单文件 {os.path.basename(path)}...")
+        self.list_thread = QThread()
+        self.list_worker = AddressListLoadWorker(path)
+        self.list_worker.moveToThread(self.list_thread)
+        self.list_thread.started.connect(self.list_worker.run)
+        self.list_worker.loaded.connect(self._on_list_loaded)
+        self.list_worker.error.connect(self._on_list_error)
+        self.list_thread.start()
+    
+    def _end_list_load(self):
+        detach_thread(self.list_thread, self.list_worker)
+        self.list_thread = self.list_worker = None
+        self.list_btn.setEnabled(True)
+        self.result_label.setText("")
+    
+    def _on_list_error(self, path, message):
+        if self.sender() is None or self.sender() is not self.list_worker: return
+        self._end_list_load()
+        QMessageBox.critical(self, "读取失败", f"无法读取名单文件:\n{message}")
+    
+    def _on_list_loaded(self, path, addresses):
+        if self.sender() is None or self.sender() is not self.list_worker: return
+        self._end_list_load()
+        self.list_sets[path] = addresses
+        self.sources.append(("list", path, f"名单: {os.path.basename(path)} ({len(self.list_sets[path])} 个地址)"))
+        for row in range(self.step_table.rowCount()):
+            self.step_table.cellWidget(row, 1).addItem(self.sources[-1][2])
+        # Lists are usually suppression lists
+        self._add_step(len(self.sources) - 1, OP_EXCLUDE)
+    
+    def _steps(self):
+        return [
+            (self.step_table.cellWidget(row, 0).currentText(), self.sources[self.step_table.cellWidget(row, 1).currentIndex()])
+            for row in range(self.step_table.rowCount())
+        ]
+    
+    def _source_set(self, kind, key):
+        if kind == "group":
+            group = self.groups[key]
+            return RecipientSet.from_records(member_recipient(group, member, self.field_mapper) for member in self.group_members[key])
+        if kind == "sheet":
+            df, email_col, name_col = self.sheets[key]
+            return RecipientSet.from_frame(df, email_col, name_col, key)
+        return self.list_sets[key]
+    
+    def _compute(self, accept=False):
+        steps = self._steps()
+        if not steps:
+            QMessageBox.warning(self, "提示", "请至少添加一个步骤")
+            return
+        
+        directory_cache = getattr(self.parent(), 'directory_cache', None)
+        missing = []
+        for _, (kind, key, _) in steps:
+            if kind != "group" or key in self.group_members:
+                continue
+            members = directory_cache.members(key, self.include_nested) if directory_cache is not None else None
+            if members is None:
+                missing.append(self.groups[key])
+            else:
+                self.group_members[key] = members
+        if missing:
+            self._start_member_fetch(missing, accept)
+            return
+        
+        result = combine([(op, self._source_set(kind, key)) for op, (kind, key, _) in steps])
+        self.result_label.setText(f"结果: <b>{len(result)}</b> 位收件人")
+        if accept:
+            if not len(result):
+                QMessageBox.warning(self, "提示", "组合结果中没有收件人")
+                return
+            self.selected_recipients = result.records()
+            self.accept()
+    
+    def _start_member_fetch(self, groups, accept):
+        if self.fetch_worker:
+            self._accept_when_ready = self._accept_when_ready or accept
+            return
+        self._accept_when_ready = accept
+        self.result_label.setText(f"正在获取 {len(groups)} 个群组的成员...")
+        self.fetch_thread = QThread()
+        self.fetch_worker = MemberFetchWorker(
+            self.parent().token_provider, groups, self.include_nested,
+            getattr(self.parent(), 'directory_cache', None),
+            self.field_mapper.member_select_fields() if self.field_mapper else None
+        )
+        self.fetch_worker.moveToThread(self.fetch_thread)
+        self.fetch_thread.started.connect(self.fetch_worker.run)
+        self.fetch_worker.group_done.connect(self._on_group_done)
+        self.fetch_worker.finished.connect(self._on_fetch_finished)
+        self.fetch_worker.cancelled.connect(self._on_fetch_cancelled)
+        self.fetch_worker.error.connect(self._on_fetch_error)
+        self.fetch_thread.start()
+    
+    def _end_member_fetch(self):
+        detach_thread(self.fetch_thread, self.fetch_worker)
+        self.fetch_thread = self.fetch_worker = None
+    
+    def _is_current_fetch(self):
+        # Ignore queued signals from a worker that has since been stopped
+        return self.sender() is not None and self.sender() is self.fetch_worker
+    
+    def _on_group_done(self, group_id, members):
+        # Every fetch in this dialog uses the same nesting mode, so any completed group is usable
+        self.group_members[group_id] = members
+    
+    def _on_fetch_finished(self):
+        if not self._is_current_fetch(): return
+        self._end_member_fetch()
+        self._compute(self._accept_when_ready)
+    
+    def _on_fetch_cancelled(self):
+        if not self._is_current_fetch(): return
+        self._end_member_fetch()
+        self._accept_when_ready = False
+        self.result_label.setText("")
+    
+    def _on_fetch_error(self, message):
+        if not self._is_current_fetch(): return
+        self._end_member_fetch()
+        self.result_label.setText("")
+        QMessageBox.warning(self, "获取成员失败", message)
+    
+    def reject(self):
+        if self.fetch_worker:
+            self.fetch_worker.cancel()
+            self._end_member_fetch()
+        super().reject()
+    
+    def done(self, result):
+        if self.list_worker:
+            # The read can't be interrupted; the thread is released once it returns
+            self._end_list_load()
+        super().done(result)
@@ -1,4 +1,4 @@
-import sys, os, time, json, atexit, base64, mimetypes, webbrowser, re
+import sys, os, time, json, base64, mimetypes, webbrowser, re, itertools
 from datetime import datetime
 import pandas as pd
 import requests, msal
@@ -9,17 +9,34 @@ from PySide6.QtWidgets import (
     QTextEdit, QLineEdit, QFileDialog, QComboBox, QMessageBox, QFrame,
     QDialog, QProgressBar, QListWidget, QListWidgetItem, QStyle,
     QTableWidget, QTableWidgetItem, QHeaderView, QRadioButton, QButtonGroup, QCheckBox,
-    QScrollArea, QGroupBox, QTabWidget, QSizePolicy, QSplitter
+    QScrollArea, QGroupBox, QTabWidget, QSizePolicy, QSplitter, QListView, QAbstractItemView
 )
-from PySide6.QtCore import QObject, Signal, QThread, Qt
+from PySide6.QtCore import QObject, Signal, QThread, Qt, QTimer, QFileSystemWatcher
 from PySide6.QtGui import (
-    QFont, QGuiApplication, QPalette, QColor
+    QFont, QGuiApplication, QPalette, QColor, QAction, QKeySequence
 )
-from src.ui.dialogs import AuthDialog, VerificationDialog, GroupSelectionDialog
+from src.ui.dialogs import AuthDialog, VerificationDialog, GroupSelectionDialog, RecipientReportDialog, RecipientSetDialog
 from src.ui.tinymce_editor import TinyMCEEditor
-from src.graph.auth import ensure_token, _save_token_cache
-from src.graph.api import fetch_user_groups, fetch_group_members
+from src.ui.models import MemberListModel
+from src.ui.threads import detach_thread
+from src.graph.auth import (
+    ensure_token, ensure_send_token, silent_acquirer, client_acquirer, create_confidential_app,
+    app_credential_from_env, sender_mailboxes_from_env, sender_rotation_from_env
+)
+from src.graph.token_cache import SharedTokenCache
+from src.graph.token_provider import TokenProvider
+from src.graph.api import GraphAPIError
+from src.graph.directory_cache import DirectoryCache
+from src.graph import http_cache
+from src.graph.metrics import metrics, timed_request
 from src.config.field_mapper import FieldMapper
+from src.data.sheet_cache import SheetCache
+from src.data.compact import compact_frame, frame_memory, format_bytes
+from src.data.sources import open_source, file_dialog_filter, LoadCancelled
+from src.data.filter_engine import FilterEngine
+from src.data.filter_expr import compile_filter, FilterSyntaxError
+from src.data.sheet_diff import diff_frames
+from src.data.address_validation import prepare_recipients
 
 # Load environment variables
 load_dotenv()
@@ -35,11 +52,14 @@ class MailWorker(QObject):
     finished = Signal()
     error = Signal(str)
 
-    def __init__(self, token, df, email_col, name_col, subj_tpl, body_tpl_html, 
+    def __init__(self, token_provider, df, email_col, name_col, subj_tpl, body_tpl_html, 
                  common_attachments, personalized_attachments_map, 
-                 action, test_mode):
+                 action, test_mode, mailboxes=None, rotate=False):
         super().__init__()
-        self.access_token, self.df, self.email_col, self.name_col = token, df, email_col, name_col
+        self.token_provider, self.df, self.email_col, self.name_col = token_provider, df, email_col, name_col
+        # App-only mode sends as /users/{mailbox}: the first configured mailbox, or all of them
+        # in turn when rotation is switched on (AZURE_SENDER_ROTATE)
+        self.mailboxes = itertools.cycle(mailboxes if rotate else mailboxes[:1]) if mailboxes else None
         self.subj_tpl, self.body_tpl_html = subj_tpl, body_tpl_html
         self.common_attachments, self.personalized_attachments_map = common_attachments, personalized_attachments_map
         self.action, self.test_mode = action, test_mode
@@ -73,7 +93,9 @@ class MailWorker(QObject):
                 context.setdefault('部门', '')
                 context.setdefault('职位', '')
                 
+                render_start = time.perf_counter()
                 final_subject, final_body = subject_template.render(context), body_template.render(context)
+                metrics.record_stage("渲染模板", time.perf_counter() - render_start)
                 personalized_files = self.personalized_attachments_map.get(expert_name, [])
                 all_attachments = self.common_attachments + personalized_files
                 ok, msg = self._send_graph(to_addr, final_subject, final_body, all_attachments, self.action)
@@ -88,8 +110,8 @@ class MailWorker(QObject):
         self.finished.emit()
 
     def _send_graph(self, to_addr, subject, body_html, attachments, action):
-        headers = { "Authorization": f"Bearer {self.access_token}", "Content-Type": "application/json" }
         att_payload = []
+        encode_start = time.perf_counter()
         for fp in attachments:
             try:
                 with open(fp, "rb") as f: content_b64 = base64.b64encode(f.read()).decode()
@@ -97,42 +119,159 @@ class MailWorker(QObject):
                 att_payload.append({"@odata.type": "#microsoft.graph.fileAttachment", "name": os.path.basename(fp), "contentType": mime or "application/octet-stream", "contentBytes": content_b64})
             except Exception as e:
                 return False, f"附件 {os.path.basename(fp)} 处理失败: {e}"
+        if attachments:
+            metrics.record_stage("编码附件", time.perf_counter() - encode_start)
         message = {"subject": subject, "body": {"contentType": "HTML", "content": body_html}, "toRecipients": [{"emailAddress": {"address": to_addr}}], "attachments": att_payload}
+        sender = f"users/{next(self.mailboxes)}" if self.mailboxes else "me"
         if action == "SEND":
-            endpoint = f"https://graph.microsoft.com/v1.0/me/sendMail"
+            endpoint = f"https://graph.microsoft.com/v1.0/{sender}/sendMail"
             payload = {"message": message, "saveToSentItems": True}
-            r = requests.post(endpoint, headers=headers, json=payload)
         else:
-            endpoint = f"https://graph.microsoft.com/v1.0/me/messages"
-            r = requests.post(endpoint, headers=headers, json=message)
+            endpoint = f"https://graph.microsoft.com/v1.0/{sender}/messages"
+            payload = message
+        r = self._post(endpoint, payload)
+        if r.status_code == 401 and self.token_provider.refresh(force=True):
+            # Token revoked or expired early; retry once with a fresh one
+            r = self._post(endpoint, payload)
         if r.status_code in (200, 201, 202): return True, "Success"
         return False, f"{r.status_code}: {r.text}"
 
+    def _post(self, endpoint, payload):
+        # Fetch the token per request so a background refresh takes effect immediately
+        headers = { "Authorization": f"Bearer {self.token_provider.token()}", "Content-Type": "application/json" }
+        return timed_request(requests, "post", endpoint, headers=headers, json=payload)
+
+class SheetLoadWorker(QObject):
+    """Parse sheets of a data source off the GUI thread
+
+    With no explicit sheet list the worker first publishes the sheet names and then
+    loads only the first sheet; the remaining sheets are loaded on demand.
+    """
+    sheet_names_ready = Signal(list)
+    sheet_loaded = Signal(str, object, object, object)  # name, df, bytes before/after compaction
+    progress = Signal(str, int, int)  # sheet name, rows read, total rows (0 if unknown)
+    finished = Signal()
+    cancelled = Signal()
+    error = Signal(str)
+
+    def __init__(self, source, sheet_cache, use_cache, compact, sheet_names=None, load_names=None, generation=0):
+        super().__init__()
+        self.source, self.sheet_cache, self.use_cache, self.compact = source, sheet_cache, use_cache, compact
+        self.generation = generation
+        self.sheet_names, self.load_names = sheet_names, load_names
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        path = self.source.path
+        try:
+            # Taken before anything is read, so a file modified mid-load never matches its cache entry
+            fingerprint = self.sheet_cache.fingerprint(path) if self.use_cache else None
+            sheet_names = self.sheet_names
+            if sheet_names is None:
+                sheet_names = self.sheet_cache.sheet_names(path, fingerprint) if self.use_cache else None
+                if sheet_names is None:
+                    sheet_names = self.source.sheet_names()
+                self.sheet_names_ready.emit(list(sheet_names))
+            targets = [name for name in (self.load_names or []) if name in sheet_names] or sheet_names[:1]
+            for sheet_name in targets:
+                if self._cancelled:
+                    raise LoadCancelled()
+                self.progress.emit(sheet_name, 0, 0)
+                df = self.sheet_cache.load_sheet(path, sheet_name, fingerprint) if self.use_cache else None
+                if df is None:
+                    df = self.source.read_sheet(
+                        sheet_name,
+                        progress=lambda rows, total, name=sheet_name: self.progress.emit(name, rows, total),
+                        is_cancelled=self.is_cancelled
+                    )
+                    if self.use_cache:
+                        self.sheet_cache.store_sheet(path, sheet_name, df, sheet_names, fingerprint)
+                before = after = 0
+                if self.compact:
+                    before = frame_memory(df)
+                    df = compact_frame(df)
+                    after = frame_memory(df)
+                self.sheet_loaded.emit(sheet_name, df, before, after)
+        except LoadCancelled:
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit()
+
 class MailerApp(QWidget):
     def __init__(self):
         super().__init__()
-        self.df, self.access_token, self.thread, self.worker = None, None, None, None
+        self.df, self.thread, self.worker = None, None, None
+        self.filter_engine = None
+        self.load_thread, self.load_worker = None, None
+        # Loaders are never waited for: a replaced loader is detached and its results are
+        # dropped by generation, so the GUI stays responsive while it winds down
+        self._load_generation = 0
+        self.data_source, self.excel_sheets, self.sheet_names = None, {}, []
+        self._pending_sheet = None
+        self._reloading_sheet = None
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self._on_data_file_changed)
+        self._reload_timer = QTimer(self)
+        self._reload_timer.setSingleShot(True)
+        self._reload_timer.setInterval(800)  # Editors often write a file in several steps
+        self._reload_timer.timeout.connect(self._reload_changed_file)
+        # Filter keystrokes and preview refreshes are coalesced; the editor is updated once typing pauses
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(150)
+        self._filter_timer.timeout.connect(self.update_filtered_count)
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(100)
+        self._preview_timer.timeout.connect(self._update_preview_data)
         self.is_formal_send = False
         self.personalized_attachment_folder = None
         self.personalized_attachments_map = {}
         self.user_groups = []
         self.selected_group_recipients = []
-        self.member_checkboxes = []  # Initialize member checkboxes list
+        self.member_model = MemberListModel(self)  # Checkable rows of the member list view
         self.last_sending_mode = "group"  # Default sending mode
         self.field_mapper = FieldMapper()  # Initialize field mapper
-        self.token_cache = msal.SerializableTokenCache()
-        if os.path.exists(TOKEN_CACHE_FILE):
-            try:
-                with open(TOKEN_CACHE_FILE, "r", encoding="utf-8") as f: self.token_cache.deserialize(f.read())
-            except Exception as e: print("加载 token 缓存失败:", e)
-        atexit.register(lambda: _save_token_cache(self.token_cache))
+        # Persisted on every change under a file lock, so parallel sender processes share sign-ins
+        self.token_cache = SharedTokenCache(TOKEN_CACHE_FILE)
         self.msal_app = msal.PublicClientApplication(
             CLIENT_ID, authority=f"https://login.microsoftonline.com/{TENANT_ID}",
             token_cache=self.token_cache
         )
+        self.token_provider = TokenProvider(silent_acquirer(self.msal_app))
+        # Unattended sending: client credentials from .env, one app token shared by all send workers
+        self.app_token_provider, self.sender_mailboxes = None, sender_mailboxes_from_env()
+        self.rotate_senders = sender_rotation_from_env()
+        app_credential = app_credential_from_env()
+        if app_credential and self.sender_mailboxes:
+            self.app_token_provider = TokenProvider(client_acquirer(create_confidential_app(CLIENT_ID, TENANT_ID, app_credential)))
+            print(f"[DEBUG] App-only sending enabled for {len(self.sender_mailboxes)} mailbox(es)")
+        elif app_credential:
+            print("[DEBUG] Client credential found but AZURE_SENDER_MAILBOXES is empty; using delegated sign-in")
         self._load_settings()
+        self.sheet_cache = SheetCache(use_content_hash=self.settings.get("excel_cache_content_hash", False))
+        self.directory_cache = DirectoryCache(ttl=self.settings.get("directory_cache_ttl", 3600))
+        http_cache.configure(
+            ttl=self.settings.get("graph_cache_ttl", http_cache.DEFAULT_TTL),
+            max_bytes=self.settings.get("graph_cache_max_mb", 50) * 1024 * 1024
+        )
+        self.directory_cache.ensure_member_fields(self.field_mapper.member_select_fields())
         self._build_ui()
 
+    @property
+    def access_token(self):
+        """Current access token, refreshed silently when close to expiry"""
+        return self.token_provider.token()
+
     def _load_settings(self):
         if os.path.exists(SETTINGS_FILE):
             try:
@@ -350,11 +489,26 @@ class MailerApp(QWidget):
         file_layout = QVBoxLayout(file_section)
         
         file_load_layout = QHBoxLayout()
-        load_btn = QPushButton("加载 Excel 文件...")
+        load_btn = QPushButton("加载 Excel/CSV 文件...")
+        load_btn.setToolTip("支持 Excel (.xlsx/.xls)、CSV/TSV 和 Parquet 文件")
         load_btn.clicked.connect(self.load_excel)
         self.excel_label = QLabel("尚未加载Excel文件")
+        self.cancel_load_btn = QPushButton("取消加载")
+        self.cancel_load_btn.setVisible(False)
+        self.cancel_load_btn.clicked.connect(self._request_cancel_load)
+        self.auto_reload_checkbox = QCheckBox("自动重新加载")
+        self.auto_reload_checkbox.setToolTip("文件在外部修改后自动重新读取当前工作表，并保留列选择和筛选条件")
+        self.auto_reload_checkbox.setChecked(self.settings.get("auto_reload_data_file", False))
+        self.auto_reload_checkbox.toggled.connect(self._on_auto_reload_toggled)
+        self.compact_checkbox = QCheckBox("紧凑存储")
+        self.compact_checkbox.setToolTip("以分类/Arrow 字符串存储数据，降低大文件内存占用（下次加载生效）")
+        self.compact_checkbox.setChecked(self.settings.get("compact_string_storage", False))
+        self.compact_checkbox.toggled.connect(self._on_compact_storage_toggled)
         file_load_layout.addWidget(load_btn)
         file_load_layout.addWidget(self.excel_label, 1)
+        file_load_layout.addWidget(self.cancel_load_btn)
+        file_load_layout.addWidget(self.auto_reload_checkbox)
+        file_load_layout.addWidget(self.compact_checkbox)
         file_layout.addLayout(file_load_layout)
         
         # Column selection
@@ -388,8 +542,20 @@ class MailerApp(QWidget):
             filter_layout.addLayout(filter_row_layout)
             
             self.filters.append((col_combo, val_input))
-            col_combo.currentIndexChanged.connect(self.update_filtered_count)
-            val_input.textChanged.connect(self.update_filtered_count)
+            col_combo.currentIndexChanged.connect(lambda _: self._filter_timer.start())
+            val_input.textChanged.connect(lambda _: self._filter_timer.start())
+        
+        expr_row_layout = QHBoxLayout()
+        expr_row_layout.addWidget(QLabel("高级表达式:"))
+        self.filter_expr_input = QLineEdit()
+        self.filter_expr_input.setPlaceholderText('例如: 部门 = 销售 and (年龄 >= 30 or 城市 in ("北京", "上海"))')
+        self.filter_expr_input.setToolTip(
+            "支持 and / or / not、= != ~(正则) contains > >= < <= between ... and ... in (...)\n"
+            "数字和日期 (YYYY-MM-DD) 按数值/日期比较；列名含空格时写作 [列名]"
+        )
+        self.filter_expr_input.textChanged.connect(lambda _: self._filter_timer.start())
+        expr_row_layout.addWidget(self.filter_expr_input, 1)
+        filter_layout.addLayout(expr_row_layout)
         
         self.filtered_count_label = QLabel("筛选后将发送给: <b>...</b> 人")
         filter_layout.addWidget(self.filtered_count_label, 0, Qt.AlignmentFlag.AlignRight)
@@ -414,7 +580,15 @@ class MailerApp(QWidget):
         group_btn = QPushButton("选择 Microsoft 365 群组...")
         group_btn.clicked.connect(self.select_groups)
         self.group_label = QLabel("未选择群组收件人")
+        combine_btn = QPushButton("组合收件人...")
+        combine_btn.setToolTip("对群组成员、已加载的工作表和名单文件做并入、交集和排除")
+        combine_btn.clicked.connect(self.build_recipient_set)
+        clear_cache_btn = QPushButton("清除目录缓存")
+        clear_cache_btn.setToolTip("删除本地保存的群组、成员和 Graph 响应缓存（缓存文件未加密）")
+        clear_cache_btn.clicked.connect(self.clear_directory_caches)
         group_btn_layout.addWidget(group_btn)
+        group_btn_layout.addWidget(combine_btn)
+        group_btn_layout.addWidget(clear_cache_btn)
         group_btn_layout.addWidget(self.group_label, 1)
         group_section_layout.addLayout(group_btn_layout)
         
@@ -422,47 +596,37 @@ class MailerApp(QWidget):
         member_list_label = QLabel("群组成员列表:")
         group_section_layout.addWidget(member_list_label)
         
-        # Create scrollable area for member list - make it resizable vertically
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setMinimumHeight(100)  # Set reasonable minimum
-        # Remove setMaximumHeight to allow vertical resizing
-        scroll_area.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        
-        # Container widget for the member list
-        self.member_list_widget = QWidget()
-        self.member_list_layout = QVBoxLayout(self.member_list_widget)
-        self.member_list_layout.setSpacing(2)
-        self.member_list_layout.setContentsMargins(5, 5, 5, 5)
-        
         # Add "Select All/None" checkbox at the top
         select_all_layout = QHBoxLayout()
         self.select_all_checkbox = QCheckBox("全选/取消全选")
         self.select_all_checkbox.setChecked(True)  # Default to all selected
-        self.select_all_checkbox.stateChanged.connect(self.toggle_all_members)
+        # clicked is only emitted for user clicks, not for the state updates made by the count
+        self.select_all_checkbox.clicked.connect(self.toggle_all_members)
         select_all_layout.addWidget(self.select_all_checkbox)
         select_all_layout.addStretch()
-        self.member_list_layout.addLayout(select_all_layout)
-        
-        # Add separator
-        separator = QFrame()
-        separator.setFrameShape(QFrame.Shape.HLine)
-        separator.setFrameShadow(QFrame.Shadow.Sunken)
-        self.member_list_layout.addWidget(separator)
-        
-        # Member checkboxes will be added here dynamically
-        self.member_checkboxes = []
+        group_section_layout.addLayout(select_all_layout)
         
         # Add placeholder text when no members
         self.no_members_label = QLabel("请先选择群组以查看成员列表")
         self.no_members_label.setStyleSheet("color: gray; padding: 20px;")
-        self.member_list_layout.addWidget(self.no_members_label)
-        
-        # Add stretch to push items to top
-        self.member_list_layout.addStretch()
-        
-        scroll_area.setWidget(self.member_list_widget)
-        group_section_layout.addWidget(scroll_area)
+        group_section_layout.addWidget(self.no_members_label)
+        
+        # Virtualized list: only visible rows are painted, so very large groups load instantly
+        self.member_list_view = QListView()
+        self.member_list_view.setModel(self.member_model)
+        self.member_list_view.setUniformItemSizes(True)
+        self.member_list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.member_list_view.setMinimumHeight(100)
+        self.member_list_view.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.member_list_view.setToolTip("可多选后按空格键批量勾选/取消勾选")
+        toggle_rows_action = QAction(self.member_list_view)
+        toggle_rows_action.setShortcut(QKeySequence(Qt.Key_Space))
+        toggle_rows_action.setShortcutContext(Qt.WidgetShortcut)
+        toggle_rows_action.triggered.connect(self.toggle_selected_members)
+        self.member_list_view.addAction(toggle_rows_action)
+        self.member_list_view.hide()
+        group_section_layout.addWidget(self.member_list_view)
+        self.member_model.selection_changed.connect(self.update_member_selection_count)
         
         # Member count label
         self.member_count_label = QLabel("已选择: 0 位成员")
@@ -592,7 +756,7 @@ class MailerApp(QWidget):
     def _on_tab_changed(self, index):
         """Handle tab change to update variable dropdown"""
         # Update preview data when tab changes
-        self._update_preview_data()
+        self._schedule_preview_update()
     
     def open_field_config(self):
         """Open field configuration dialog"""
@@ -602,42 +766,223 @@ class MailerApp(QWidget):
             if dialog.exec() == QDialog.Accepted:
                 # Reload configuration and update UI
                 self.field_mapper = FieldMapper()  # Reload mapper with new config
-                self._update_preview_data()
+                self.directory_cache.ensure_member_fields(self.field_mapper.member_select_fields())
+                self._schedule_preview_update()
         except Exception as e:
             QMessageBox.critical(self, "错误", f"无法打开字段配置对话框:\n{str(e)}")
     
     def load_excel(self):
-        fp, _=QFileDialog.getOpenFileName(self, "选择Excel文件", "", "Excel Files (*.xlsx *.xls)")
+        fp, _=QFileDialog.getOpenFileName(self, "选择数据文件", "", file_dialog_filter())
         if not fp: return
         try:
-            # First, get all sheet names
-            import pandas as pd
-            excel_file = pd.ExcelFile(fp)
-            sheet_names = excel_file.sheet_names
-            
-            # Store the Excel file and sheet information
-            self.excel_file_path = fp
+            source = open_source(fp)
+        except ValueError as e:
+            QMessageBox.critical(self, "错误", f"读取数据文件失败：\n{e}")
+            return
+        
+        # Stop any loader still working on a previous file
+        self._cancel_sheet_loader()
+        
+        # Store the data source and sheet information
+        self.data_source = source
+        self.excel_file_path = fp
+        self.excel_sheets = {}
+        self.sheet_names = []
+        self.current_sheet = None
+        self._pending_sheet = None
+        self._sheet_load_stats = {"before": 0, "after": 0}
+        self._reloading_sheet = None
+        self.excel_label.setText(f"正在加载: {os.path.basename(fp)} ...")
+        self._update_file_watch()
+        
+        # Parse in the background; the first sheet is published as soon as it is ready
+        self._start_sheet_loader()
+    
+    def _start_sheet_loader(self, load_names=None, rediscover=False):
+        """Start a SheetLoadWorker for the current data source"""
+        self._cancel_sheet_loader()
+        source = self.data_source
+        use_cache = source.cacheable and self.settings.get("excel_cache_enabled", True) and self.sheet_cache.enabled
+        self._load_generation += 1
+        self.load_thread = QThread()
+        self.load_worker = SheetLoadWorker(
+            source, self.sheet_cache, use_cache, self.settings.get("compact_string_storage", False),
+            sheet_names=None if rediscover else (self.sheet_names or None), load_names=load_names,
+            generation=self._load_generation
+        )
+        self.load_worker.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.load_worker.run)
+        self.load_worker.sheet_names_ready.connect(self._on_sheet_names_ready)
+        self.load_worker.sheet_loaded.connect(self._on_sheet_loaded)
+        self.load_worker.progress.connect(self._on_sheet_load_progress)
+        self.load_worker.finished.connect(self._on_sheet_loader_done)
+        self.load_worker.cancelled.connect(self._on_sheet_load_cancelled)
+        self.load_worker.error.connect(self._on_sheet_load_error)
+        self.cancel_load_btn.setVisible(True)
+        self.load_thread.start()
+    
+    def _request_cancel_load(self):
+        # Ask the worker to stop at its next row chunk; cleanup happens in _on_sheet_load_cancelled
+        if self.load_worker:
+            self.load_worker.cancel()
+            self.excel_label.setText("正在取消加载...")
+    
+    def _cancel_sheet_loader(self):
+        if self.load_worker: self.load_worker.cancel()
+        self._end_sheet_loader()
+    
+    def _end_sheet_loader(self):
+        """Detach the current loader without blocking; it is cleaned up once its thread exits"""
+        # A sheet being parsed (e.g. legacy .xls) may not notice the cancel flag for a while
+        detach_thread(self.load_thread, self.load_worker)
+        self.load_thread = self.load_worker = None
+        self._load_generation += 1
+        self.cancel_load_btn.setVisible(False)
+        self.progress.setVisible(self.thread is not None)
+    
+    def _is_current_loader(self):
+        # Ignore queued signals from a loader that has since been replaced, cancelled or finished
+        sender = self.sender()
+        return sender is not None and sender is self.load_worker and sender.generation == self._load_generation
+    
+    def _on_sheet_names_ready(self, sheet_names):
+        if not self._is_current_loader(): return
+        if self._reloading_sheet is not None:
+            if sheet_names != self.sheet_names:
+                self.sheet_names = sheet_names
+                self._show_sheet_selection(sheet_names, selected=self._reloading_sheet)
+            if self._reloading_sheet in sheet_names:
+                return
+            # The current sheet no longer exists; fall back to a regular load of the first sheet
+            self._reloading_sheet = None
             self.excel_sheets = {}
-            self.current_sheet = None
-            
-            # Load all sheets
-            for sheet_name in sheet_names:
-                self.excel_sheets[sheet_name] = pd.read_excel(fp, sheet_name=sheet_name, dtype=str).fillna('')
-            
-            # Update the label to show sheet count
-            self.excel_label.setText(f"已加载: {os.path.basename(fp)} (共 {len(sheet_names)} 个工作表)")
-            
-            # Show sheet selection UI
-            self._show_sheet_selection(sheet_names)
-            
-            # Load the first sheet by default
-            if sheet_names:
-                self._select_sheet(sheet_names[0])
-            
-        except Exception as e: 
-            QMessageBox.critical(self, "错误", f"读取 Excel 失败：\n{e}")
+        self.sheet_names = sheet_names
+        self._pending_sheet = sheet_names[0] if sheet_names else None
+        self._show_sheet_selection(sheet_names)
+    
+    def _on_sheet_load_progress(self, sheet_name, rows, total):
+        if not self._is_current_loader() or self.thread is not None: return
+        self.progress.setVisible(True)
+        self.progress.setMaximum(total or 0)
+        self.progress.setValue(min(rows, total) if total else 0)
+        total_text = f"/{total}" if total else ""
+        self.excel_label.setText(f"正在加载 {os.path.basename(self.excel_file_path)} - {sheet_name}: {rows}{total_text} 行")
+    
+    def _on_sheet_loaded(self, sheet_name, df, before, after):
+        if not self._is_current_loader(): return
+        if sheet_name == self._reloading_sheet:
+            self._reloading_sheet = None
+            self._apply_reloaded_sheet(sheet_name, df)
+            return
+        self.excel_sheets[sheet_name] = df
+        self._sheet_load_stats["before"] += before
+        self._sheet_load_stats["after"] += after
+        if before:
+            print(f"[DEBUG] Compact storage ({sheet_name}): {before} -> {after} bytes")
+        self._update_excel_label()
+        if sheet_name == self._pending_sheet:
+            self._pending_sheet = None
+            self._select_sheet(sheet_name)
+    
+    def _on_sheet_loader_done(self):
+        if not self._is_current_loader(): return
+        self._end_sheet_loader()
+        self._update_excel_label()
+    
+    def _on_sheet_load_cancelled(self):
+        if not self._is_current_loader(): return
+        self._end_sheet_loader()
+        self._pending_sheet = self._reloading_sheet = None
+        self.excel_label.setText(f"已取消加载: {os.path.basename(self.excel_file_path)}")
+    
+    def _on_sheet_load_error(self, msg):
+        if not self._is_current_loader(): return
+        self._end_sheet_loader()
+        self._pending_sheet = self._reloading_sheet = None
+        QMessageBox.critical(self, "错误", f"读取数据文件失败：\n{msg}")
+        self._update_excel_label()
+    
+    def _update_excel_label(self):
+        """Show file name, loaded sheet count and compaction savings"""
+        if not getattr(self, 'excel_file_path', None): return
+        text = f"已加载: {os.path.basename(self.excel_file_path)} (共 {len(self.sheet_names)} 个工作表"
+        if len(self.excel_sheets) < len(self.sheet_names):
+            text += f"，已解析 {len(self.excel_sheets)} 个"
+        stats = getattr(self, '_sheet_load_stats', None)
+        if stats and stats["before"]:
+            text += f"，内存 {format_bytes(stats['before'])} → {format_bytes(stats['after'])}"
+        self.excel_label.setText(text + ")")
+    
+    def _on_auto_reload_toggled(self, checked):
+        self.settings["auto_reload_data_file"] = checked
+        self._save_settings()
+        self._update_file_watch()
+    
+    def _update_file_watch(self):
+        """Watch the loaded data file when auto reload is enabled"""
+        if self.file_watcher.files():
+            self.file_watcher.removePaths(self.file_watcher.files())
+        path = getattr(self, 'excel_file_path', None)
+        if self.auto_reload_checkbox.isChecked() and path and os.path.exists(path):
+            self.file_watcher.addPath(path)
+    
+    def _on_data_file_changed(self, path):
+        if path == getattr(self, 'excel_file_path', None):
+            # Debounce bursts of change notifications into a single reload
+            self._reload_timer.start()
+    
+    def _reload_changed_file(self):
+        """Re-parse only the current sheet after the data file changed on disk"""
+        path = getattr(self, 'excel_file_path', None)
+        if not path or self.df is None:
+            return
+        if not os.path.exists(path):
+            # Some editors replace the file by delete + rename; try again shortly
+            self._reload_timer.start()
+            return
+        # Atomic saves drop the watch, so re-arm it
+        self._update_file_watch()
+        if self.thread is not None or self.load_worker is not None or not self.current_sheet:
+            # Never swap data under a running campaign or an active load; retry later
+            if self.current_sheet: self._reload_timer.start()
+            return
+        print(f"[DEBUG] Data file changed, reloading sheet: {self.current_sheet}")
+        self.data_source = open_source(path)
+        # Other sheets are stale now and will be parsed again when selected
+        self.excel_sheets = {self.current_sheet: self.df}
+        self._reloading_sheet = self.current_sheet
+        self._start_sheet_loader(load_names=[self.current_sheet], rediscover=True)
+    
+    def _apply_reloaded_sheet(self, sheet_name, df):
+        """Swap in a re-parsed sheet while keeping column selections and filters
+
+        This is a plain reload: the filter engine is rebuilt for the new frame. The row diff
+        only reports what changed, and lets an unchanged file keep the current frame and engine.
+        """
+        old_df = self.excel_sheets.get(sheet_name)
+        diff = diff_frames(old_df, df) if old_df is not None else None
+        if diff is not None and diff.identical:
+            self._update_excel_label()
+            self.excel_label.setText(self.excel_label.text() + f" · 已重新加载 {sheet_name}: {diff.summary()}")
+            return
+        self.excel_sheets[sheet_name] = df
+        if sheet_name == self.current_sheet:
+            self.df = df
+            self.filter_engine = FilterEngine(df)
+            if diff is None or diff.columns_changed:
+                self._populate_column_combos(preserve=True)
+                self.body_editor.update_variable_dropdown(list(df.columns))
+            self.update_filtered_count()
+        self._update_excel_label()
+        if diff is not None:
+            print(f"[DEBUG] Reloaded {sheet_name}: {diff.summary()}")
+            self.excel_label.setText(self.excel_label.text() + f" · 已重新加载 {sheet_name}: {diff.summary()}")
+    
+    def _on_compact_storage_toggled(self, checked):
+        self.settings["compact_string_storage"] = checked
+        self._save_settings()
             
-    def _show_sheet_selection(self, sheet_names):
+    def _show_sheet_selection(self, sheet_names, selected=None):
         """Show sheet selection radio buttons"""
         # Clear existing sheet selection if any
         if hasattr(self, 'sheet_selection_layout'):
@@ -658,7 +1003,7 @@ class MailerApp(QWidget):
         
         for i, sheet_name in enumerate(sheet_names):
             radio_btn = QRadioButton(sheet_name)
-            if i == 0:  # Select first sheet by default
+            if sheet_name == selected or (i == 0 and selected not in sheet_names):  # Select first sheet by default
                 radio_btn.setChecked(True)
             radio_btn.toggled.connect(lambda checked, name=sheet_name: self._on_sheet_selected(checked, name))
             self.sheet_button_group.addButton(radio_btn)
@@ -669,8 +1014,14 @@ class MailerApp(QWidget):
             
     def _on_sheet_selected(self, checked, sheet_name):
         """Handle sheet selection change"""
-        if checked:
+        if not checked:
+            return
+        if sheet_name in self.excel_sheets:
             self._select_sheet(sheet_name)
+        else:
+            # Sheets other than the first are parsed lazily when first selected
+            self._pending_sheet = sheet_name
+            self._start_sheet_loader(load_names=[sheet_name])
             
     def _select_sheet(self, sheet_name):
         """Select and load data from specified sheet"""
@@ -679,13 +1030,10 @@ class MailerApp(QWidget):
             
         self.current_sheet = sheet_name
         self.df = self.excel_sheets[sheet_name]
+        self.filter_engine = FilterEngine(self.df)
         
         # Update UI with selected sheet data
-        columns = ["【不筛选】"] + list(self.df.columns)
-        self.email_combo.clear(); self.email_combo.addItems(self.df.columns)
-        self.name_combo.clear(); self.name_combo.addItems(self.df.columns)
-        for col_combo, _ in self.filters:
-            col_combo.clear(); col_combo.addItems(columns)
+        self._populate_column_combos()
         self.update_filtered_count()
         
         # Update toolbar variable dropdown with new Excel columns
@@ -696,7 +1044,24 @@ class MailerApp(QWidget):
         self.body_editor.update_variable_dropdown(list(self.df.columns))
         
         # Update preview data with first row from selected sheet
-        self._update_preview_data()
+        self._schedule_preview_update()
+        
+    def _populate_column_combos(self, preserve=False):
+        """Fill the name/email/filter combos with the current sheet's columns"""
+        columns = list(self.df.columns)
+        combos = [self.email_combo, self.name_combo] + [col_combo for col_combo, _ in self.filters]
+        previous = [combo.currentText() for combo in combos]
+        for combo in combos:
+            combo.blockSignals(preserve)
+        self.email_combo.clear(); self.email_combo.addItems(columns)
+        self.name_combo.clear(); self.name_combo.addItems(columns)
+        for col_combo, _ in self.filters:
+            col_combo.clear(); col_combo.addItems(["【不筛选】"] + columns)
+        if preserve:
+            for combo, text in zip(combos, previous):
+                index = combo.findText(text)
+                if index >= 0: combo.setCurrentIndex(index)
+                combo.blockSignals(False)
         
     def _clear_layout(self, layout):
         """Helper method to clear all widgets from a layout"""
@@ -707,28 +1072,53 @@ class MailerApp(QWidget):
             elif child.layout():
                 self._clear_layout(child.layout())
 
+    def _active_filters(self):
+        """Return the (column, text) pairs of all filter rows that are in use"""
+        conditions = []
+        for col_combo, val_input in self.filters:
+            col_name = col_combo.currentText()
+            filter_val = val_input.text().strip()
+            if col_name and col_name != "【不筛选】" and filter_val:
+                conditions.append((col_name, filter_val))
+        return conditions
+
+    def _filter_expression(self):
+        """Compile the advanced filter expression; returns None when empty, raises on errors"""
+        text = self.filter_expr_input.text().strip()
+        if not text: return None
+        expression = compile_filter(text)
+        missing = expression.missing_columns(self.df)
+        if missing:
+            raise KeyError(f"列不存在: {', '.join(missing)}")
+        return expression
+
     def get_filtered_df(self):
         if self.df is None: return None
-        filtered_df = self.df.copy()
         try:
-            for col_combo, val_input in self.filters:
-                col_name = col_combo.currentText()
-                filter_val = val_input.text().strip()
-                if col_name and col_name != "【不筛选】" and filter_val:
-                    filtered_df = filtered_df[filtered_df[col_name].str.contains(filter_val, case=False, na=False)]
-            return filtered_df
+            return self.filter_engine.filter(self._active_filters(), self._filter_expression())
         except Exception as e:
-            QMessageBox.critical(self, "筛选错误", f"应用筛选时出错:\n{e}"); return self.df
+            QMessageBox.critical(self, "筛选错误", f"应用筛选时出错:\n{e}"); return None
 
     def update_filtered_count(self):
-        df = self.get_filtered_df()
-        if df is not None: 
-            self.filtered_count_label.setText(f"筛选后将发送给: <b>{len(df)}</b> 人")
+        self._filter_timer.stop()
+        if self.df is not None and self.filter_engine is not None:
+            try:
+                # One mask evaluation gives both the count and the row shown in the preview
+                count, first_row = self.filter_engine.summary(self._active_filters(), self._filter_expression())
+            except (FilterSyntaxError, KeyError) as e:
+                # Report expression errors inline while the user is still typing
+                self.filter_expr_input.setStyleSheet("border: 1px solid #B22222;")
+                self.filter_expr_input.setToolTip(str(e).strip("'\""))
+                self.filtered_count_label.setText("筛选后将发送给: <b>表达式有误</b>")
+                return
+            self.filter_expr_input.setStyleSheet("")
+            self.filter_expr_input.setToolTip("")
+            self.filtered_count_label.setText(f"筛选后将发送给: <b>{count}</b> 人")
             # Update preview data when filters change
-            self._update_preview_data()
+            self._update_preview_data(first_row)
 
     def run_process(self, action: str, test_mode: bool):
-        if not ensure_token(self): return
+        if not ensure_send_token(self): return
         
         recipients_df = None
         recipient_source = None
@@ -751,8 +1141,8 @@ class MailerApp(QWidget):
                 
         elif current_tab == 1:  # Group tab
             # Check if we have member checkboxes (individual member mode)
-            if hasattr(self, 'member_checkboxes') and self.member_checkboxes:
-                # Use selected members from checkboxes
+            if self.member_model.rowCount():
+                # Use the members checked in the member list
                 selected_members = self.get_selected_group_members()
                 if not selected_members:
                     QMessageBox.warning(self, "提示", "请至少选择一位群组成员。")
@@ -762,6 +1152,7 @@ class MailerApp(QWidget):
                 group_data = []
                 for recipient in selected_members:
                     group_data.append({
+                        **recipient.get('fields', {}),  # Sheet columns of combined recipients
                         '姓名': recipient['name'],
                         '邮箱': recipient['email'],
                         'type': recipient.get('type', 'member'),
@@ -796,6 +1187,10 @@ class MailerApp(QWidget):
                 QMessageBox.warning(self, "提示", "请先在群组标签页中选择 Microsoft 365 群组收件人。")
                 return
         
+        # Edits made just before clicking send may not have reached the cached template yet
+        if not self.body_editor.flush_content():
+            QMessageBox.warning(self, "提示", "无法读取编辑器中的最新正文，请稍后重试。")
+            return
         subj_tpl = self.subject_input.text()
         body_tpl = self.body_editor.toHtml()
         if not all([subj_tpl, self.body_editor.toPlainText().strip()]):
@@ -812,6 +1207,16 @@ class MailerApp(QWidget):
             email_col = "邮箱"
             name_col = "姓名"
         
+        # Normalize, validate and deduplicate the address column before anything reaches Graph
+        recipients_df, rejects = prepare_recipients(recipients_df, email_col)
+        if not rejects.empty:
+            print(f"[DEBUG] Address validation rejected {len(rejects)} entries")
+            if RecipientReportDialog(rejects, len(recipients_df), self).exec() != QDialog.Accepted:
+                return
+        if recipients_df.empty:
+            QMessageBox.warning(self, "提示", "没有有效的收件人邮箱地址。")
+            return
+        
         if (test_mode and action == "SEND"):
             if QMessageBox.question(self, "测试确认", f"全部发送到测试邮箱 {TEST_SELF_EMAIL}？", QMessageBox.Yes | QMessageBox.No, QMessageBox.No) == QMessageBox.No: return
         if not test_mode:
@@ -823,19 +1228,26 @@ class MailerApp(QWidget):
         common_attachments = [self.att_list.item(i).text() for i in range(self.att_list.count())]
         self._lock_ui(True); self.progress.setMaximum(len(recipients_df)); self.progress.setValue(0); self.progress.setVisible(True)
         self.thread = QThread()
-        self.worker = MailWorker(self.access_token, recipients_df, email_col, name_col, subj_tpl, body_tpl, common_attachments, self.personalized_attachments_map, action, test_mode)
+        metrics.reset()
+        if self.app_token_provider:
+            self.worker = MailWorker(self.app_token_provider, recipients_df, email_col, name_col, subj_tpl, body_tpl, common_attachments, self.personalized_attachments_map, action, test_mode, self.sender_mailboxes, self.rotate_senders)
+        else:
+            self.worker = MailWorker(self.token_provider, recipients_df, email_col, name_col, subj_tpl, body_tpl, common_attachments, self.personalized_attachments_map, action, test_mode)
         self.worker.moveToThread(self.thread); self.thread.started.connect(self.worker.run); self.worker.progress.connect(self._on_progress); self.worker.error.connect(self._on_error); self.worker.finished.connect(self._on_finished); self.thread.start()
 
     def _on_progress(self, cur, total):
         self.progress.setValue(cur)
-        self.setWindowTitle(f'发送中 {cur}/{total}')
+        status = metrics.status_line()
+        self.setWindowTitle(f'发送中 {cur}/{total}' + (f' · {status}' if status else ''))
 
     def _on_error(self, msg):
-        QMessageBox.critical(self, "错误", msg)
+        metrics.log_performance("邮件活动 (中断)")
+        QMessageBox.critical(self, "错误", f"{msg}\n\n{metrics.report()}")
         self._end_thread()
 
     def _on_finished(self):
-        QMessageBox.information(self, "完成", "所有邮件已处理完毕！")
+        metrics.log_performance("邮件活动")
+        QMessageBox.information(self, "完成", f"所有邮件已处理完毕！\n\n{metrics.report()}")
         self._end_thread()
         if self.is_formal_send:
             self.reset_ui()
@@ -855,8 +1267,12 @@ class MailerApp(QWidget):
             col_combo.addItem("【不筛选】")
             col_combo.setCurrentIndex(0)
             val_input.clear()
+        self.filter_expr_input.clear()
         self.filtered_count_label.setText("筛选后将发送给: <b>...</b> 人")
         self.df = None
+        self.filter_engine = None
+        if self.file_watcher.files():
+            self.file_watcher.removePaths(self.file_watcher.files())
         self.user_groups = []
         self.selected_group_recipients = []
         self.last_sending_mode = "group"  # Reset to default
@@ -884,7 +1300,14 @@ class MailerApp(QWidget):
         if not ensure_token(self):
             return
         
-        if not fetch_user_groups(self):
+        # Served from the local directory cache; refreshed with a delta sync once the TTL expires
+        try:
+            self.user_groups = self.directory_cache.user_groups(self.access_token)
+        except GraphAPIError as e:
+            QMessageBox.critical(self, "获取群组失败", f"无法获取群组信息: {e}")
+            return
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"获取群组时发生错误:\n{e}")
             return
         
         if not self.user_groups:
@@ -897,12 +1320,15 @@ class MailerApp(QWidget):
             self.user_groups, 
             self, 
             previous_selections=self.selected_group_recipients,
-            previous_sending_mode=previous_sending_mode
+            previous_sending_mode=previous_sending_mode,
+            include_nested=self.settings.get("include_nested_groups", False)
         )
         if dialog.exec() == QDialog.Accepted:
             self.selected_group_recipients = dialog.selected_recipients
             # Store the sending mode for next time
             self.last_sending_mode = dialog.sending_mode
+            self.settings["include_nested_groups"] = dialog.include_nested
+            self._save_settings()
             
             if self.selected_group_recipients:
                 recipient_count = len(self.selected_group_recipients)
@@ -929,136 +1355,110 @@ class MailerApp(QWidget):
                 self.group_label.setText("未选择群组收件人")
                 self.populate_member_list([])
             
-            # Update preview data with group data - add a small delay to ensure data is ready
-            from PySide6.QtCore import QTimer
-            QTimer.singleShot(100, self._update_preview_data)
+            # Update preview data with group data once the dialog has closed
+            self._schedule_preview_update()
     
-    def populate_member_list(self, members):
-        """Populate the member list with checkboxes"""
-        # Clear existing member widgets properly
-        # Get all widgets except the fixed ones (select_all, separator, no_members_label, stretch)
-        items_to_remove = []
-        for i in range(self.member_list_layout.count()):
-            item = self.member_list_layout.itemAt(i)
-            if item and item.widget():
-                widget = item.widget()
-                # Don't remove our fixed widgets
-                if widget not in [self.select_all_checkbox.parent(), self.no_members_label]:
-                    # Check if this widget contains checkboxes
-                    if hasattr(widget, 'findChildren') and widget.findChildren(QCheckBox):
-                        items_to_remove.append(widget)
-        
-        # Remove the member widgets
-        for widget in items_to_remove:
-            widget.setParent(None)
-            widget.deleteLater()
-        
-        # Clear checkbox list
-        self.member_checkboxes.clear()
-        
-        # Hide/show the placeholder
-        if members:
-            self.no_members_label.hide()
-            print(f"[DEBUG] Adding {len(members)} members to list")
-        else:
-            self.no_members_label.show()
-            self.member_count_label.setText("已选择: 0 位成员")
-            print("[DEBUG] No members to display")
+    def clear_directory_caches(self):
+        """清空本地的目录缓存和 Graph 响应缓存"""
+        reply = QMessageBox.question(self, "清除目录缓存",
+                                     "将删除本地缓存的群组、成员和 Graph 响应，下次使用时重新从服务器读取。\n是否继续？")
+        if reply != QMessageBox.Yes:
+            return
+        try:
+            self.directory_cache.clear()
+            cache = http_cache.get_cache()
+            if cache is not None:
+                cache.clear()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"清除缓存失败：\n{e}")
+            return
+        QMessageBox.information(self, "完成", "目录缓存已清除")
+    
+    def build_recipient_set(self):
+        """Combine groups, loaded sheets and address lists into one recipient list"""
+        if not ensure_token(self):
+            return
+        try:
+            self.user_groups = self.directory_cache.user_groups(self.access_token)
+        except GraphAPIError as e:
+            QMessageBox.critical(self, "获取群组失败", f"无法获取群组信息: {e}")
+            return
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"获取群组时发生错误:\n{e}")
             return
         
-        # Add member checkboxes
-        for i, member in enumerate(members):
-            # Create a container widget for each member
-            member_widget = QWidget()
-            member_layout = QHBoxLayout(member_widget)
-            member_layout.setContentsMargins(20, 5, 5, 5)
-            member_layout.setSpacing(10)
-            
-            # Create checkbox
-            checkbox = QCheckBox()
-            checkbox.setChecked(True)  # Default to checked
-            
-            # Store member data with checkbox
-            checkbox.member_data = member
-            
-            # Create label with name and email on same line
-            name = member.get('name', '未知姓名')
-            email = member.get('email', '未知邮箱')
-            member_info = QLabel(f"{name} ({email})")
-            member_info.setWordWrap(False)  # Keep on one line
-            member_info.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
-            
-            # Add widgets to layout
-            member_layout.addWidget(checkbox)
-            member_layout.addWidget(member_info)
-            member_layout.addStretch()
-            
-            # Add the member widget to the layout before the stretch
-            insert_index = self.member_list_layout.count() - 1  # Before the stretch
-            self.member_list_layout.insertWidget(insert_index, member_widget)
-            
-            # Connect the signal using a lambda to avoid signal conflicts
-            checkbox.stateChanged.connect(lambda state, cb=checkbox: self.on_member_checkbox_changed(cb))
-            
-            self.member_checkboxes.append(checkbox)
-            print(f"[DEBUG] Added member {i+1}: {name}")
+        # Loaded sheets that contain the selected email column; the current sheet uses its active filters
+        sheets = {}
+        email_col, name_col = self.email_combo.currentText(), self.name_combo.currentText()
+        for sheet_name, df in self.excel_sheets.items():
+            if sheet_name == self.current_sheet and self.df is not None:
+                df = self.get_filtered_df()
+            if df is not None and email_col in df.columns:
+                sheets[sheet_name] = (df, email_col, name_col)
         
-        # Update count
-        self.update_member_selection_count()
-        print(f"[DEBUG] Final member list has {len(self.member_checkboxes)} checkboxes")
+        dialog = RecipientSetDialog(self.user_groups, sheets, self, include_nested=self.settings.get("include_nested_groups", False))
+        if dialog.exec() == QDialog.Accepted:
+            self.selected_group_recipients = dialog.selected_recipients
+            self.last_sending_mode = "members"
+            self.group_label.setText(f"已组合 {len(self.selected_group_recipients)} 位收件人")
+            self.populate_member_list(self.selected_group_recipients)
+            self._schedule_preview_update()
     
-    def on_member_checkbox_changed(self, checkbox):
-        """Handle individual member checkbox changes"""
-        print(f"[DEBUG] Checkbox changed: {checkbox.isChecked()}")
-        self.update_member_selection_count()
+    def populate_member_list(self, members):
+        """Show the members in the list view, all checked by default"""
+        self.member_model.set_members(members)
+        self.no_members_label.setVisible(not members)
+        self.member_list_view.setVisible(bool(members))
+        if not members:
+            self.member_count_label.setText("已选择: 0 位成员")
+        print(f"[DEBUG] Member list shows {len(members)} members")
     
-    def toggle_all_members(self, state):
-        """Toggle all member checkboxes"""
-        is_checked = state == 2  # Qt.Checked = 2
-        print(f"[DEBUG] Toggle all members: {is_checked}")
-        
-        # Set all checkboxes - the lambda connection should handle this cleanly
-        for checkbox in self.member_checkboxes:
-            checkbox.setChecked(is_checked)
-        
-        # Update count will be called by individual checkbox signals
+    def toggle_all_members(self, checked):
+        """Check or uncheck every member"""
+        # A click on the partially checked box arrives as checked=False; treat it as "select all"
+        if 0 < self.member_model.checked_count() < self.member_model.rowCount():
+            checked = True
+        self.member_model.set_all_checked(checked)
+    
+    def toggle_selected_members(self):
+        """Flip the check state of the highlighted rows to the opposite of the current row"""
+        rows = [index.row() for index in self.member_list_view.selectionModel().selectedIndexes()]
+        current = self.member_list_view.currentIndex()
+        if not rows and current.isValid():
+            rows = [current.row()]
+        if not rows:
+            return
+        anchor = current.row() if current.isValid() else rows[0]
+        checked = self.member_model.data(self.member_model.index(anchor), Qt.CheckStateRole) != Qt.Checked
+        self.member_model.set_rows_checked(rows, checked)
     
-    def update_member_selection_count(self):
-        """Update the count of selected members"""
-        selected_count = sum(1 for cb in self.member_checkboxes if cb.isChecked())
-        total_count = len(self.member_checkboxes)
+    def update_member_selection_count(self, selected_count, total_count):
+        """Update the count label and the select-all box from the model's running count"""
         self.member_count_label.setText(f"已选择: {selected_count}/{total_count} 位成员")
-        
-        # Update select all checkbox state without triggering its signal
-        try:
-            self.select_all_checkbox.stateChanged.disconnect()
-        except TypeError:
-            # Already disconnected or no connections
-            pass
-        
         if selected_count == 0:
-            self.select_all_checkbox.setChecked(False)
+            self.select_all_checkbox.setCheckState(Qt.CheckState.Unchecked)
         elif selected_count == total_count:
-            self.select_all_checkbox.setChecked(True)
+            self.select_all_checkbox.setCheckState(Qt.CheckState.Checked)
         else:
-            # Set to partially checked state
             self.select_all_checkbox.setTristate(True)
             self.select_all_checkbox.setCheckState(Qt.CheckState.PartiallyChecked)
+            # Users can't cycle into the partial state; a click from it selects all (toggle_all_members)
             self.select_all_checkbox.setTristate(False)
-        
-        # Reconnect the signal
-        self.select_all_checkbox.stateChanged.connect(self.toggle_all_members)
     
     def get_selected_group_members(self):
-        """Get list of selected members from checkboxes"""
-        selected_members = []
-        for checkbox in self.member_checkboxes:
-            if checkbox.isChecked() and hasattr(checkbox, 'member_data'):
-                selected_members.append(checkbox.member_data)
-        return selected_members
+        """Get list of checked members"""
+        return self.member_model.selected_members()
 
-    def _update_preview_data(self):
-        """Update preview data for the rich text editor with first instance data based on active tab"""
+    def _schedule_preview_update(self):
+        """Refresh the editor preview once pending changes settle"""
+        self._preview_timer.start()
+
+    def _update_preview_data(self, excel_first_row=None):
+        """Update preview data for the rich text editor with first instance data based on active tab
+
+        excel_first_row: first filtered row when the caller has already computed it
+        """
+        self._preview_timer.stop()
         preview_data = {}
         excel_columns = []
         
@@ -1078,10 +1478,14 @@ class MailerApp(QWidget):
             
             if current_tab == 0:  # Excel tab
                 if self.df is not None and not self.df.empty:
-                    filtered_df = self.get_filtered_df()
-                    if filtered_df is not None and not filtered_df.empty:
+                    first_row = excel_first_row
+                    if first_row is None:
+                        try:
+                            first_row = self.filter_engine.first_row(self._active_filters(), self._filter_expression())
+                        except (FilterSyntaxError, KeyError):
+                            first_row = self.filter_engine.first_row(self._active_filters())
+                    if first_row is not None:
                         # Use first row of filtered data
-                        first_row = filtered_df.iloc[0]
                         for col in first_row.index:
                             # Handle different data types properly
                             val = first_row[col]
@@ -1115,9 +1519,6 @@ class MailerApp(QWidget):
                     # Use first group recipient
                     first_recipient = self.selected_group_recipients[0]
                     
-                    # Debug: Print the first recipient to see its structure
-                    print(f"[DEBUG] First recipient data: {first_recipient}")
-                    
                     # Directly map the fields without using field mapper for now
                     if first_recipient.get('type') == 'group':
                         # Group email address - use direct field names
@@ -1130,6 +1531,7 @@ class MailerApp(QWidget):
                         })
                     else:
                         # Individual member - use direct field names
+                        preview_data.update(first_recipient.get('fields', {}))
                         preview_data.update({
                             '姓名': first_recipient.get('name', ''),
                             '邮箱': first_recipient.get('email', ''),
@@ -1168,6 +1570,8 @@ class MailerApp(QWidget):
             else:  # Group tab
                 # Show common group and member variables
                 group_vars = ['姓名', '邮箱', '群组名称', '群组描述', '群组邮箱', '成员类型', '部门', '职位']
+                # Plus any extra member fields configured in the field mapping
+                group_vars += [v for v in self.field_mapper.get_template_variables_for_source("members") if v not in group_vars]
                 # print(f"[DEBUG] Group tab - updating dropdown with variables: {group_vars}")
                 self.body_editor.update_variable_dropdown(group_vars)
                 # Also update external toolbar if it exists
@@ -1207,7 +1611,7 @@ class MailerApp(QWidget):
             
         elif current_tab == 1:  # Group tab
             # Check if we have member checkboxes (individual member mode)
-            if hasattr(self, 'member_checkboxes') and self.member_checkboxes:
+            if self.member_model.rowCount():
                 selected_members = self.get_selected_group_members()
                 expert_names = [recipient['name'] for recipient in selected_members if recipient.get('name')]
             elif hasattr(self, 'selected_group_recipients') and self.selected_group_recipients:
@@ -0,0 +1,203 @@
+from typing import Dict, List
+
+from PySide6.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Signal
+
+
+class MemberListModel(QAbstractListModel):
+    """可勾选的群组成员列表模型，配合 QListView 只绘制可见行
+
+    勾选状态保存在与成员列表等长的 bytearray 中，已选数量随每次变更增减，
+    统计和全选/全不选都不需要逐个控件扫描，几万名成员也能立即显示。
+    """
+
+    # (checked, total)
+    selection_changed = Signal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._members: List[Dict] = []
+        self._checked = bytearray()
+        self._checked_count = 0
+
+    def set_members(self, members, checked=True):
+        self.beginResetModel()
+        self._members = list(members)
+        self._checked = bytearray([int(checked)]) * len(self._members)
+        self._checked_count = len(self._members) if checked else 0
+        self.endResetModel()
+        self.selection_changed.emit(self._checked_count, len(self._members))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._members)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        member = self._members[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{member.get('name', '未知姓名')} ({member.get('email', '未知邮箱')})"
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if self._checked[index.row()] else Qt.Unchecked
+        if role == Qt.ToolTipRole:
+            return member.get('group_name') or None
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        # Views pass the check state either as the enum or as its int value
+        checked = int(value in (Qt.Checked, Qt.Checked.value))
+        row = index.row()
+        if self._checked[row] == checked:
+            return True
+        self._checked[row] = checked
+        self._checked_count += 1 if checked else -1
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        self.selection_changed.emit(self._checked_count, len(self._members))
+        return True
+
+    def set_all_checked(self, checked):
+        """全选或全不选，只发出一次 dataChanged"""
+        if not self._members:
+            return
+        self._checked = bytearray([int(checked)]) * len(self._members)
+        self._checked_count = len(self._members) if checked else 0
+        self.dataChanged.emit(self.index(0), self.index(len(self._members) - 1), [Qt.CheckStateRole])
+        self.selection_changed.emit(self._checked_count, len(self._members))
+
+    def set_rows_checked(self, rows, checked):
+        """批量设置若干行 (例如列表中选中的多行) 的勾选状态"""
+        value = int(checked)
+        changed = [row for row in rows if self._checked[row] != value]
+        if not changed:
+            return
+        for row in changed:
+            self._checked[row] = value
+        self._checked_count += len(changed) if checked else -len(changed)
+        self.dataChanged.emit(self.index(min(changed)), self.index(max(changed)), [Qt.CheckStateRole])
+        self.selection_changed.emit(self._checked_count, len(self._members))
+
+    def checked_count(self) -> int:
+        return self._checked_count
+
+    def selected_members(self) -> List[Dict]:
+        return [member for member, checked in zip(self._members, self._checked) if checked]
+
+
+class GroupTableModel(QAbstractTableModel):
+    """群组选择表格模型：勾选、名称、邮箱、成员数
+
+    勾选状态是群组 id 的集合，成员数按群组 id 单独更新；另外为每个群组预先生成
+    小写的搜索键 (名称 / 邮箱 / 别名)，供 GroupFilterProxyModel 边输入边筛选。
+    """
+
+    HEADERS = ["选择", "群组名称", "群组邮箱", "成员数"]
+    COUNT_COLUMN = 3
+
+    def __init__(self, groups, parent=None):
+        super().__init__(parent)
+        self._groups = list(groups)
+        self._rows = {group['id']: i for i, group in enumerate(self._groups)}
+        self._search_keys = [
+            "\n".join(str(group.get(field) or '') for field in ('displayName', 'mail', 'mailNickname')).lower()
+            for group in self._groups
+        ]
+        self._checked = set()
+        self._count_text: Dict[str, str] = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._groups)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        group = self._groups[index.row()]
+        column = index.column()
+        if column == 0:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if group['id'] in self._checked else Qt.Unchecked
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            if column == 1:
+                return group['displayName']
+            if column == 2:
+                return group.get('mail') or ''
+            return self._count_text.get(group['id'], '')
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        return flags | Qt.ItemIsUserCheckable if index.column() == 0 else flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid() or index.column() != 0:
+            return False
+        group_id = self._groups[index.row()]['id']
+        if value in (Qt.Checked, Qt.Checked.value):
+            self._checked.add(group_id)
+        else:
+            self._checked.discard(group_id)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def group(self, row) -> Dict:
+        return self._groups[row]
+
+    def row_of(self, group_id) -> int:
+        return self._rows.get(group_id, -1)
+
+    def search_key(self, row) -> str:
+        return self._search_keys[row]
+
+    def set_checked_ids(self, group_ids):
+        self._checked = {group_id for group_id in group_ids if group_id in self._rows}
+        if self._groups:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self._groups) - 1, 0), [Qt.CheckStateRole])
+
+    def checked_groups(self) -> List[Dict]:
+        """已勾选的群组，保持列表顺序"""
+        return [group for group in self._groups if group['id'] in self._checked]
+
+    def set_member_count(self, group_id, text):
+        row = self._rows.get(group_id)
+        if row is None or self._count_text.get(group_id) == text:
+            return
+        self._count_text[group_id] = text
+        index = self.index(row, self.COUNT_COLUMN)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+
+class GroupFilterProxyModel(QSortFilterProxyModel):
+    """按空格分隔的关键词筛选群组，每个关键词都须出现在名称、邮箱或别名中"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._terms = []
+
+    def set_query(self, text):
+        terms = text.lower().split()
+        if terms == self._terms:
+            return
+        self._terms = terms
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self._terms:
+            return True
+        key = self.sourceModel().search_key(source_row)
+        return all(term in key for term in self._terms)
@@ -0,0 +1,33 @@
+from PySide6.QtCore import QThread
+
+# Worker threads that were let go while still running. They are referenced here, not by the
+# window that started them, so neither the QThread nor its worker is destroyed mid-run even
+# if that window is closed first.
+_detached = []
+
+
+def detach_thread(thread: QThread, worker=None):
+    """放开仍在运行的工作线程，不在界面线程上等待它结束
+
+    调用前应先让 worker 停止 (例如 worker.cancel())；线程退出后再释放线程和 worker。
+    worker 在此之前发出、尚未处理的信号仍会送达，接收方需自行判断是否采用。
+    """
+    if thread is None:
+        if worker is not None:
+            worker.deleteLater()
+        return
+    entry = (thread, worker)
+    _detached.append(entry)
+    thread.finished.connect(lambda: _release(entry))
+    thread.quit()
+
+
+def _release(entry):
+    thread, worker = entry
+    # finished has already been emitted, so this returns at once
+    thread.wait()
+    if entry in _detached:
+        _detached.remove(entry)
+    if worker is not None:
+        worker.deleteLater()
+    thread.deleteLater()
@@ -1,26 +1,53 @@
 import os
+import re
 import sys
 import json
+import html as html_lib
 from PySide6.QtWidgets import QWidget, QVBoxLayout
-from PySide6.QtCore import QUrl, Signal, QObject, Slot, QTimer, QEventLoop, Qt, QSize
+from PySide6.QtCore import QUrl, Signal, QObject, Slot, QTimer, Qt, QSize, QEventLoop
 from PySide6.QtWebEngineWidgets import QWebEngineView
 from PySide6.QtWebChannel import QWebChannel
 
 
 class PyBridge(QObject):
-    contentChangedSignal = Signal(str)
+    # version, html, plain text
+    contentChangedSignal = Signal(int, str, str)
     
-    @Slot(str)
-    def contentChanged(self, content):
-        self.contentChangedSignal.emit(content)
+    def __init__(self):
+        super().__init__()
+        # Version of the cached content; a reloaded page continues from here
+        self.version = 0
+    
+    @Slot(result=int)
+    def currentVersion(self):
+        return self.version
+    
+    @Slot(int, str, str)
+    def contentChanged(self, version, html, text):
+        self.contentChangedSignal.emit(version, html, text)
+
+
+def _html_to_text(html):
+    """Plain text of HTML set from Python, until the page reports its own rendering"""
+    text = re.sub(r"<br\s*/?>|</p>|</div>", "\n", html, flags=re.IGNORECASE)
+    return html_lib.unescape(re.sub(r"<[^>]+>", "", text))
 
 
 class TinyMCEEditor(QWidget):
     def __init__(self, parent=None, external_toolbar=False):
         super().__init__(parent)
         self._external_toolbar = external_toolbar
-        self.setup_ui()
+        # Authoritative copy of the template, pushed by the page on every (debounced) change
         self._content = ""
+        self._text = ""
+        # What the page currently holds, so unchanged preview data, variables and theme are not resent
+        self._preview_data = {}
+        self._variables = []
+        self._sent_preview = None
+        self._sent_variables = None
+        self._applied_theme = None
+        self._page_ready = False
+        self.setup_ui()
         self._theme = "Light"
     
     def sizeHint(self):
@@ -54,6 +81,7 @@ class TinyMCEEditor(QWidget):
         
         # Connect signal
         self.bridge.contentChangedSignal.connect(self.on_content_changed)
+        self.web_view.loadFinished.connect(self._on_load_finished)
         
         # Create placeholder content initially
         self._editor_loaded = False
@@ -101,8 +129,24 @@ class TinyMCEEditor(QWidget):
         else:
             print(f"Error: TinyMCE editor template not found at {html_path}")
     
-    def on_content_changed(self, content):
-        self._content = content
+    def _on_load_finished(self, ok):
+        # The placeholder page is not the editor; only the local template counts
+        if not ok or not self.web_view.url().isLocalFile():
+            return
+        # A freshly loaded page has none of the state sent to the previous one
+        self._page_ready = True
+        self._sent_preview = self._sent_variables = self._applied_theme = None
+        self._apply_theme()
+        self._push_variables()
+        self._push_preview_data()
+    
+    def on_content_changed(self, version, html, text):
+        # Pushes older than content set from Python (or already applied) are stale
+        if version <= self.bridge.version:
+            return
+        self.bridge.version = version
+        self._content = html
+        self._text = text
     
     def focus_editor(self):
         # Focus the web view first
@@ -124,49 +168,47 @@ class TinyMCEEditor(QWidget):
         # This is handled in the HTML template
         pass
     
-    def toHtml(self):
-        # Get content synchronously using event loop
+    def flush_content(self, timeout_ms=2000) -> bool:
+        """Bring the cached template up to date with the page before it is used for sending
+
+        The page pushes edits after a short debounce or on blur, and blur does not fire when
+        the clicked button takes no focus (macOS). This asks the page for its current content
+        and waits for the answer; returns False if the page did not answer in time.
+        """
+        if not self._page_ready:
+            return True
         loop = QEventLoop()
-        result = {'content': ''}
-        
-        def callback(content):
-            result['content'] = content if content else ''
+        answered = []
+
+        def on_result(result):
+            if result:
+                self.on_content_changed(int(result[0]), result[1], result[2])
+            answered.append(True)
             loop.quit()
-        
-        self.web_view.page().runJavaScript("getContent()", callback)
-        
-        # Set a timeout to prevent infinite waiting
-        QTimer.singleShot(1000, loop.quit)
-        loop.exec()
-        
-        return result['content']
+
+        self.web_view.page().runJavaScript("typeof flushContent === 'function' ? flushContent() : null", on_result)
+        if not answered:
+            QTimer.singleShot(timeout_ms, loop.quit)
+            loop.exec()
+        return bool(answered)
+    
+    def toHtml(self):
+        """Current template HTML from the cached copy; never waits on the page (see flush_content)"""
+        return self._content
     
     def toPlainText(self):
-        # Get plain text synchronously using event loop
-        loop = QEventLoop()
-        result = {'text': ''}
-        
-        def callback(text):
-            result['text'] = text if text else ''
-            loop.quit()
-        
-        self.web_view.page().runJavaScript("getPlainText()", callback)
-        
-        # Set a timeout to prevent infinite waiting
-        QTimer.singleShot(1000, loop.quit)
-        loop.exec()
-        
-        return result['text']
+        return self._text
     
     def clear(self):
-        self.web_view.page().runJavaScript("clearContent()")
-        self._content = ""
+        self.bridge.version += 1
+        self._content = self._text = ""
+        self.web_view.page().runJavaScript(f"clearContent({self.bridge.version})")
     
     def setHtml(self, html):
-        # Escape quotes in HTML
-        escaped_html = html.replace("'", "\\'").replace("\n", "\\n")
-        self.web_view.page().runJavaScript(f"setContent('{escaped_html}')")
+        self.bridge.version += 1
         self._content = html
+        self._text = _html_to_text(html)
+        self.web_view.page().runJavaScript(f"setContent({json.dumps(html, ensure_ascii=False)}, {self.bridge.version})")
     
     def setPlainText(self, text):
         # Convert plain text to HTML
@@ -190,9 +232,16 @@ class TinyMCEEditor(QWidget):
     
     def setTheme(self, theme):
         self._theme = theme
-        theme_name = 'dark' if theme == 'Dark' else 'light'
-        # Use a shorter timer to ensure the page is loaded before calling setTheme
-        QTimer.singleShot(100, lambda: self.web_view.page().runJavaScript(f"if (typeof setTheme !== 'undefined') setTheme('{theme_name}')"))
+        # Before the page has loaded, the theme is applied from _on_load_finished
+        if self._page_ready:
+            self._apply_theme()
+    
+    def _apply_theme(self):
+        if self._theme == self._applied_theme:
+            return
+        self._applied_theme = self._theme
+        theme_name = 'dark' if self._theme == 'Dark' else 'light'
+        self.web_view.page().runJavaScript(f"if (typeof setTheme !== 'undefined') setTheme('{theme_name}')")
     
     def get_content_async(self, callback):
         self.web_view.page().runJavaScript("getContent()", callback)
@@ -204,50 +253,39 @@ class TinyMCEEditor(QWidget):
         """Update the variable dropdown with Excel columns"""
         if excel_columns is None:
             excel_columns = []
+        self._variables = list(excel_columns)
+        if self._page_ready:
+            self._push_variables()
+    
+    def _push_variables(self):
+        if self._variables == self._sent_variables:
+            return
+        self._sent_variables = self._variables
         
         # Convert column list to JavaScript array string using json.dumps for proper escaping
-        columns_js = json.dumps(excel_columns, ensure_ascii=False)
+        columns_js = json.dumps(self._variables, ensure_ascii=False)
         
         script = f"if (typeof updateVariableDropdown === 'function') {{ updateVariableDropdown({columns_js}); }}"
         self.web_view.page().runJavaScript(script)
     
     def set_preview_data(self, preview_data):
-        """Set the preview data for variable substitution"""
+        """Set the preview data for variable substitution; only changed keys are sent to the page"""
         if preview_data is None:
             preview_data = {}
-        
-        # Remove debug output to clean up console
-        # print(f"[DEBUG] TinyMCE editor set_preview_data called with {len(preview_data)} variables")
-        # print(f"[DEBUG] Preview data keys: {list(preview_data.keys())}")
-        
-        # Convert preview data to JavaScript object string
         # Ensure all values are strings and handle None values
-        cleaned_data = {}
-        for key, value in preview_data.items():
-            if value is None:
-                cleaned_data[key] = ""
-            else:
-                cleaned_data[key] = str(value)
-        
-        data_js = json.dumps(cleaned_data, ensure_ascii=False)
-        
-        # Create the script that will set the preview data
-        script = f"""
-        if (typeof setPreviewData === 'function') {{
-            setPreviewData({data_js});
-            console.log('Preview data updated with ' + Object.keys({data_js}).length + ' variables');
-        }} else {{
-            // If function doesn't exist yet, wait and retry
-            setTimeout(function() {{
-                if (typeof setPreviewData === 'function') {{
-                    setPreviewData({data_js});
-                    console.log('Preview data updated with ' + Object.keys({data_js}).length + ' variables (delayed)');
-                }} else {{
-                    console.warn('setPreviewData function still not available');
-                }}
-            }}, 500);
-        }}
-        """
-        
-        # Execute immediately - the script has its own retry logic
-        self.web_view.page().runJavaScript(script)
\ No newline at end of file
+        self._preview_data = {key: "" if value is None else str(value) for key, value in preview_data.items()}
+        if self._page_ready:
+            self._push_preview_data()
+    
+    def _push_preview_data(self):
+        if self._sent_preview is None:
+            script = f"if (typeof setPreviewData === 'function') {{ setPreviewData({json.dumps(self._preview_data, ensure_ascii=False)}); }}"
+        else:
+            changed = {key: value for key, value in self._preview_data.items() if self._sent_preview.get(key) != value}
+            removed = [key for key in self._sent_preview if key not in self._preview_data]
+            if not changed and not removed:
+                return
+            script = (f"if (typeof updatePreviewData === 'function') {{ updatePreviewData("
+                      f"{json.dumps(changed, ensure_ascii=False)}, {json.dumps(removed, ensure_ascii=False)}); }}")
+        self._sent_preview = dict(self._preview_data)
+        self.web_view.page().runJavaScript(script)
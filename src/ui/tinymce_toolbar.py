@@ -396,6 +396,11 @@ class TinyMCEToolbar(QWidget):
             
     def update_variable_dropdown(self, excel_columns=None):
         """Update variable dropdown with Excel columns"""
+        columns = list(excel_columns or [])
+        # Preview refreshes pass the same columns over and over; rebuild only on change
+        if columns == getattr(self, '_excel_columns', None):
+            return
+        self._excel_columns = columns
         # Clear existing Excel items
         for i in range(self.variable_combo.count() - 1, 12, -1):  # Remove items after the standard ones
             self.variable_combo.removeItem(i)
@@ -0,0 +1,59 @@
+import pandas as pd
+
+from src.data.address_validation import (
+    REASON_DUPLICATE, REASON_EMPTY, REASON_INVALID, prepare_recipients
+)
+
+
+def _prepare(emails, **extra):
+    df = pd.DataFrame({"姓名": [f"n{i}" for i in range(len(emails))], "邮箱": emails, **extra})
+    return prepare_recipients(df, "邮箱")
+
+
+def test_valid_addresses_pass_through_in_order():
+    clean, rejects = _prepare(["a@example.com", "b.c@example.org"])
+    assert clean["邮箱"].tolist() == ["a@example.com", "b.c@example.org"]
+    assert clean["姓名"].tolist() == ["n0", "n1"]
+    assert rejects.empty
+
+
+def test_whitespace_is_stripped_and_domain_lowercased():
+    clean, _ = _prepare(["  Alice@Example.COM "])
+    # The local part is kept as entered
+    assert clean["邮箱"].tolist() == ["Alice@example.com"]
+
+
+def test_duplicates_are_detected_case_insensitively():
+    clean, rejects = _prepare(["Bob@example.com", "bob@EXAMPLE.com", "BOB@example.com"])
+    assert clean["邮箱"].tolist() == ["Bob@example.com"]
+    assert rejects["原因"].tolist() == [REASON_DUPLICATE, REASON_DUPLICATE]
+    assert rejects["行号"].tolist() == [2, 3]
+
+
+def test_cells_with_several_addresses_are_split():
+    clean, rejects = _prepare(["a@example.com; b@example.com，c@example.com", "d@example.com"])
+    assert clean["邮箱"].tolist() == ["a@example.com", "b@example.com", "c@example.com", "d@example.com"]
+    # Other columns are copied to every address of the cell
+    assert clean["姓名"].tolist() == ["n0", "n0", "n0", "n1"]
+    assert rejects.empty
+
+
+def test_empty_and_invalid_values_are_rejected_with_row_numbers():
+    clean, rejects = _prepare(["", None, "not-an-email", "x@localhost", "ok@example.com"])
+    assert clean["邮箱"].tolist() == ["ok@example.com"]
+    assert rejects["行号"].tolist() == [1, 2, 3, 4]
+    assert rejects["原因"].tolist() == [REASON_EMPTY, REASON_EMPTY, REASON_INVALID, REASON_INVALID]
+    assert rejects.loc[2, "原始值"] == "not-an-email"
+
+
+def test_invalid_address_does_not_count_as_first_occurrence():
+    clean, rejects = _prepare(["bad@@example.com", "good@example.com", "GOOD@example.com"])
+    assert clean["邮箱"].tolist() == ["good@example.com"]
+    assert rejects["原因"].tolist() == [REASON_INVALID, REASON_DUPLICATE]
+
+
+def test_display_name_entries_keep_only_the_address():
+    clean, rejects = _prepare(["张三 <zs@example.com>", "Zhang San <ZS2@Example.com>; Li Si <ls@example.com>"])
+    assert clean["邮箱"].tolist() == ["zs@example.com", "ZS2@example.com", "ls@example.com"]
+    assert clean["姓名"].tolist() == ["n0", "n1", "n1"]
+    assert rejects.empty
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from src.data.filter_engine import ColumnIndex, FilterEngine
+from src.data.filter_expr import compile_filter
+
+
+def _frame():
+    return pd.DataFrame({
+        "姓名": ["张三", "李四", "王五", "Zhang Wei", "赵六"],
+        "部门": ["销售一部", "研发", "销售二部", "Sales", ""],
+        "城市": ["北京", "上海", "北京", "Beijing", "深圳"],
+    })
+
+
+def test_contains_is_case_insensitive():
+    engine = FilterEngine(_frame())
+    assert engine.count([("部门", "SALES")]) == 1
+    assert engine.count([("姓名", "zhang")]) == 1
+
+
+def test_conditions_are_combined_with_and():
+    engine = FilterEngine(_frame())
+    assert engine.count([("部门", "销售"), ("城市", "北京")]) == 2
+    assert engine.count([("部门", "销售"), ("城市", "上海")]) == 0
+
+
+def test_no_effective_condition_matches_everything():
+    df = _frame()
+    engine = FilterEngine(df)
+    assert engine.mask([("部门", ""), ("不存在的列", "x")]) is None
+    assert engine.count([]) == len(df)
+    assert engine.filter([]) is df
+
+
+def test_incremental_typing_matches_full_scan():
+    df = pd.DataFrame({"名称": [f"item-{i % 37}-{i % 5}" for i in range(500)]})
+    engine = FilterEngine(df)
+    # Each keystroke narrows the previous result; the counts must equal a fresh scan
+    for needle in ["i", "it", "ite", "item-1", "item-12", "item-12-", "item-12-3"]:
+        expected = int(df["名称"].str.contains(needle, regex=False).sum())
+        assert engine.count([("名称", needle)]) == expected
+
+
+def test_narrowing_after_backspace():
+    index = ColumnIndex(pd.Series(["abc", "abd", "xyz", "ab"]))
+    assert index.mask("abc").tolist() == [True, False, False, False]
+    assert index.mask("ab").tolist() == [True, True, False, True]
+
+
+def test_missing_values_never_match():
+    index = ColumnIndex(pd.Series(["a", None, np.nan, "ba"]))
+    assert index.mask("a").tolist() == [True, False, False, True]
+
+
+def test_summary_returns_count_and_first_row():
+    engine = FilterEngine(_frame())
+    count, first = engine.summary([("城市", "北京")])
+    assert count == 2
+    assert first["姓名"] == "张三"
+    count, first = engine.summary([("城市", "广州")])
+    assert count == 0 and first is None
+
+
+def test_expression_is_combined_with_conditions():
+    engine = FilterEngine(_frame())
+    expression = compile_filter('城市 in ("北京", "上海")')
+    assert engine.count([], expression) == 3
+    assert engine.count([("部门", "销售")], expression) == 2
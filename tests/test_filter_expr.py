@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from src.data.filter_expr import FilterSyntaxError, apply_filter, compile_filter
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "部门": ["销售", "研发", "销售", "市场", "Sales"],
+        "年龄": ["30", "25", "41", "30.0", ""],
+        "城市": ["北京", "上海", "广州", "北京", "Beijing"],
+        "入职日期": ["2023-01-05", "2023/1/5", "2023-01-05 09:30", "2023-03-01", "未知"],
+        "所在 部门": ["A", "B", "A", "C", "B"],
+    })
+
+
+def _rows(df, text):
+    return compile_filter(text).mask(df).nonzero()[0].tolist()
+
+
+def test_equality_is_case_insensitive_and_numeric(df):
+    assert _rows(df, "部门 = sales") == [4]
+    # 30 and 30.0 are the same number
+    assert _rows(df, "年龄 = 30") == [0, 3]
+    assert _rows(df, "年龄 != 30") == [1, 2, 4]
+
+
+def test_boolean_operators_and_precedence(df):
+    assert _rows(df, "部门 = 销售 and (年龄 >= 40 or 城市 = 北京)") == [0, 2]
+    assert _rows(df, "not 城市 = 北京 && 年龄 < 30") == [1]
+    assert _rows(df, "部门 = 市场 或 部门 = 研发") == [1, 3]
+
+
+def test_in_contains_regex_and_between(df):
+    assert _rows(df, '城市 in ("北京", "上海")') == [0, 1, 3]
+    assert _rows(df, "城市 not in (北京)") == [1, 2, 4]
+    assert _rows(df, "城市 contains jing") == [4]
+    assert _rows(df, "部门 ~ '^(?:销|市)'") == [0, 2, 3]
+    assert _rows(df, "年龄 between 25 and 30") == [0, 1, 3]
+
+
+def test_date_equality_matches_other_formats_and_times(df):
+    assert _rows(df, "入职日期 = 2023-01-05") == [0, 1, 2]
+    assert _rows(df, "入职日期 != 2023-01-05") == [3, 4]
+    assert _rows(df, '入职日期 = "2023-01-05 09:30"') == [2]
+
+
+def test_date_membership_and_ranges(df):
+    assert _rows(df, "入职日期 in (2023/01/05, 2023-03-01)") == [0, 1, 2, 3]
+    assert _rows(df, "入职日期 > 2023-01-05") == [3]
+    # A plain end date includes the whole day
+    assert _rows(df, "入职日期 between 2023-01-01 and 2023-01-05") == [0, 1, 2]
+
+
+def test_quoted_column_names(df):
+    assert _rows(df, "[所在 部门] = a") == [0, 2]
+    assert _rows(df, "`所在 部门` = b") == [1, 4]
+
+
+def test_apply_filter_returns_matching_rows(df):
+    result = apply_filter(df, "城市 = 北京")
+    assert result["部门"].tolist() == ["销售", "市场"]
+
+
+def test_missing_column_is_reported(df):
+    expression = compile_filter("职位 = 经理")
+    assert expression.missing_columns(df) == ["职位"]
+    with pytest.raises(KeyError):
+        expression.mask(df)
+
+
+@pytest.mark.parametrize("text", ["", "部门 =", "部门 = (销售", "部门 销售", "部门 ~ '('", "城市 in 北京"])
+def test_syntax_errors(text):
+    with pytest.raises(FilterSyntaxError):
+        compile_filter(text)
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from src.data.recipient_sets import (
+    OP_EXCLUDE, OP_INTERSECT, OP_UNION, RecipientSet, combine, load_address_list
+)
+
+
+def _set(*emails):
+    return RecipientSet.from_records({"name": e.split("@")[0], "email": e} for e in emails)
+
+
+def _emails(recipient_set):
+    return [record["email"] for record in recipient_set]
+
+
+def test_addresses_are_deduplicated_case_insensitively():
+    recipients = _set("Ann@example.com", " ann@EXAMPLE.com ", "bob@example.com")
+    assert len(recipients) == 2
+    # The first record for an address is kept
+    assert _emails(recipients) == ["Ann@example.com", "bob@example.com"]
+    assert "ANN@example.com" in recipients
+
+
+def test_set_operations_keep_left_order():
+    left = _set("c@x.com", "a@x.com", "b@x.com")
+    right = _set("B@x.com", "d@x.com")
+    assert _emails(left | right) == ["c@x.com", "a@x.com", "b@x.com", "d@x.com"]
+    assert _emails(left & right) == ["b@x.com"]
+    assert _emails(left - right) == ["c@x.com", "a@x.com"]
+
+
+def test_combine_applies_steps_in_order():
+    group_a = _set("a@x.com", "b@x.com", "c@x.com")
+    sheet = _set("d@x.com")
+    blocked = _set("B@X.COM")
+    # The operator of the first step is ignored
+    result = combine([(OP_EXCLUDE, group_a), (OP_UNION, sheet), (OP_EXCLUDE, blocked)])
+    assert _emails(result) == ["a@x.com", "c@x.com", "d@x.com"]
+    assert _emails(combine([(OP_UNION, group_a), (OP_INTERSECT, _set("c@x.com", "z@x.com"))])) == ["c@x.com"]
+
+
+def test_combine_rejects_unknown_operation():
+    with pytest.raises(ValueError):
+        combine([(OP_UNION, _set("a@x.com")), ("未知", _set("b@x.com"))])
+
+
+def test_from_frame_skips_empty_and_duplicate_addresses():
+    df = pd.DataFrame({"姓名": ["甲", "乙", "丙", "丁"], "邮箱": ["A@x.com", "", "a@X.com", "d@x.com"]})
+    recipients = RecipientSet.from_frame(df, "邮箱", "姓名", "名单")
+    records = recipients.records()
+    assert [r["email"] for r in records] == ["A@x.com", "d@x.com"]
+    assert [r["name"] for r in records] == ["甲", "丁"]
+    assert records[0]["fields"] == {"姓名": "甲", "邮箱": "A@x.com"}
+    assert records[0]["group_name"] == "名单"
+
+
+def test_load_plain_text_address_list(tmp_path):
+    path = tmp_path / "blocked.txt"
+    path.write_text("# 屏蔽名单\nA@x.com\n\n a@x.com \nb@x.com\n", encoding="utf-8")
+    recipients = load_address_list(str(path))
+    assert _emails(recipients) == ["A@x.com", "b@x.com"]
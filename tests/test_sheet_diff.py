@@ -0,0 +1,51 @@
+import pandas as pd
+
+from src.data.sheet_diff import diff_frames
+
+
+def _frame(*emails):
+    return pd.DataFrame({"邮箱": list(emails), "姓名": [e.split("@")[0] for e in emails]})
+
+
+def test_identical_frames():
+    old = _frame("a@x.com", "b@x.com")
+    diff = diff_frames(old, old.copy())
+    assert diff.identical and diff.unchanged
+    assert diff.summary() == "无变化"
+
+
+def test_added_removed_and_modified_rows():
+    old = _frame("a@x.com", "b@x.com", "c@x.com")
+    new = _frame("a@x.com", "B@x.com", "c@x.com", "d@x.com")
+    diff = diff_frames(old, new)
+    assert diff.modified == [1]
+    assert diff.added == [3]
+    assert diff.removed == []
+    assert diff.summary() == "新增 1 行，修改 1 行"
+
+
+def test_removed_row_shifts_positions_without_counting_modifications():
+    old = _frame("a@x.com", "b@x.com", "c@x.com")
+    new = _frame("a@x.com", "c@x.com")
+    diff = diff_frames(old, new)
+    assert (diff.added, diff.removed, diff.modified) == ([], [1], [])
+
+
+def test_duplicate_rows_are_counted_individually():
+    old = _frame("a@x.com", "a@x.com", "b@x.com")
+    new = _frame("a@x.com", "b@x.com")
+    diff = diff_frames(old, new)
+    assert len(diff.removed) == 1 and not diff.added and not diff.modified
+
+
+def test_reordered_rows_are_unchanged_but_not_identical():
+    old = _frame("a@x.com", "b@x.com")
+    diff = diff_frames(old, old.iloc[::-1].reset_index(drop=True))
+    assert diff.unchanged and not diff.identical
+
+
+def test_column_change():
+    old = _frame("a@x.com")
+    diff = diff_frames(old, old.rename(columns={"姓名": "名字"}))
+    assert diff.columns_changed
+    assert diff.summary() == "列结构已变化"